@@ -1,5 +1,9 @@
 import os
+import io
+import json
 import argparse
+from contextlib import redirect_stdout
+from functools import lru_cache, partial
 from jinja2 import Environment, FileSystemLoader
 from weasyprint import HTML
 from weasyprint import CSS
@@ -15,84 +19,772 @@ from section import (
     HeaderSection,
 )
 
-from tables import Table
+from run_context import RunContext, ConnectionPool
+from backends import RecordingSource, SharedSource
+from query_log import QueryLog
+from output_profile import PROFILES, DEFAULT_PROFILE, get_profile, is_interactive
+from baseline import BaselineStore
+from server import serve
+from context_cache import ContextCache
+from diff import diff_releases
+from mart import build_mart, export_parquet
+from export import TableExport, EXPORT_FORMATS
+from fallback import FileFallback
+from validate import compile_schema, check_inputs, get_problems
 
 # Report class outlines the structure and order or a report
 class Report:
-    def __init__(self, project, release):
+    def __init__(self, run):
+        self.run = run  # the report run, passed to every section and table
         self.context = {"sections":{}, "header": {}} #context to be passed to jinja2 templating
-        self.header = HeaderSection(project, release) 
-        self.sections = [ #sections will appear in the following order in the report
-            CasesSection(),
-            RawSeqDataSection(),
-            CallReadyAlignmentsSection(),
-            Mutect2Section(),
-            SequenzaSection(),
-            DellySection(),
-            RSEMSection(),
-            StarFusionSection(),
-        ]
-
-    def load_context(self):
+        self.header = HeaderSection(run) 
+        self.sections = self.select([ #sections will appear in the following order in the report
+            CasesSection(run),
+            RawSeqDataSection(run),
+            CallReadyAlignmentsSection(run),
+            Mutect2Section(run),
+            SequenzaSection(run),
+            DellySection(run),
+            RSEMSection(run),
+            StarFusionSection(run),
+        ])
+
+    def select(self, sections):
+        """
+        (list[Section]) -> list[Section]
+    
+        Get the sections, and tables within them, selected for the run. Sections left
+        with no selected table are dropped, so they do not query data or render
+
+        Parameters
+        ----------
+        - sections (list[Section]): every section of the report, in order
+        """
+        section_names = [section.name for section in sections]
+        table_names = [type(table).__name__ for section in sections for table in section.tables]
+        for name in (self.run.sections or []) + self.run.skip_sections:
+            if name not in section_names:
+                raise Exception(f"Unknown section {name}, expected one of {', '.join(section_names)}")
+        for name in self.run.tables or []:
+            if name not in table_names:
+                raise Exception(f"Unknown table {name}, expected one of {', '.join(table_names)}")
+
+        selected = []
+        for section in sections:
+            if self.run.sections and section.name not in self.run.sections:
+                continue
+            if section.name in self.run.skip_sections:
+                continue
+            if self.run.tables:
+                section.tables = [
+                    table for table in section.tables if type(table).__name__ in self.run.tables
+                ]
+            if section.tables:
+                selected.append(section)
+        return selected
+
+    def get_snapshots(self):
+        """
+        None -> list[tuple]
+    
+        Get the snapshot of each database the tables of the report read from, as read
+        from the data source of the run
+        """
+        snapshots = []
+        for section in self.sections:
+            for table in section.tables:
+                source_db = getattr(table, "source_db", "")
+                for db in (source_db if isinstance(source_db, list) else [source_db]):
+                    snapshot = self.run.source.get_snapshot(db) if db else None
+                    if snapshot and snapshot not in snapshots:
+                        snapshots.append(snapshot)
+        return snapshots
+
+    def load_data(self):
+        """
+        None -> dict
+    
+        Get the data of each section without rendering any plots
+        """
+        return {
+            section.name: section.load_data() for section in self.sections
+        }
+
+    def merge_data(self, partials):
+        """
+        (list[dict]) -> dict
+    
+        Combine the data of each section loaded for several shards of the cases
+
+        Parameters
+        ----------
+        - partials (list[dict]): data returned by load_data for each shard
         """
-        None -> None
+        return {
+            section.name: section.merge_data([partial[section.name] for partial in partials])
+            for section in self.sections
+        }
+
+    def load_context(self, data=None, baseline=None):
+        """
+        (dict, BaselineStore) -> None
     
         Get the data and load it into a context dict for jinja2 to generate html
+
+        Parameters
+        ----------
+        - data (dict): data of each section, as returned by load_data or merge_data.
+                       Loaded from the tables if not given
+        - baseline (BaselineStore): store of the previous releases, overlaid on tables and plots
         """
         self.context["header"] = self.header.load_context()
         for section in self.sections:
-            self.context["sections"][section.name] = section.load_context()
+            self.context["sections"][section.name] = section.load_context(
+                data[section.name] if data else None,
+                baseline
+            )
+
+@lru_cache(maxsize=None)
+def get_template(name="base.html"):
+    """
+    (str) -> jinja2.Template
+    
+    Returns the compiled template name. Compiled once per process
+
+    Parameters
+    ----------
+    - name (str): name of the template in the templates directory
+    """
+    template_dir = os.path.join(os.path.dirname(__file__), './templates')
+    environment = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+    return environment.get_template(name)
+
+
+@lru_cache(maxsize=None)
+def get_stylesheet():
+    """
+    None -> CSS
+    
+    Returns the parsed report stylesheet. Parsed once per process
+    """
+    css_file = os.path.join(os.path.dirname(__file__), './static/css/style.css')
+    return CSS(css_file)
+
 
-def makepdf(html, outputfile):
+def makepdf(html, outputfile=None):
     """
-    (str) -> None
+    (str, str) -> bytes
     
     Generates a PDF file from a string of HTML
    
     Parameters
     ----------
     - html (str) String of formated HTML
-    - outputfile (str): Name of the output PDF file
+    - outputfile (str): Name of the output PDF file. If not given, the PDF is returned as bytes
     """
+    htmldoc = HTML(string=html, base_url=__file__)
+    return htmldoc.write_pdf(outputfile, stylesheets=[get_stylesheet()], presentational_hints=True)
 
-    css_file = os.path.join(os.path.dirname(__file__), './static/css/style.css')
+
+def render_html(report):
+    """
+    (Report) -> str
     
-    htmldoc = HTML(string=html, base_url=__file__)
-    htmldoc.write_pdf(outputfile, stylesheets=[CSS(css_file)], presentational_hints=True)
+    Renders the loaded context of report into HTML
+      
+    Parameters
+    ----------
+    - report (Report): report whose context has been loaded
+    """
+    # used to debug issues with context
+    # with open('ar_context.json', 'w', encoding='utf-8') as file:
+    #     json.dump(report.context, file, ensure_ascii=False, indent=4)
+    return get_template().render(report.context)
+
+
+def get_report_name(profile, name="Analysis_Report"):
+    """
+    (str, str) -> str
+    
+    Returns the default file name of a report: HTML for the interactive profile, PDF otherwise
+      
+    Parameters
+    ----------
+    - profile (str): output profile of the report. Defaults to standard
+    - name (str): name of the report, without extension
+    """
+    return name + (".html" if is_interactive(get_profile(profile)) else ".pdf")
+
+
+def render_report(report, outfile):
+    """
+    (Report, str) -> None
+    
+    Renders the loaded context of report into outfile, as PDF or, with an interactive
+    profile, as a single HTML file whose plots are drawn in the browser
+      
+    Parameters
+    ----------
+    - report (Report): report whose context has been loaded
+    - outfile (str): name of the output file
+    """
+    html = render_html(report)
+    if is_interactive(report.run.profile):
+        with open(outfile, "w") as f:
+            f.write(html)
+    else:
+        makepdf(html, outfile)
+    print(f"Created report {outfile}")
 
 
-def generate_report(input, output, use_stage):
+def get_schema(selection=None):
     """
-    (str, str, bool) -> None
+    (dict) -> dict
+    
+    Returns what the tables selected for a report read from the input json, without reading
+    any data. Raises an exception for unknown section or table names
+      
+    Parameters
+    ----------
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext. All if not given
+    """
+    report = Report(RunContext({"project": "", "release": "", "cases": {}}, **(selection or {})))
+    return compile_schema([table for section in report.sections for table in section.tables])
+
+
+def load_inputs(inputs, selection=None):
+    """
+    (list[str], dict) -> dict
+    
+    Reads the input json files and checks them for the tables selected, before any database
+    is opened. Raises an exception listing every problem of every file if any is invalid
+      
+    Parameters
+    ----------
+    - inputs (list[str]): names of the input files
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext. All if not given
+    """
+    loaded = {}
+    for input in inputs:
+        with open(input) as f:
+            loaded[input] = json.load(f)
+    check_inputs(loaded, get_schema(selection))
+    return loaded
+
+
+def get_input_problems(input_data, selection=None):
+    """
+    (dict, dict) -> list[str]
+    
+    Returns every problem of an input json for the tables selected, as checked by the report
+    daemon before a report is queued
+      
+    Parameters
+    ----------
+    - input_data (dict): the input json
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext. All if not given
+    """
+    return get_problems(input_data, get_schema(selection))
+
+
+def generate_report(
+    input,
+    output,
+    use_stage,
+    query_log=None,
+    slow_query_ms=100.0,
+    gamma=500,
+    shard=None,
+    baseline=None,
+    plot_dir=None,
+    profile=None,
+    selection=None,
+    mart=None,
+    export=None,
+    export_formats=None,
+    lane_rollup=False,
+    fallback=None
+):
+    """
+    (str, str, bool, str, float, int, tuple, str, str, str, dict, str, str, list, bool, FileFallback) -> None
     
     Generates a report using data from input file to output file. use_stage indicates if
-    data should be pulled from production or stage
+    data should be pulled from production or stage.
+    If shard is set, only that shard of the cases is processed and its data is written to
+    output as json, to be combined into a report by merge_reports
       
     Parameters
     ----------
     - input (str): name of input file
     - output (str): name of the output PDF file
     - use_stage: set to True if using data from staging
+    - query_log (str): if set, each SQL statement run is logged to this file
+    - slow_query_ms (float): statements taking at least this long have their query plan logged
+    - gamma (int): the sequenza gamma setting whose solution is reported
+    - shard (tuple): (index, count) of the shard of cases to process, with 1 <= index <= count
+    - baseline (str): baseline store of previous releases. Its percentiles are overlaid on the
+                      report, then the release is added to it. Not used for partial reports
+    - plot_dir (str): if set, plot images are also written to this directory
+    - profile (str): output profile setting the resolution and format of images. Defaults to standard
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext. All if not given
+    - mart (str): report mart to read from instead of the QC-ETL databases, built by build_report_mart
+    - export (str): if set, the rows of every table are also written to this directory. Not used
+                    for partial reports
+    - export_formats (list[str]): formats of the exported rows (csv, jsonl, parquet). All if not given
+    - lane_rollup (bool): set to True to combine the lanes of each sample by sequencing run in the
+                          lane level tables
+    - fallback (FileFallback): computes the rows of workflow runs missing from QC-ETL from their files, if set
     """
     infile = input if input else "ar_input.json"
-    outfile = output if output else "Analysis_Report.pdf"
-    table = Table(infile, use_stage) #initializing table data
-    report = Report(table.project, table.release) #initialize report structure
+    with RunContext(
+        load_inputs([infile], selection)[infile],
+        use_stage=use_stage,
+        shard=shard,
+        gamma=gamma,
+        query_log=QueryLog(query_log, slow_query_ms) if query_log else None,
+        plot_dir=plot_dir,
+        profile=profile,
+        **(selection or {}),
+        mart=mart,
+        export=TableExport(export, export_formats) if export and not shard else None,
+        lane_rollup=lane_rollup,
+        fallback=fallback,
+    ) as run:
+        if mart:
+            check_mart(run)
+        report = Report(run) #initialize report structure
 
-    report.load_context()
+        if shard:
+            index, count = shard
+            outfile = output if output else f"Analysis_Report.shard_{index}_of_{count}.json"
+            partial = {
+                "project": run.project,
+                "release": run.release,
+                "gamma": gamma,
+                "shard": [index, count],
+                "selection": run.get_selection(),
+                "lane_rollup": lane_rollup,
+                "sections": report.load_data(),
+            }
+            with open(outfile, "w") as f:
+                json.dump(partial, f)
+            print(f"Created partial report {outfile} for shard {index} of {count}")
+        else:
+            outfile = output if output else get_report_name(profile)
+            store = BaselineStore(baseline) if baseline else None
+            report.load_context(baseline=store)
+            render_report(report, outfile)
+            if store:
+                update_baseline(store, run)
 
-    # used to debug issues with context
-    # with open('ar_context.json', 'w', encoding='utf-8') as file:
-    #     json.dump(report.context, file, ensure_ascii=False, indent=4)
+    if run.query_log:
+        print(run.query_log.write_summary())
+        run.query_log.close()
 
-    template_dir = os.path.join(os.path.dirname(__file__), './templates')
-    environment = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
-    results_template = environment.get_template("base.html")
 
-    contents = results_template.render(report.context)
+def generate_batch(
+    inputs,
+    output_dir,
+    use_stage,
+    query_log=None,
+    slow_query_ms=100.0,
+    gamma=500,
+    profile=None,
+    selection=None,
+    mart=None,
+    lane_rollup=False,
+    fallback=None
+):
+    """
+    (list[str], str, bool, str, float, int, str, dict, str, bool, FileFallback) -> None
     
-    makepdf(contents, outfile)
-    print(f"Created report {outfile}")
+    Generates the reports of several releases with one pass over the data. The requests of the
+    tables of every report are recorded first, then each source table is queried once for the
+    union of the keys of all reports, and the rows are handed back to each report
+      
+    Parameters
+    ----------
+    - inputs (list[str]): names of the input files, one per report
+    - output_dir (str): directory the reports are written to, named after their input file
+    - use_stage: set to True if using data from staging
+    - query_log (str): if set, each SQL statement run is logged to this file
+    - slow_query_ms (float): statements taking at least this long have their query plan logged
+    - gamma (int): the sequenza gamma setting whose solution is reported
+    - profile (str): output profile setting the resolution and format of images. Defaults to standard
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext. All if not given
+    - mart (str): report mart to read from instead of the QC-ETL databases, built by build_report_mart
+    - lane_rollup (bool): set to True to combine the lanes of each sample by sequencing run in the
+                          lane level tables
+    - fallback (FileFallback): computes the rows of workflow runs missing from QC-ETL from their files,
+                               if set. Only used once the rows of the batch are fetched
+    """
+    selection = selection or {}
+    loaded = load_inputs(inputs, selection)
+    output_dir = output_dir if output_dir else "."
+    os.makedirs(output_dir, exist_ok=True)
+    #run without cases holding the source shared by the reports
+    with RunContext(
+        {"project": "", "release": "", "cases": {}},
+        use_stage=use_stage,
+        gamma=gamma,
+        query_log=QueryLog(query_log, slow_query_ms) if query_log else None,
+        mart=mart,
+    ) as batch_run:
+        if mart:
+            check_mart(batch_run)
+        source = batch_run.source
+
+        #record what every report reads, without printing the missing data of the empty rows
+        recording = RecordingSource(source)
+        for input in inputs:
+            run = RunContext(loaded[input], use_stage=use_stage, gamma=gamma, source=recording, **selection)
+            with redirect_stdout(io.StringIO()):
+                Report(run).load_data()
+        shared = SharedSource(source, recording.fetch())
+        print(f"Fetched {len(recording.requests)} source tables for {len(inputs)} reports")
+
+        for input in inputs:
+            run = RunContext(
+                loaded[input],
+                use_stage=use_stage,
+                gamma=gamma,
+                profile=profile,
+                source=shared,
+                **selection,
+                lane_rollup=lane_rollup,
+                fallback=fallback,
+            )
+            report = Report(run)
+            report.load_context()
+            outfile = os.path.join(output_dir, get_report_name(profile, os.path.splitext(os.path.basename(input))[0]))
+            render_report(report, outfile)
+
+    if batch_run.query_log:
+        print(batch_run.query_log.write_summary())
+        batch_run.query_log.close()
+
+
+def build_report_mart(output, use_stage, gamma=500, format="sqlite"):
+    """
+    (str, bool, int, str) -> None
+    
+    Builds the report mart holding the columns read by every table of the report, from the
+    current QC-ETL databases. Reports read from it with --mart
+      
+    Parameters
+    ----------
+    - output (str): path of the mart, a file for sqlite or a directory for parquet
+    - use_stage (bool): set to True if using data from staging
+    - gamma (int): the sequenza gamma setting the mart is built for, recorded in the mart
+    - format (str): sqlite, or parquet to export the mart as one Parquet file per table
+    """
+    with RunContext({"project": "", "release": "", "cases": {}}, use_stage=use_stage, gamma=gamma) as run:
+        report = Report(run)
+        tables = [table for section in report.sections for table in section.tables if table.source_table]
+        if format == "parquet":
+            mart = output.rstrip("/") + ".db"
+            build_mart(tables, run.base_db_path, mart, gamma)
+            export_parquet(mart, output)
+            os.remove(mart)
+        else:
+            build_mart(tables, run.base_db_path, output, gamma)
+
+
+def check_mart(run):
+    """
+    (RunContext) -> None
+    
+    Warns if QC-ETL was refreshed since the report mart of run was built, and raises an
+    exception if the mart was built for another sequenza gamma than the one of run
+      
+    Parameters
+    ----------
+    - run (RunContext): the report run, reading from a report mart
+    """
+    mart_gamma = run.source.get_mart_gamma()
+    if mart_gamma is None:
+        print(f"Warning: the report mart {run.mart} does not record the gamma it was built for")
+    elif float(mart_gamma) != float(run.gamma):
+        raise Exception(
+            f"The report mart {run.mart} was built for gamma {mart_gamma:g}, not {run.gamma}. "
+            f"Build a mart with mart --gamma {run.gamma}"
+        )
+    for source_db in run.source.get_stale_sources(run.base_db_path):
+        print(f"Warning: {source_db} was refreshed since the report mart {run.mart} was built")
+
+
+def merge_reports(partial_files, output, baseline=None, plot_dir=None, profile=None, export=None, export_formats=None):
+    """
+    (list[str], str, str, str, str, str, list) -> None
+    
+    Combines the partial reports written for each shard of a release into one report.
+    Plots are rendered once, from the combined data, so cohort medians cover all cases
+      
+    Parameters
+    ----------
+    - partial_files (list[str]): names of the partial report files, one per shard
+    - output (str): name of the output PDF file
+    - baseline (str): baseline store of previous releases. Its percentiles are overlaid on the
+                      report, then the release is added to it
+    - plot_dir (str): if set, plot images are also written to this directory
+    - profile (str): output profile setting the resolution and format of images. Defaults to standard
+    - export (str): if set, the rows of every table are also written to this directory
+    - export_formats (list[str]): formats of the exported rows (csv, jsonl, parquet). All if not given
+    """
+    outfile = output if output else get_report_name(profile)
+    partials = []
+    for partial_file in partial_files:
+        with open(partial_file) as f:
+            partials.append(json.load(f))
+
+    partials.sort(key=lambda partial: partial["shard"][0])
+    first = partials[0]
+    for partial in partials:
+        for key in ["project", "release", "gamma", "selection", "lane_rollup"]:
+            if partial[key] != first[key]:
+                raise Exception(f"Partial reports do not share the same {key}: {partial[key]}, {first[key]}")
+    count = first["shard"][1]
+    indices = sorted(partial["shard"][0] for partial in partials)
+    if indices != list(range(1, count + 1)):
+        raise Exception(f"Expected one partial report for each of {count} shards, found shards {indices}")
+
+    with RunContext(
+        {"project": first["project"], "release": first["release"], "cases": {}},
+        gamma=first["gamma"],
+        plot_dir=plot_dir,
+        profile=profile,
+        **first["selection"],
+        lane_rollup=first["lane_rollup"],
+        export=TableExport(export, export_formats) if export else None,
+    ) as run:
+        report = Report(run)
+        data = report.merge_data([partial["sections"] for partial in partials])
+        store = BaselineStore(baseline) if baseline else None
+        report.load_context(data, store)
+        render_report(report, outfile)
+        if store:
+            update_baseline(store, run)
+
+
+def update_baseline(store, run):
+    """
+    (BaselineStore, RunContext) -> None
+    
+    Adds the release of run to the baseline store. Reports of only some sections or
+    tables are not added, so that the full report of the release can be added later
+      
+    Parameters
+    ----------
+    - store (BaselineStore): the baseline store, with the values of the report staged
+    - run (RunContext): the report run
+    """
+    if run.is_partial():
+        print(f"Release {run.project}/{run.release} not added to the baseline {store.path}, the report has only some sections")
+        return
+    store.commit(run.project, run.release)
+
+
+def load_release(input, use_stage, gamma, cache_dir, selection=None):
+    """
+    (str, bool, int, str, dict) -> dict
+    
+    Loads the table rows of a release, by section, table class name and case, from either a
+    report saved with --shard 1/1 or an input json. Rows of an input json are read from the
+    context cache when possible, and only the other cases are queried from QC-ETL. Raises an
+    exception if a saved report was made with another gamma or with its lanes rolled up
+      
+    Parameters
+    ----------
+    - input (str): name of the saved report or input file
+    - use_stage (bool): set to True if using data from staging
+    - gamma (int): the sequenza gamma setting whose solution is reported
+    - cache_dir (str): directory of the context cache
+    - selection (dict): sections, skip_sections and tables to include, as in RunContext
+    """
+    selection = selection or {}
+    with open(input) as f:
+        saved = json.load(f)
+
+    if "sections" in saved:
+        index, count = saved["shard"]
+        if count != 1:
+            raise Exception(f"{input} is shard {index} of {count}, save the whole release with --shard 1/1")
+        if float(saved["gamma"]) != float(gamma):
+            raise Exception(f"{input} was saved with gamma {saved['gamma']}, not {gamma}")
+        if saved.get("lane_rollup"):
+            raise Exception(f"{input} was saved with --lane-rollup, save the release without it to compare lanes")
+        rows = {
+            name: {
+                key: {case: case_rows for entry in context["data"] for case, case_rows in entry.items()}
+                for key, context in section["tables"].items()
+            }
+            for name, section in saved["sections"].items()
+        }
+        return {"project": saved["project"], "release": saved["release"], "rows": rows}
+
+    check_inputs({input: saved}, get_schema(selection))
+    with RunContext(saved, use_stage=use_stage, gamma=gamma, **selection) as run:
+        report = Report(run)
+        snapshots = report.get_snapshots()
+    cache = ContextCache(
+        cache_dir,
+        {"gamma": gamma, "stage": use_stage, "selection": selection},
+        snapshots
+    )
+
+    rows = {
+        section.name: {type(table).__name__: {} for table in section.tables}
+        for section in report.sections
+    }
+    missing = {}
+    for case, case_input in saved["cases"].items():
+        cached = cache.load({case: case_input})
+        if cached is None:
+            missing[case] = case_input
+            continue
+        for name, tables in cached.items():
+            for key, case_rows in tables.items():
+                rows[name][key][case] = case_rows
+    print(f"Loaded {len(saved['cases']) - len(missing)} of {len(saved['cases'])} cases of {input} from the cache")
+
+    if missing:
+        with RunContext({**saved, "cases": missing}, use_stage=use_stage, gamma=gamma, **selection) as missing_run:
+            missing_data = Report(missing_run).load_data()
+        for name, section in missing_data.items():
+            for key, context in section["tables"].items():
+                for entry in context["data"]:
+                    for case, case_rows in entry.items():
+                        rows[name][key].setdefault(case, []).extend(case_rows)
+        for case, case_input in missing.items():
+            cache.save({case: case_input}, {
+                name: {key: cases.get(case, []) for key, cases in tables.items()}
+                for name, tables in rows.items()
+            })
+
+    return {"project": saved["project"], "release": saved["release"], "rows": rows}
+
+
+def diff_reports(old_input, new_input, output, use_stage, gamma=500, cache_dir=None, selection=None):
+    """
+    (str, str, str, bool, int, str, dict) -> None
+    
+    Creates a report of the changes between two releases: added and removed cases, added
+    and removed rows, and the values that changed in rows found in both releases
+      
+    Parameters
+    ----------
+    - old_input (str): saved report or input file of the old release
+    - new_input (str): saved report or input file of the new release
+    - output (str): name of the output PDF file
+    - use_stage (bool): set to True if using data from staging
+    - gamma (int): the sequenza gamma setting whose solution is reported
+    - cache_dir (str): directory of the context cache. Defaults to .ar_cache in the working directory
+    - selection (dict): sections, skip_sections and tables to compare, as in RunContext. Saved
+                        reports must hold every table compared
+    """
+    selection = selection or {}
+    outfile = output if output else "Analysis_Report.diff.pdf"
+    cache_dir = cache_dir if cache_dir else os.path.join(os.getcwd(), ".ar_cache")
+    old = load_release(old_input, use_stage, gamma, cache_dir, selection)
+    new = load_release(new_input, use_stage, gamma, cache_dir, selection)
+
+    with RunContext({"project": new["project"], "release": new["release"], "cases": {}}, gamma=gamma, **selection) as run:
+        context = diff_releases(Report(run).sections, old, new)
+    makepdf(get_template("diff.html").render(context), outfile)
+    print(f"Created change report {outfile}")
+
+
+def generate_document(job, connections=None, mart=None):
+    """
+    (Job, ConnectionPool, str) -> bytes
+    
+    Generates the report of a job submitted to the report daemon, and returns it as
+    PDF or HTML
+      
+    Parameters
+    ----------
+    - job (Job): the job, with its input json and settings
+    - connections (ConnectionPool): connections to QC-ETL kept open between reports
+    - mart (str): report mart to read from instead of the QC-ETL databases, if set
+    """
+    with RunContext(
+        job.input_data,
+        use_stage=job.use_stage,
+        gamma=job.gamma,
+        connections=connections,
+        profile=job.profile,
+        **job.selection,
+        mart=mart,
+    ) as run:
+        if mart:
+            check_mart(run)
+        report = Report(run)
+        report.load_context()
+    html = render_html(report)
+    print(f"Generated {job.format} report for {run.project} {run.release}")
+    if job.format == "html":
+        return html.encode()
+    return makepdf(html)
+
+
+def serve_reports(host, port, socket_path, workers, queue_size, use_stage, gamma, profile=None, mart=None):
+    """
+    (str, int, str, int, int, bool, int, str, str) -> None
+    
+    Runs the report daemon. Connections to the QC-ETL databases are kept open and the
+    template and stylesheet are loaded before the first request
+      
+    Parameters
+    ----------
+    - host (str): address to listen on
+    - port (int): port to listen on
+    - socket_path (str): Unix socket to listen on instead of host and port
+    - workers (int): number of jobs run at the same time
+    - queue_size (int): number of jobs that can wait for a worker
+    - use_stage (bool): default for requests that do not set stage
+    - gamma (int): default for requests that do not set gamma
+    - profile (str): default output profile for requests that do not set profile
+    - mart (str): report mart every report reads from instead of the QC-ETL databases, if set
+    """
+    get_template()
+    get_stylesheet()
+    generate = partial(generate_document, connections=ConnectionPool(), mart=mart)
+    serve(generate, host, port, socket_path, workers, queue_size, use_stage, gamma, profile, get_input_problems)
+
+
+def parse_shard(value):
+    """
+    (str) -> (int, int)
+    
+    Parses a shard given on the command line as i/N
+      
+    Parameters
+    ----------
+    - value (str): the shard, i.e. "2/4" for the second of four shards
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must be given as i/N, not {value}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, not {index}")
+    return index, count
+
+
+def parse_names(value):
+    """
+    (str) -> list
+    
+    Parses a comma-separated list of section or table names given on the command line
+      
+    Parameters
+    ----------
+    - value (str): the names, i.e. "mutect2,sequenza"
+    """
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names:
+        raise argparse.ArgumentTypeError("expected at least one name")
+    return names
 
 
 if __name__ == "__main__":
@@ -113,7 +805,7 @@ if __name__ == "__main__":
         '--outfile',
         type=str,
         required=False,
-        help="Name of output file. Default names pdf Analysis_Report.pdf"
+        help="Name of output file. Default names pdf Analysis_Report.pdf, or Analysis_Report.html with the interactive profile"
     )
     parser.add_argument(
         '--stage',
@@ -121,9 +813,317 @@ if __name__ == "__main__":
         action="store_true",
         help="Use qcetl data from stage",
     )
+    parser.add_argument(
+        '--query-log',
+        type=str,
+        required=False,
+        help="Log each SQL statement run, with its timing, to this file"
+    )
+    parser.add_argument(
+        '--slow-query-ms',
+        type=float,
+        default=100.0,
+        help="Capture the query plan of statements slower than this. Default is 100"
+    )
+    parser.add_argument(
+        '--gamma',
+        type=int,
+        default=500,
+        help="Sequenza gamma setting to report. Default is 500"
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        required=False,
+        help="Process only shard i of N of the cases, given as i/N, and write its partial report as json"
+    )
+    parser.add_argument(
+        '--baseline',
+        type=str,
+        required=False,
+        help="Baseline store of previous releases to compare against. The release is added to it"
+    )
+    parser.add_argument(
+        '--plot-dir',
+        type=str,
+        required=False,
+        help="Also write the plot images to this directory. By default plots are only embedded in the report"
+    )
+    parser.add_argument(
+        '--profile',
+        choices=list(PROFILES),
+        default=DEFAULT_PROFILE,
+        help="Output profile: draft (small, low resolution images), standard, archival (vector plots), or interactive "
+             "(an HTML report whose plots are drawn in the browser, with sample IDs on hover). Default is standard"
+    )
+    parser.add_argument(
+        '--sections',
+        type=parse_names,
+        required=False,
+        help="Comma-separated names of the sections to include, i.e. mutect2,sequenza. All sections by default"
+    )
+    parser.add_argument(
+        '--skip-sections',
+        type=parse_names,
+        required=False,
+        help="Comma-separated names of the sections to leave out"
+    )
+    parser.add_argument(
+        '--tables',
+        type=parse_names,
+        required=False,
+        help="Comma-separated class names of the tables to include, i.e. WGLaneLevelTable. All tables of the included sections by default"
+    )
+    parser.add_argument(
+        '--mart',
+        type=str,
+        required=False,
+        help="Read from this report mart, built with the mart command, instead of the QC-ETL databases. A SQLite file, a directory of Parquet files or a json fixture"
+    )
+    parser.add_argument(
+        '--export',
+        type=str,
+        required=False,
+        help="Also write the rows of every table to this directory, for use by other tools"
+    )
+    parser.add_argument(
+        '--export-formats',
+        type=parse_names,
+        default=EXPORT_FORMATS,
+        help=f"Comma-separated formats of the exported rows. Default is {','.join(EXPORT_FORMATS)}"
+    )
+    parser.add_argument(
+        '--lane-rollup',
+        action="store_true",
+        help="Show one row per sample and sequencing run in the lane level tables, instead of one row per lane. "
+             "The rows of each lane are still written to --export"
+    )
+    parser.add_argument(
+        '--file-index',
+        type=str,
+        required=False,
+        help="File provenance report (tab separated, with Workflow Run SWID and File Path columns) used to "
+             "compute the Mutect2, Delly and RSEM values of workflow runs missing from QC-ETL from their output files"
+    )
+    parser.add_argument(
+        '--fallback-cache',
+        type=str,
+        default=".ar_cache/fallback",
+        help="Directory the values computed from each file are cached in, by checksum. Default is .ar_cache/fallback"
+    )
+    parser.add_argument(
+        '--fallback-workers',
+        type=int,
+        required=False,
+        help="Number of files parsed at once with --file-index. Default is the number of CPUs"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="Combine the partial reports written with --shard into one report"
+    )
+    merge_parser.add_argument(
+        'partials',
+        nargs="+",
+        help="Partial report files, one per shard"
+    )
+    merge_parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=False,
+        help="Name of output file. Default names pdf Analysis_Report.pdf, or Analysis_Report.html with the interactive profile"
+    )
+    merge_parser.add_argument(
+        '--baseline',
+        type=str,
+        required=False,
+        help="Baseline store of previous releases to compare against. The release is added to it"
+    )
+    merge_parser.add_argument(
+        '--plot-dir',
+        type=str,
+        required=False,
+        help="Also write the plot images to this directory. By default plots are only embedded in the report"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Keep one process running and generate reports for input json posted to /report"
+    )
+    serve_parser.add_argument(
+        '--host',
+        type=str,
+        default="127.0.0.1",
+        help="Address to listen on. Default is 127.0.0.1"
+    )
+    serve_parser.add_argument(
+        '--port',
+        type=int,
+        default=8000,
+        help="Port to listen on. Default is 8000"
+    )
+    serve_parser.add_argument(
+        '--socket',
+        type=str,
+        required=False,
+        help="Listen on this Unix socket instead of a port"
+    )
+    serve_parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of reports generated at the same time. Default is 1"
+    )
+    serve_parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=8,
+        help="Number of reports that can wait for a worker before requests are refused. Default is 8"
+    )
+
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="Report the changes between two releases, given as input json or reports saved with --shard 1/1"
+    )
+    diff_parser.add_argument(
+        'old',
+        help="Input file or saved report of the old release"
+    )
+    diff_parser.add_argument(
+        'new',
+        help="Input file or saved report of the new release"
+    )
+    diff_parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=False,
+        help="Name of output file. Default names pdf Analysis_Report.diff.pdf"
+    )
+    diff_parser.add_argument(
+        '--cache-dir',
+        type=str,
+        required=False,
+        help="Directory of the cached rows of each case. Default is .ar_cache"
+    )
+
+    mart_parser = subparsers.add_parser(
+        "mart",
+        help="Build the report mart from the current QC-ETL databases. Uses --stage and --gamma"
+    )
+    mart_parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=True,
+        help="Path of the report mart: a file for sqlite, a directory for parquet"
+    )
+    mart_parser.add_argument(
+        '--format',
+        choices=["sqlite", "parquet"],
+        default="sqlite",
+        help="Build the mart as one SQLite file, or export it as one Parquet file per table. Default is sqlite"
+    )
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="Generate the reports of several releases, reading each source table once for all of them. "
+             "Uses --stage, --query-log, --gamma, --profile, --mart and the section options"
+    )
+    batch_parser.add_argument(
+        'inputs',
+        nargs="+",
+        help="Input json files, one per report"
+    )
+    batch_parser.add_argument(
+        '-o',
+        '--outdir',
+        type=str,
+        default=".",
+        help="Directory the reports are written to, named after their input file. Default is the current directory"
+    )
+    validate_parser = subparsers.add_parser(
+        "validate",
+        help="Check input json files for the tables selected, without opening any database. Uses the section options"
+    )
+    validate_parser.add_argument(
+        'inputs',
+        nargs="+",
+        help="Input json files to check"
+    )
 
     args = parser.parse_args()
+    selection = {"sections": args.sections, "skip_sections": args.skip_sections, "tables": args.tables}
+    fallback = FileFallback(args.file_index, args.fallback_cache, args.fallback_workers) if args.file_index else None
+
+    if args.command == "merge":
+        merge_reports(
+            args.partials,
+            args.outfile,
+            args.baseline,
+            args.plot_dir,
+            args.profile,
+            args.export,
+            args.export_formats
+        )
+        raise SystemExit
+    if args.command == "diff":
+        diff_reports(args.old, args.new, args.outfile, args.stage, args.gamma, args.cache_dir, selection)
+        raise SystemExit
+    if args.command == "mart":
+        build_report_mart(args.outfile, args.stage, args.gamma, args.format)
+        raise SystemExit
+    if args.command == "batch":
+        generate_batch(
+            args.inputs,
+            args.outdir,
+            args.stage,
+            args.query_log,
+            args.slow_query_ms,
+            args.gamma,
+            args.profile,
+            selection,
+            args.mart,
+            args.lane_rollup,
+            fallback
+        )
+        raise SystemExit
+    if args.command == "validate":
+        load_inputs(args.inputs, selection)
+        print(f"No problems found in {', '.join(args.inputs)}")
+        raise SystemExit
+    if args.command == "serve":
+        serve_reports(
+            args.host,
+            args.port,
+            args.socket,
+            args.workers,
+            args.queue_size,
+            args.stage,
+            args.gamma,
+            args.profile,
+            args.mart
+        )
+        raise SystemExit
 
     print(f"Reading input from {args.infile}")
 
-    generate_report(input=args.infile, output=args.outfile, use_stage=args.stage)
+    generate_report(
+        input=args.infile,
+        output=args.outfile,
+        use_stage=args.stage,
+        query_log=args.query_log,
+        slow_query_ms=args.slow_query_ms,
+        gamma=args.gamma,
+        shard=args.shard,
+        baseline=args.baseline,
+        plot_dir=args.plot_dir,
+        profile=args.profile,
+        selection=selection,
+        mart=args.mart,
+        export=args.export,
+        export_formats=args.export_formats,
+        lane_rollup=args.lane_rollup,
+        fallback=fallback,
+    )
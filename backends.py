@@ -0,0 +1,811 @@
+"""
+Data sources the report tables read from.
+Tables ask a DataSource for the rows of a logical table (a QC-ETL database and table) whose
+key column matches a list of keys, and name the columns they want along with the SQL expression
+computing each of them from QC-ETL. Three sources are available:
+- SQLiteSource reads the QC-ETL databases, or the SQLite report mart (see mart.py)
+- ParquetSource reads a Parquet export of the report mart, pushing the key filter down to the files
+- FixtureSource reads rows held in memory or in a json file, for tests and offline runs
+Exports of the mart store each column already computed under its name, so the SQL expressions
+are only used when reading QC-ETL itself.
+Several reports can share one pass over the data: a RecordingSource records what their tables
+request, each request is fetched once for the union of its keys, and a SharedSource serves the
+rows back to each report.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+from lims_index import get_snapshot
+from mart import SOURCES_TABLE, get_mart_gamma, get_stale_sources
+
+MAX_KEYS = 900 # max number of keys bound in one statement, kept under SQLite's default limit of 999
+
+# columns requested from a source: Dict[column name, SQL expression computing it, or None for a plain column]
+Columns = Dict[str, Optional[str]]
+
+
+# DataSource class defines the interface of the sources the tables read from
+class DataSource:
+    records_only = False    # True for sources that record the requests for rows instead of returning rows
+
+    def get_rows(
+        self,
+        db: str,
+        table: str,
+        key_column: str,
+        keys: List[str],
+        columns: Columns
+    ) -> Dict[str, List[tuple]]:
+        """
+        (str, str, str, list, dict) -> dict[str, list[tuple]]
+
+        Gets columns from table for all keys at once and returns the rows grouped by the
+        key they matched. Keys that match no rows are left out
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - columns (dict): name and SQL expression of the columns being selected
+
+        """
+        raise NotImplementedError
+
+    def get_values(self, db: str, table: str, column: str) -> List[Any]:
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        raise NotImplementedError
+
+    def get_snapshot(self, db: str) -> Tuple[str, float]:
+        """
+        (str) -> (str, float)
+
+        Identifies the version of the data of db read by the source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        raise NotImplementedError
+
+    def get_stale_sources(self, base_db_path: str) -> List[str]:
+        """
+        (str) -> list[str]
+
+        Returns the QC-ETL databases refreshed since the data of the source was copied from them
+
+        Parameters
+        -----------
+        - base_db_path (str): directory of the QC-ETL databases
+
+        """
+        return []
+
+    def get_mart_gamma(self) -> Optional[float]:
+        """
+        None -> float
+
+        Returns the sequenza gamma the report mart read by the source was built for, or None
+        if the source is not a mart or the mart does not record it
+        """
+        return None
+
+    def close(self) -> None:
+        """
+        None -> None
+
+        Releases what the source holds open
+        """
+        pass
+
+
+# SQLiteSource class reads the QC-ETL databases
+class SQLiteSource(DataSource):
+    def __init__(self, base_db_path: str, connections: Any=None, query_log: Any=None) -> None:
+        """
+        Parameters
+        -----------
+        - base_db_path (str): directory of the QC-ETL databases
+        - connections (ConnectionPool): connections kept open between reports, if set
+        - query_log (QueryLog): traces each statement run, if set
+
+        """
+        self.base_db_path = base_db_path
+        self.connections = connections
+        self.query_log = query_log
+        self.opened = {}    # Dict[database path, connection] opened by the source when there is no pool
+
+    def get_db_path(self, db: str) -> str:
+        """
+        (str) -> str
+
+        Returns the path of the database db
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return self.base_db_path + db + "/latest"
+
+    def get_column(self, name: str, expression: Optional[str]) -> str:
+        """
+        (str, str) -> str
+
+        Returns the SQL selecting column name
+
+        Parameters
+        -----------
+        - name (str): name of the column
+        - expression (str): SQL expression computing the column, or None for a plain column
+
+        """
+        return expression if expression else f'"{name}"'
+
+    def connect(self, db: str) -> sqlite3.Connection:
+        """
+        (str) -> sqlite3.Connection
+
+        Returns a connection to the database db, from the connection pool if connections are
+        kept open between reports. Otherwise each database is opened once and kept until close
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        db_path = self.get_db_path(db)
+        if self.connections is not None:
+            return self.connections.connect(db_path)
+        if db_path not in self.opened:
+            self.opened[db_path] = sqlite3.connect(db_path)
+        return self.opened[db_path]
+
+    def query(self, db: str, statement: str, params: tuple=(), keys: list=None) -> List[tuple]:
+        """
+        (str, str, tuple, list) -> list[tuple]
+
+        Runs statement against db and returns all rows. If a query log is set the
+        statement is traced along with the keys it was run for
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+        - statement (str): the SQL statement to run
+        - params (tuple): values bound to the placeholders of statement
+        - keys (list): keys the statement was run for, recorded in the query log
+
+        """
+        cur = self.connect(db).cursor()
+        try:
+            if self.query_log:
+                return self.query_log.execute(cur, statement, params, keys)
+            return cur.execute(statement, params).fetchall()
+        finally:
+            cur.close()
+
+    def get_rows(self, db, table, key_column, keys, columns):
+        """
+        (str, str, str, list, dict) -> dict[str, list[tuple]]
+
+        Gets columns from table for all keys at once and returns the rows grouped by the
+        key they matched. Keys are stripped of their whitespace and bound in batches of MAX_KEYS
+        against the bare key column, so its index can be used
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - columns (dict): name and SQL expression of the columns being selected
+
+        """
+        select_block = ", ".join(self.get_column(name, expression) for name, expression in columns.items())
+        rows = {}
+        keys = list(dict.fromkeys(key.strip() if isinstance(key, str) else key for key in keys))
+        for start in range(0, len(keys), MAX_KEYS):
+            batch = keys[start:start + MAX_KEYS]
+            placeholders = ", ".join(["?"] * len(batch))
+            statement = f"""
+                select "{key_column}", {select_block}
+                from {table}
+                where "{key_column}" in ({placeholders});
+                """
+            for row in self.query(db, statement, batch):
+                rows.setdefault(str(row[0]), []).append(row[1:])
+        return rows
+
+    def get_values(self, db, table, column):
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        return [
+            row[0] for row in self.query(
+                db,
+                f"""
+                select distinct "{column}" from {table};
+                """
+            )
+        ]
+
+    def get_snapshot(self, db):
+        """
+        (str) -> (str, float)
+
+        Identifies the snapshot of db, which changes with each QC-ETL refresh
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return get_snapshot(self.get_db_path(db))
+
+    def close(self):
+        """
+        None -> None
+
+        Closes the connections opened by the source
+        """
+        for con in self.opened.values():
+            con.close()
+        self.opened = {}
+
+
+# SQLiteMartSource class reads the SQLite report mart, which holds every table in one file
+# with each column already computed under its name
+class SQLiteMartSource(SQLiteSource):
+    def __init__(self, path: str, connections: Any=None, query_log: Any=None) -> None:
+        """
+        Parameters
+        -----------
+        - path (str): path of the report mart
+        - connections (ConnectionPool): connections kept open between reports, if set
+        - query_log (QueryLog): traces each statement run, if set
+
+        """
+        super().__init__("", connections, query_log)
+        self.path = path
+
+    def get_db_path(self, db):
+        """
+        (str) -> str
+
+        Returns the path of the mart, which holds the tables of every database
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return self.path
+
+    def get_column(self, name, expression):
+        """
+        (str, str) -> str
+
+        Returns the SQL selecting column name, which the mart stores already computed
+
+        Parameters
+        -----------
+        - name (str): name of the column
+        - expression (str): SQL expression computing the column in QC-ETL
+
+        """
+        return f'"{name}"'
+
+    def get_stale_sources(self, base_db_path):
+        """
+        (str) -> list[str]
+
+        Returns the QC-ETL databases refreshed since the mart was built
+
+        Parameters
+        -----------
+        - base_db_path (str): directory of the QC-ETL databases
+
+        """
+        return get_stale_sources(self.path, base_db_path)
+
+    def get_mart_gamma(self):
+        """
+        None -> float
+
+        Returns the sequenza gamma the mart was built for, or None if it does not record it
+        """
+        return get_mart_gamma(self.path)
+
+
+# ExportSource class defines the sources reading an export of the report mart table by table,
+# with each column stored under its name
+class ExportSource(DataSource):
+    def read(self, table: str, key_column: str, keys: List[str], names: List[str]) -> Dict[str, List[tuple]]:
+        """
+        (str, str, list, list) -> dict[str, list[tuple]]
+
+        Returns the columns names of the rows of table matching keys, grouped by key
+
+        Parameters
+        -----------
+        - table (str): name of the table
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - names (list): names of the columns being read
+
+        """
+        raise NotImplementedError
+
+    def get_rows(self, db, table, key_column, keys, columns):
+        """
+        (str, str, str, list, dict) -> dict[str, list[tuple]]
+
+        Gets columns from table for all keys at once and returns the rows grouped by the
+        key they matched
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - columns (dict): name and SQL expression of the columns being selected
+
+        """
+        return self.read(table, key_column, list(dict.fromkeys(str(key).strip() for key in keys)), list(columns))
+
+
+# ParquetSource class reads a directory of Parquet files, one per table of the report mart
+class ParquetSource(ExportSource):
+    def __init__(self, directory: str) -> None:
+        """
+        Parameters
+        -----------
+        - directory (str): directory of the Parquet files, named after their table
+
+        """
+        try:
+            import pyarrow.dataset
+        except ImportError:
+            raise Exception("pyarrow is required to read Parquet files, install it with pip install pyarrow")
+        self.dataset = pyarrow.dataset
+        self.directory = directory
+
+    def get_path(self, table: str) -> str:
+        """
+        (str) -> str
+
+        Returns the path of the Parquet file of table
+
+        Parameters
+        -----------
+        - table (str): name of the table
+
+        """
+        return os.path.join(self.directory, f"{table}.parquet")
+
+    def read(self, table, key_column, keys, names):
+        """
+        (str, str, list, list) -> dict[str, list[tuple]]
+
+        Returns the columns names of the rows of table matching keys, grouped by key. Only the
+        key column and names are read, and row groups whose statistics exclude every key are skipped
+
+        Parameters
+        -----------
+        - table (str): name of the table
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - names (list): names of the columns being read
+
+        """
+        if not keys:
+            return {}
+        dataset = self.dataset.dataset(self.get_path(table), format="parquet")
+        key_type = dataset.schema.field(key_column).type
+        if str(key_type).startswith(("int", "uint")):
+            keys = [int(key) for key in keys if key.lstrip("-").isdigit()]
+        result = dataset.to_table(
+            columns=[key_column] + names,
+            filter=self.dataset.field(key_column).isin(keys),
+        ).to_pydict()
+        rows = {}
+        for index, key in enumerate(result[key_column]):
+            rows.setdefault(str(key), []).append(tuple(result[name][index] for name in names))
+        return rows
+
+    def get_values(self, db, table, column):
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        values = self.dataset.dataset(self.get_path(table), format="parquet").to_table(columns=[column])
+        return list(dict.fromkeys(values.column(column).to_pylist()))
+
+    def get_snapshot(self, db):
+        """
+        (str) -> (str, float)
+
+        Identifies the export, by its directory and the time it was written
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return get_snapshot(self.directory)
+
+    def get_stale_sources(self, base_db_path):
+        """
+        (str) -> list[str]
+
+        Returns the QC-ETL databases refreshed since the mart was exported, if the export
+        records the snapshot of each of them
+
+        Parameters
+        -----------
+        - base_db_path (str): directory of the QC-ETL databases
+
+        """
+        path = self.get_path(SOURCES_TABLE)
+        if not os.path.exists(path):
+            return []
+        sources = self.dataset.dataset(path, format="parquet").to_table().to_pylist()
+        return [
+            source["source_db"] for source in sources
+            if os.path.exists(base_db_path + source["source_db"] + "/latest")
+            and get_snapshot(base_db_path + source["source_db"] + "/latest") != (source["path"], source["mtime"])
+        ]
+
+    def get_mart_gamma(self):
+        """
+        None -> float
+
+        Returns the sequenza gamma the exported mart was built for, or None if the export
+        does not record it
+        """
+        path = self.get_path(SOURCES_TABLE)
+        if not os.path.exists(path):
+            return None
+        sources = self.dataset.dataset(path, format="parquet").to_table().to_pylist()
+        gammas = [source.get("gamma") for source in sources if source.get("gamma") is not None]
+        return gammas[0] if gammas else None
+
+
+# FixtureSource class reads rows held in memory, for tests and offline runs
+class FixtureSource(ExportSource):
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]], name: str="fixture") -> None:
+        """
+        Parameters
+        -----------
+        - tables (dict): rows of each table, as dicts of the column names of the report mart
+        - name (str): identifies the fixture in cache keys
+
+        """
+        self.tables = tables
+        self.name = name
+
+    @staticmethod
+    def from_file(path: str) -> "FixtureSource":
+        """
+        (str) -> FixtureSource
+
+        Returns the fixture held in a json file, as {table: [row, ...]}
+
+        Parameters
+        -----------
+        - path (str): path of the json file
+
+        """
+        with open(path) as f:
+            return FixtureSource(json.load(f), path)
+
+    def read(self, table, key_column, keys, names):
+        """
+        (str, str, list, list) -> dict[str, list[tuple]]
+
+        Returns the columns names of the rows of table matching keys, grouped by key
+
+        Parameters
+        -----------
+        - table (str): name of the table
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - names (list): names of the columns being read
+
+        """
+        keys = set(keys)
+        rows = {}
+        for row in self.tables.get(table, []):
+            key = str(row.get(key_column))
+            if key in keys:
+                rows.setdefault(key, []).append(tuple(row.get(name) for name in names))
+        return rows
+
+    def get_values(self, db, table, column):
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        return list(dict.fromkeys(row.get(column) for row in self.tables.get(table, [])))
+
+    def get_snapshot(self, db):
+        """
+        (str) -> (str, float)
+
+        Identifies the fixture
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return self.name, 0.0
+
+    def get_mart_gamma(self):
+        """
+        None -> float
+
+        Returns the sequenza gamma of the rows of the fixture, if it has the sources table of a mart
+        """
+        gammas = [row.get("gamma") for row in self.tables.get(SOURCES_TABLE, []) if row.get("gamma") is not None]
+        return gammas[0] if gammas else None
+
+
+def get_request(db: str, table: str, key_column: str, columns: Columns) -> tuple:
+    """
+    (str, str, str, dict) -> tuple
+
+    Returns a hashable identifier of a request for rows, made of everything but its keys
+
+    Parameters
+    -----------
+    - db (str): name of the QC-ETL database holding table
+    - table (str): name of the table being queried
+    - key_column (str): the column keys are matched against
+    - columns (dict): name and SQL expression of the columns being selected
+
+    """
+    return (
+        db,
+        table,
+        key_column,
+        tuple(columns.items()),
+    )
+
+
+# RecordingSource class records the rows requested by the tables of several reports without
+# fetching them, so each request can then be fetched once for the union of their keys
+class RecordingSource(DataSource):
+    records_only = True
+
+    def __init__(self, source: DataSource) -> None:
+        """
+        Parameters
+        -----------
+        - source (DataSource): the source the requests are fetched from
+
+        """
+        self.source = source
+        self.requests = {}  # Dict[request from get_request, (arguments of get_rows, list of keys)]
+
+    def get_rows(self, db, table, key_column, keys, columns):
+        """
+        (str, str, str, list, dict) -> dict
+
+        Records the request and returns no rows
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - columns (dict): name and SQL expression of the columns being selected
+
+        """
+        request = get_request(db, table, key_column, columns)
+        if request not in self.requests:
+            self.requests[request] = ((db, table, key_column, columns), [])
+        self.requests[request][1].extend(keys)
+        return {}
+
+    def get_values(self, db, table, column):
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table, from the underlying source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        return self.source.get_values(db, table, column)
+
+    def get_snapshot(self, db):
+        """
+        (str) -> (str, float)
+
+        Identifies the version of the data of db read by the underlying source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return self.source.get_snapshot(db)
+
+    def fetch(self) -> Dict[tuple, Tuple[set, Dict[str, List[tuple]]]]:
+        """
+        None -> dict[tuple, (set, dict)]
+
+        Fetches each recorded request once, for the union of the keys it was made for.
+        Returns the keys fetched and the rows found for each request
+
+        """
+        fetched = {}
+        for request, ((db, table, key_column, columns), keys) in self.requests.items():
+            keys = list(dict.fromkeys(str(key) for key in keys))
+            fetched[request] = (set(keys), self.source.get_rows(db, table, key_column, keys, columns))
+        return fetched
+
+
+# SharedSource class serves the rows fetched once for several reports, and fetches the
+# rows of requests that were not planned from the underlying source
+class SharedSource(DataSource):
+    def __init__(self, source: DataSource, fetched: Dict[tuple, Tuple[set, Dict[str, List[tuple]]]]) -> None:
+        """
+        Parameters
+        -----------
+        - source (DataSource): the source the rows were fetched from
+        - fetched (dict): the keys fetched and rows found for each request, from RecordingSource.fetch
+
+        """
+        self.source = source
+        self.fetched = fetched
+
+    def get_rows(self, db, table, key_column, keys, columns):
+        """
+        (str, str, str, list, dict) -> dict[str, list[tuple]]
+
+        Returns the fetched rows of keys. Keys that were not fetched are queried from the
+        underlying source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys being queried
+        - columns (dict): name and SQL expression of the columns being selected
+
+        """
+        fetched_keys, rows = self.fetched.get(get_request(db, table, key_column, columns), (set(), {}))
+        keys = [str(key) for key in keys]
+        result = {key: rows[key] for key in keys if key in rows}
+        missing = [key for key in keys if key not in fetched_keys]
+        if missing:
+            result.update(self.source.get_rows(db, table, key_column, missing, columns))
+        return result
+
+    def get_values(self, db, table, column):
+        """
+        (str, str, str) -> list
+
+        Returns every distinct value of column in table, from the underlying source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table
+        - column (str): name of the column
+
+        """
+        return self.source.get_values(db, table, column)
+
+    def get_snapshot(self, db):
+        """
+        (str) -> (str, float)
+
+        Identifies the version of the data of db read by the underlying source
+
+        Parameters
+        -----------
+        - db (str): name of the QC-ETL database
+
+        """
+        return self.source.get_snapshot(db)
+
+    def get_stale_sources(self, base_db_path):
+        """
+        (str) -> list[str]
+
+        Returns the QC-ETL databases refreshed since the data of the underlying source was copied
+
+        Parameters
+        -----------
+        - base_db_path (str): directory of the QC-ETL databases
+
+        """
+        return self.source.get_stale_sources(base_db_path)
+
+    def get_mart_gamma(self):
+        """
+        None -> float
+
+        Returns the sequenza gamma the report mart of the underlying source was built for
+        """
+        return self.source.get_mart_gamma()
+
+
+def get_source(
+    base_db_path: str,
+    mart: str=None,
+    connections: Any=None,
+    query_log: Any=None
+) -> DataSource:
+    """
+    (str, str, ConnectionPool, QueryLog) -> DataSource
+
+    Returns the source of a report run: the report mart if one is given, as a SQLite file,
+    a directory of Parquet files or a json fixture, and the QC-ETL databases otherwise
+
+    Parameters
+    -----------
+    - base_db_path (str): directory of the QC-ETL databases
+    - mart (str): path of the report mart, if set
+    - connections (ConnectionPool): connections kept open between reports, if set
+    - query_log (QueryLog): traces each statement run on SQLite, if set
+
+    """
+    if not mart:
+        return SQLiteSource(base_db_path, connections, query_log)
+    if not os.path.exists(mart):
+        raise Exception(f"Report mart {mart} not found")
+    if os.path.isdir(mart):
+        return ParquetSource(mart)
+    if mart.endswith(".json"):
+        return FixtureSource.from_file(mart)
+    return SQLiteMartSource(mart, connections, query_log)
@@ -0,0 +1,288 @@
+"""
+Historical baseline of the metrics of previous releases.
+The store keeps one mergeable quantile sketch (a t-digest) per metric and sample type,
+where the metrics are the columns of each table in table_columns.py. The sketches of a
+release are merged into the store after its report is generated, so historical
+percentiles can be looked up at a fixed cost per metric without going back to QC-ETL.
+"""
+from typing import Any, Dict
+import json
+import math
+import os
+import numpy
+
+COMPRESSION = 100                   # t-digest compression, bounds the number of centroids kept per sketch
+PERCENTILES = [0.05, 0.5, 0.95]     # historical percentiles overlaid on tables and plots
+
+
+# QuantileSketch class defines a t-digest: a small set of weighted centroids that
+# approximates the distribution of every value added to it and can be merged
+class QuantileSketch:
+    def __init__(self, compression: int=COMPRESSION) -> None:
+        self.compression = compression
+        self.means = numpy.zeros(0)     # centroid means, sorted
+        self.weights = numpy.zeros(0)   # number of values summarized by each centroid
+        self.min = math.inf
+        self.max = -math.inf
+
+    def get_count(self) -> float:
+        """
+        None -> float
+
+        Returns the number of values added to the sketch
+        """
+        return float(self.weights.sum())
+
+    def get_scale(self, q: numpy.ndarray) -> numpy.ndarray:
+        """
+        (numpy.ndarray) -> numpy.ndarray
+
+        Scale function of the t-digest, which keeps centroids small near the tails
+
+        Parameters
+        -----------
+        - q (numpy.ndarray): quantiles
+
+        """
+        return self.compression / (2 * math.pi) * numpy.arcsin(2 * numpy.clip(q, 0, 1) - 1)
+
+    def compress(self, means: numpy.ndarray, weights: numpy.ndarray) -> None:
+        """
+        (numpy.ndarray, numpy.ndarray) -> None
+
+        Replaces the centroids of the sketch with the compressed centroids means and weights
+
+        Parameters
+        -----------
+        - means (numpy.ndarray): centroid means, in any order
+        - weights (numpy.ndarray): weight of each centroid
+
+        """
+        order = numpy.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        new_means, new_weights = [], []
+        current_mean, current_weight = means[0], weights[0]
+        weight_before = 0.0
+        k_left = self.get_scale(0.0)
+        for mean, weight in zip(means[1:], weights[1:]):
+            q_right = (weight_before + current_weight + weight) / total
+            if self.get_scale(q_right) - k_left <= 1:
+                current_mean = (current_mean * current_weight + mean * weight) / (current_weight + weight)
+                current_weight += weight
+            else:
+                new_means.append(current_mean)
+                new_weights.append(current_weight)
+                weight_before += current_weight
+                k_left = self.get_scale(weight_before / total)
+                current_mean, current_weight = mean, weight
+        new_means.append(current_mean)
+        new_weights.append(current_weight)
+
+        self.means = numpy.array(new_means, dtype=float)
+        self.weights = numpy.array(new_weights, dtype=float)
+
+    def add(self, values: numpy.ndarray) -> None:
+        """
+        (numpy.ndarray) -> None
+
+        Adds values to the sketch
+
+        Parameters
+        -----------
+        - values (numpy.ndarray): values to add, nan values are ignored
+
+        """
+        values = numpy.asarray(values, dtype=float)
+        values = values[~numpy.isnan(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.compress(
+            numpy.concatenate([self.means, values]),
+            numpy.concatenate([self.weights, numpy.ones(len(values))]),
+        )
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        (QuantileSketch) -> None
+
+        Merges the values summarized by other into the sketch
+
+        Parameters
+        -----------
+        - other (QuantileSketch): the sketch to merge
+
+        """
+        if other.get_count() == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress(
+            numpy.concatenate([self.means, other.means]),
+            numpy.concatenate([self.weights, other.weights]),
+        )
+
+    def get_quantile(self, q: float) -> float:
+        """
+        (float) -> float
+
+        Returns the approximate q-th quantile of the values added to the sketch
+
+        Parameters
+        -----------
+        - q (float): quantile between 0 and 1
+
+        """
+        if self.get_count() == 0:
+            return math.nan
+        centers = numpy.cumsum(self.weights) - self.weights / 2
+        positions = numpy.concatenate([[0.0], centers, [self.get_count()]])
+        values = numpy.concatenate([[self.min], self.means, [self.max]])
+        return float(numpy.interp(q * self.get_count(), positions, values))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        None -> dict
+
+        Returns the sketch in a form that can be saved as json
+        """
+        return {
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @staticmethod
+    def from_dict(sketch: Dict[str, Any]) -> "QuantileSketch":
+        """
+        (dict) -> QuantileSketch
+
+        Returns the sketch saved by to_dict
+
+        Parameters
+        -----------
+        - sketch (dict): a sketch returned by to_dict
+
+        """
+        quantile_sketch = QuantileSketch()
+        quantile_sketch.means = numpy.array(sketch["means"], dtype=float)
+        quantile_sketch.weights = numpy.array(sketch["weights"], dtype=float)
+        quantile_sketch.min = sketch["min"]
+        quantile_sketch.max = sketch["max"]
+        return quantile_sketch
+
+
+# BaselineStore class defines the local file of sketches of every previous release
+class BaselineStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.releases = []  # "project/release" of each release in the store
+        self.sketches = {}  # Dict[metric, Dict[sample type, QuantileSketch]]
+        self.staged = {}    # sketches of the current release, merged into the store by commit
+
+        if os.path.exists(path):
+            with open(path) as f:
+                store = json.load(f)
+            self.releases = store["releases"]
+            self.sketches = {
+                metric: {
+                    group: QuantileSketch.from_dict(sketch)
+                    for group, sketch in groups.items()
+                }
+                for metric, groups in store["metrics"].items()
+            }
+
+    def get_metric(self, table: Any, column: str) -> str:
+        """
+        (Table, str) -> str
+
+        Returns the name of the metric for column of table
+
+        Parameters
+        -----------
+        - table (Table): the table the column belongs to
+        - column (str): the column, from table_columns.py
+
+        """
+        return f"{type(table).__name__}.{column}"
+
+    def get_history(self, table: Any, column: str) -> Dict[str, Dict[float, float]]:
+        """
+        (Table, str) -> dict[str, dict[float, float]]
+
+        Returns the historical percentiles of column of table for each sample type
+
+        Parameters
+        -----------
+        - table (Table): the table the column belongs to
+        - column (str): the column, from table_columns.py
+
+        """
+        groups = self.sketches.get(self.get_metric(table, column), {})
+        return {
+            group: {q: sketch.get_quantile(q) for q in PERCENTILES}
+            for group, sketch in groups.items()
+            if sketch.get_count() > 0
+        }
+
+    def stage(self, table: Any, stats: Any) -> None:
+        """
+        (Table, CohortStats) -> None
+
+        Sketches the values of each column of table in the current release, to be
+        added to the store by commit
+
+        Parameters
+        -----------
+        - table (Table): the table
+        - stats (CohortStats): cohort statistics of the table in the current release
+
+        """
+        for column, groups in stats.values.items():
+            for group, values in groups.items():
+                sketch = QuantileSketch()
+                sketch.add(values)
+                metric = self.get_metric(table, column)
+                self.staged.setdefault(metric, {})[group] = sketch
+
+    def commit(self, project: str, release: str) -> None:
+        """
+        (str, str) -> None
+
+        Merges the staged sketches into the store and saves it. Releases already
+        in the store (i.e. re-issued reports) are not added again
+
+        Parameters
+        -----------
+        - project (str): project of the current release
+        - release (str): the current release
+
+        """
+        name = f"{project}/{release}"
+        if name in self.releases:
+            print(f"Release {name} is already in the baseline {self.path}")
+            self.staged = {}
+            return
+
+        for metric, groups in self.staged.items():
+            for group, sketch in groups.items():
+                self.sketches.setdefault(metric, {}).setdefault(group, QuantileSketch()).merge(sketch)
+        self.releases.append(name)
+        self.staged = {}
+
+        store = {
+            "releases": self.releases,
+            "metrics": {
+                metric: {group: sketch.to_dict() for group, sketch in groups.items()}
+                for metric, groups in self.sketches.items()
+            },
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(store, f)
+        os.replace(temp_path, self.path)
+        print(f"Added release {name} to the baseline {self.path}")
@@ -0,0 +1,101 @@
+"""
+Cohort statistics shared by the tables and plots of the report.
+Each column of a table is summarized in one vectorized pass per column: the median,
+quantiles, min/max and median absolute deviation (MAD) of every group of rows
+(usually a sample type), along with MAD-based outlier flags for each row.
+"""
+from typing import Any, Callable, Dict, List
+import numpy
+
+COHORT = "cohort"                     # group of the rows of tables that are not split by sample type
+QUANTILES = [0.05, 0.25, 0.75, 0.95]  # quantiles reported besides the median
+MAD_SCALE = 0.6745                    # scales the MAD to the standard deviation of a normal distribution
+OUTLIER_Z = 3.5                       # rows whose modified z-score is above this are outliers
+
+
+class CohortStats:
+    def __init__(self, rows: List[Dict[str, Any]], columns: List[str], group_of: Callable[[Dict], str]) -> None:
+        """
+        Parameters
+        -----------
+        - rows (list[dict]): rows of the table, mapping each column to its value
+        - columns (list[str]): columns to summarize. Values that are not numbers ("nd") are ignored
+        - group_of (function): returns the group a row belongs to
+
+        """
+        self.groups = []        # groups in the order they were first seen
+        self.stats = {}         # Dict[column, Dict[group, summary]]
+        self.outliers = {}      # Dict[column, list of the positions (in rows) of outlier rows]
+        self.values = {}        # Dict[column, Dict[group, numpy.ndarray of the numeric values of the group]]
+
+        row_groups = [group_of(row) for row in rows]
+        for group in row_groups:
+            if group not in self.groups:
+                self.groups.append(group)
+        group_codes = numpy.array([self.groups.index(group) for group in row_groups], dtype=int)
+
+        for column in columns:
+            values = numpy.array(
+                [
+                    row[column]
+                    if isinstance(row.get(column), (int, float)) and not isinstance(row.get(column), bool)
+                    else numpy.nan
+                    for row in rows
+                ],
+                dtype=float,
+            )
+            self.stats[column], self.outliers[column] = self.summarize(values, group_codes)
+            self.values[column] = {
+                group: values[(group_codes == code) & ~numpy.isnan(values)]
+                for code, group in enumerate(self.groups)
+            }
+
+    def summarize(self, values: numpy.ndarray, group_codes: numpy.ndarray):
+        """
+        (numpy.ndarray, numpy.ndarray) -> dict[str, dict], list[int]
+
+        Summarizes the values of one column for each group, and returns the summaries
+        along with the positions of the outlier values
+
+        Parameters
+        -----------
+        - values (numpy.ndarray): value of the column in each row, nan if not a number
+        - group_codes (numpy.ndarray): index (in self.groups) of the group of each row
+
+        """
+        summaries = {}
+        outliers = numpy.zeros(len(values), dtype=bool)
+        for code, group in enumerate(self.groups):
+            in_group = (group_codes == code) & ~numpy.isnan(values)
+            group_values = values[in_group]
+            if len(group_values) == 0:
+                continue
+
+            median = numpy.median(group_values)
+            mad = numpy.median(numpy.abs(group_values - median))
+            if mad > 0:
+                z_scores = MAD_SCALE * numpy.abs(group_values - median) / mad
+                outliers[numpy.flatnonzero(in_group)[z_scores > OUTLIER_Z]] = True
+
+            summaries[group] = {
+                "n": len(group_values),
+                "median": float(median),
+                "quantiles": dict(zip(QUANTILES, numpy.quantile(group_values, QUANTILES).tolist())),
+                "min": float(group_values.min()),
+                "max": float(group_values.max()),
+                "mad": float(mad),
+            }
+        return summaries, numpy.flatnonzero(outliers).tolist()
+
+    def get_column(self, column: str) -> Dict[str, Dict[str, Any]]:
+        """
+        (str) -> dict[str, dict]
+
+        Returns the summary of column for each group
+
+        Parameters
+        -----------
+        - column (str): the column
+
+        """
+        return self.stats.get(column, {})
@@ -0,0 +1,90 @@
+"""
+Cache of the table rows of each case, for comparing releases without querying QC-ETL again.
+Rows are cached per case, under a key made from the input json of the case, the report
+settings and the snapshot of every database the tables read from. A case whose input did not
+change since a previous report, run against the same QC-ETL refresh, is read from the cache.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+
+ROWS_VERSION = 3    # version of the rows of the tables, changed when rows gain or lose fields
+
+
+class ContextCache:
+    def __init__(self, directory: str, settings: Dict[str, Any], snapshots: List[Tuple[str, float]]) -> None:
+        """
+        Parameters
+        -----------
+        - directory (str): directory the cached rows are written to
+        - settings (dict): report settings that change the rows of a case (i.e. gamma, stage)
+        - snapshots (list[tuple]): snapshot of each database the tables read from, from get_snapshot
+
+        """
+        self.directory = directory
+        # hashed once, since it is part of the key of every case
+        self.prefix = json.dumps([ROWS_VERSION, settings, sorted(snapshots)], sort_keys=True)
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, case_input: Dict[str, Any]) -> str:
+        """
+        (dict) -> str
+
+        Returns the cache key of a case
+
+        Parameters
+        -----------
+        - case_input (dict): the input json of the case
+
+        """
+        key = self.prefix + json.dumps(case_input, sort_keys=True)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        """
+        (str) -> str
+
+        Returns the file the rows of key are cached in
+
+        Parameters
+        -----------
+        - key (str): cache key of a case
+
+        """
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, case_input: Dict[str, Any]) -> Optional[Dict[str, Dict[str, List[Dict]]]]:
+        """
+        (dict) -> dict | None
+
+        Returns the cached rows of a case, by section and table, or None if they are not cached
+
+        Parameters
+        -----------
+        - case_input (dict): the input json of the case
+
+        """
+        path = self.get_path(self.get_key(case_input))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, case_input: Dict[str, Any], rows: Dict[str, Dict[str, List[Dict]]]) -> None:
+        """
+        (dict, dict) -> None
+
+        Caches the rows of a case
+
+        Parameters
+        -----------
+        - case_input (dict): the input json of the case
+        - rows (dict): rows of the case, by section and table
+
+        """
+        path = self.get_path(self.get_key(case_input))
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(rows, f)
+        os.replace(temp_path, path)
@@ -0,0 +1,140 @@
+"""
+Comparison of the table rows of two releases.
+Rows are matched by the key of their table (the case and sample ID, the sample type, and
+the lims keys for lane level tables). Rows found in only one release are reported as added
+or removed, and the columns of matched rows whose values differ are reported with their delta.
+"""
+from typing import Any, Dict, List
+from tables import NUM_DP
+
+
+def format_key(key: tuple) -> str:
+    """
+    (tuple) -> str
+
+    Formats the key of a row for display
+
+    Parameters
+    -----------
+    - key (tuple): key of the row, from Table.get_row_key
+
+    """
+    return " / ".join(str(part) for part in key)
+
+
+def get_rows_by_key(table: Any, rows: Dict[str, List[Dict]]) -> Dict[tuple, Dict]:
+    """
+    (Table, dict) -> dict
+
+    Returns the rows of table by their key. Parts of the key that are not set are
+    written as "" so that keys can be sorted
+
+    Parameters
+    -----------
+    - table (Table): the table, used for its row keys
+    - rows (dict): rows of a release by case
+
+    """
+    keyed = {}
+    for case_rows in rows.values():
+        for row in case_rows:
+            key = tuple("" if part is None else str(part) for part in table.get_row_key(row))
+            if key in keyed:
+                raise Exception(f"Rows of {table.title} share the key {format_key(key)}")
+            keyed[key] = row
+    return keyed
+
+
+def get_delta(old: Any, new: Any) -> Any:
+    """
+    (Any, Any) -> Any
+
+    Returns the difference between two values of a column, or "" if they are not both numbers
+
+    Parameters
+    -----------
+    - old (Any): value in the old release
+    - new (Any): value in the new release
+
+    """
+    numbers = (int, float)
+    if isinstance(old, numbers) and isinstance(new, numbers) and not isinstance(old, bool):
+        return round(new - old, NUM_DP)
+    return ""
+
+
+def diff_table(table: Any, old_rows: Dict[str, List[Dict]], new_rows: Dict[str, List[Dict]]) -> Dict[str, Any]:
+    """
+    (Table, dict, dict) -> dict
+
+    Compares the rows of table in two releases
+
+    Parameters
+    -----------
+    - table (Table): the table, used for its headings and row keys
+    - old_rows (dict): rows of the old release by case
+    - new_rows (dict): rows of the new release by case
+
+    """
+    old = get_rows_by_key(table, old_rows)
+    new = get_rows_by_key(table, new_rows)
+
+    changed = []
+    for key in sorted(set(old) & set(new)):
+        for column, heading in table.headings.items():
+            if old[key].get(column) != new[key].get(column):
+                changed.append({
+                    "row": format_key(key),
+                    "column": heading,
+                    "old": old[key].get(column, ""),
+                    "new": new[key].get(column, ""),
+                    "delta": get_delta(old[key].get(column), new[key].get(column)),
+                })
+
+    return {
+        "title": table.title,
+        "added": [format_key(key) for key in sorted(set(new) - set(old))],
+        "removed": [format_key(key) for key in sorted(set(old) - set(new))],
+        "changed": changed,
+    }
+
+
+def diff_releases(sections: List[Any], old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    (list[Section], dict, dict) -> dict
+
+    Compares two releases and returns the context of the change report
+
+    Parameters
+    -----------
+    - sections (list[Section]): sections of the report, used for their tables
+    - old (dict): project, release and rows (by section, table class name and case) of the old release
+    - new (dict): project, release and rows (by section, table class name and case) of the new release
+
+    """
+    old_cases = set(case for section in old["rows"].values() for table in section.values() for case in table)
+    new_cases = set(case for section in new["rows"].values() for table in section.values() for case in table)
+
+    context = {
+        "old": {"project": old["project"], "release": old["release"]},
+        "new": {"project": new["project"], "release": new["release"]},
+        "cases": {
+            "added": sorted(new_cases - old_cases),
+            "removed": sorted(old_cases - new_cases),
+        },
+        "sections": {},
+    }
+    for section in sections:
+        tables = []
+        for table in section.tables:
+            key = type(table).__name__
+            for release in [old, new]:
+                if key not in release["rows"].get(section.name, {}):
+                    raise Exception(f"Release {release['release']} of {release['project']} has no rows for {key}")
+            tables.append(diff_table(
+                table,
+                old["rows"][section.name][key],
+                new["rows"][section.name][key],
+            ))
+        context["sections"][section.name] = {"title": section.title, "tables": tables}
+    return context
@@ -0,0 +1,203 @@
+"""
+Machine-readable export of the rows of the report tables.
+Each table is written once all of its rows are loaded, before the next table is queried, to one
+file per format named after its section and table (i.e. raw_seq_data.WGLaneLevelTable.csv). When lanes are rolled up by run, the
+rows of each lane are also written, i.e. to raw_seq_data.WGLaneLevelTable.lanes.csv. Columns are
+named as in table_columns.py. Values are written as they appear in the report, with every percentage
+between 0 and 100, except that "nd" (no data) is written as an empty value. Parquet columns are
+typed from their values, and columns mixing numbers and text are written as text. schema.json
+lists the files with the heading and unit of each column.
+"""
+from typing import Any, Dict, List
+from contextlib import ExitStack
+import csv
+import json
+import os
+from table_columns import CommonColumns
+
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+NO_DATA = "nd"
+
+
+class TableExport:
+    def __init__(self, directory: str, formats: List[str]=None) -> None:
+        """
+        Parameters
+        -----------
+        - directory (str): directory the files are written to
+        - formats (list[str]): formats to write, from EXPORT_FORMATS. All formats if None
+
+        """
+        self.directory = directory
+        self.formats = formats if formats else EXPORT_FORMATS
+        for format in self.formats:
+            if format not in EXPORT_FORMATS:
+                raise Exception(f"Unknown export format {format}, expected one of {', '.join(EXPORT_FORMATS)}")
+        if "parquet" in self.formats:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise Exception("pyarrow is required to export Parquet files, install it with pip install pyarrow")
+            self.pyarrow = pyarrow
+        self.schema = {}    # Dict[name of the exported table, its title, files and columns]
+        os.makedirs(directory, exist_ok=True)
+
+    def get_columns(self, table: Any, rows: List[Dict[str, Any]]) -> List[str]:
+        """
+        (Table, list[dict]) -> list[str]
+
+        Returns the columns of table to export: the columns of the report table found in its
+        rows, followed by the other columns of its rows (i.e. the source of lane level rows)
+        and the outlier flags
+
+        Parameters
+        -----------
+        - table (Table): the table being exported
+        - rows (list[dict]): rows of the table
+
+        """
+        present = set(column for row in rows for column in row.keys())
+        columns = [column for column in table.headings.keys() if column in present or not rows]
+        for row in rows:
+            for column in row.keys():
+                if column not in columns and column != CommonColumns.Outliers:
+                    columns.append(column)
+        return columns + [CommonColumns.Outliers]
+
+    def get_unit(self, table: Any, column: str) -> str:
+        """
+        (Table, str) -> str
+
+        Returns the unit of a column of table, or None if it has none
+
+        Parameters
+        -----------
+        - table (Table): the table being exported
+        - column (str): name of the column
+
+        """
+        if column in table.pct_stats or "(%)" in table.headings.get(column, ""):
+            return "percent"
+        return None
+
+    def get_value(self, row: Dict[str, Any], column: str) -> Any:
+        """
+        (dict, str) -> Any
+
+        Returns the value of column in row to export
+
+        Parameters
+        -----------
+        - row (dict): a row of the table
+        - column (str): name of the column
+
+        """
+        value = row.get(column)
+        if column == CommonColumns.Outliers:
+            return ";".join(value) if value else ""
+        return None if value == NO_DATA else value
+
+    def get_parquet_table(self, columns: List[str], values: Dict[str, List[Any]]) -> Any:
+        """
+        (list[str], dict) -> pyarrow.Table
+
+        Returns the Parquet table of the values of each column, with an explicit schema. A column
+        whose values are all booleans, integers or numbers has that type, and any other column is
+        text, with its numbers written as text
+
+        Parameters
+        -----------
+        - columns (list[str]): names of the columns, in order
+        - values (dict): values of each column, with None for missing values
+
+        """
+        pyarrow = self.pyarrow
+        fields = []
+        arrays = []
+        for column in columns:
+            present = [value for value in values[column] if value is not None]
+            column_values = values[column]
+            if present and all(isinstance(value, bool) for value in present):
+                column_type = pyarrow.bool_()
+            elif present and all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+                column_type = pyarrow.int64()
+            elif present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+                column_type = pyarrow.float64()
+            else:
+                column_type = pyarrow.string()
+                column_values = [None if value is None else str(value) for value in column_values]
+            fields.append(pyarrow.field(column, column_type))
+            arrays.append(pyarrow.array(column_values, type=column_type))
+        return pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+    def write_table(self, section: Any, table: Any, data: List[Dict[str, List[Dict]]], detail: str=None) -> None:
+        """
+        (Section, Table, list[dict], str) -> None
+
+        Writes the rows of table in each export format, once get_data has returned all of them.
+        The Parquet table is converted first, so a value it cannot hold fails before any file
+        is written. CSV and JSON Lines rows are then written one at a time
+
+        Parameters
+        -----------
+        - section (Section): the section of the table
+        - table (Table): the table being exported
+        - data (list[dict]): rows of the table by case, as returned by get_data
+        - detail (str): name of the detail rows being written (i.e. lanes), added to the file names.
+                        None for the rows of the report table
+
+        """
+        name = f"{section.name}.{type(table).__name__}" + (f".{detail}" if detail else "")
+        rows = [row for entry in data for case_rows in entry.values() for row in case_rows]
+        columns = self.get_columns(table, rows)
+
+        row_values = [[self.get_value(row, column) for column in columns] for row in rows]
+        parquet_table = None
+        if "parquet" in self.formats:
+            parquet_table = self.get_parquet_table(
+                columns,
+                {column: [values[index] for values in row_values] for index, column in enumerate(columns)}
+            )
+
+        with ExitStack() as stack:
+            handles = {}
+            writers = {}
+            if "csv" in self.formats:
+                handles["csv"] = stack.enter_context(open(os.path.join(self.directory, f"{name}.csv"), "w", newline=""))
+                writers["csv"] = csv.writer(handles["csv"])
+                writers["csv"].writerow(columns)
+            if "jsonl" in self.formats:
+                handles["jsonl"] = stack.enter_context(open(os.path.join(self.directory, f"{name}.jsonl"), "w"))
+            for values in row_values:
+                if "csv" in writers:
+                    writers["csv"].writerow(["" if value is None else value for value in values])
+                if "jsonl" in handles:
+                    handles["jsonl"].write(json.dumps(dict(zip(columns, values))) + "\n")
+        if parquet_table is not None:
+            self.pyarrow.parquet.write_table(parquet_table, os.path.join(self.directory, f"{name}.parquet"))
+
+        self.schema[name] = {
+            "section": section.name,
+            "title": table.title,
+            "files": [f"{name}.{format}" for format in self.formats],
+            "rows": len(rows),
+            "columns": [
+                {
+                    "name": column,
+                    "heading": table.headings.get(column, ""),
+                    "unit": self.get_unit(table, column),
+                }
+                for column in columns
+            ],
+        }
+
+    def close(self) -> None:
+        """
+        None -> None
+
+        Writes schema.json, listing the exported tables
+        """
+        with open(os.path.join(self.directory, "schema.json"), "w") as f:
+            json.dump(self.schema, f, indent=4)
+        print(f"Exported {len(self.schema)} tables to {self.directory}")
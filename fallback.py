@@ -0,0 +1,332 @@
+"""
+Fallback for workflow runs that QC-ETL has not analysed yet.
+When an analysis table has no row for a workflow run, its output file (a Mutect2 or Delly VCF,
+or RSEM genes.results) is found in a local file index and the columns of the table are computed
+from the file itself. The file index is a tab separated file (optionally gzipped) with a header,
+such as the file provenance report, of which the "Workflow Run SWID" and "File Path" columns
+are used.
+Files are parsed as streams, several at a time in a process pool, and the values computed for
+each file are cached under its checksum, so a file is only parsed again if it changes.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import gzip
+import hashlib
+import json
+import os
+import numpy
+
+CHUNK_SIZE = 1 << 20    # bytes read at a time when computing checksums
+TRANSITIONS = set([("A", "G"), ("G", "A"), ("C", "T"), ("T", "C")])
+SV_TYPES = ["BND", "DEL", "DUP", "INS", "INV"]
+RSEM_QUANTILES = [0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95]    # TPM quantiles of analysis_rsem
+RSEM_CHUNK_LINES = 10000    # lines of a genes.results file parsed at a time
+
+
+def open_text(path: str) -> Any:
+    """
+    (str) -> file
+
+    Opens the text file at path for reading, decompressing it if it is gzipped (or bgzipped)
+
+    Parameters
+    -----------
+    - path (str): path of the file
+
+    """
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def get_checksum(path: str) -> str:
+    """
+    (str) -> str
+
+    Returns the sha1 checksum of the file at path
+
+    Parameters
+    -----------
+    - path (str): path of the file
+
+    """
+    checksum = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def read_vcf(path: str) -> Iterator[List[str]]:
+    """
+    (str) -> iterator[list[str]]
+
+    Yields the CHROM, POS, ID, REF, ALT, QUAL, FILTER and INFO fields of each record of the
+    VCF at path. The sample columns are not split
+
+    Parameters
+    -----------
+    - path (str): path of the VCF, plain or (b)gzipped
+
+    """
+    with open_text(path) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            yield line.rstrip("\n").split("\t", 8)[:8]
+
+
+def count_mutect2_calls(path: str) -> Dict[str, Any]:
+    """
+    (str) -> dict
+
+    Returns the columns of analysis_mutect2 computed from a Mutect2 VCF: the number of calls,
+    of PASS calls, of PASS SNPs and indels, and the transition to transversion ratio of the
+    PASS SNPs (None if there is no transversion)
+
+    Parameters
+    -----------
+    - path (str): path of the VCF, plain or (b)gzipped
+
+    """
+    calls = passed = snps = indels = transitions = transversions = 0
+    for fields in read_vcf(path):
+        calls += 1
+        if fields[6] != "PASS":
+            continue
+        passed += 1
+        ref = fields[3]
+        alts = fields[4].split(",")
+        if len(ref) == 1 and all(len(alt) == 1 for alt in alts):
+            snps += 1
+            for alt in alts:
+                if (ref.upper(), alt.upper()) in TRANSITIONS:
+                    transitions += 1
+                else:
+                    transversions += 1
+        elif any(len(alt) != len(ref) for alt in alts):
+            indels += 1
+    return {
+        "num_calls": calls,
+        "num_PASS": passed,
+        "num_SNPs": snps,
+        "num_indels": indels,
+        "titv_ratio": transitions / transversions if transversions else None,
+    }
+
+
+def count_delly_calls(path: str) -> Dict[str, Any]:
+    """
+    (str) -> dict
+
+    Returns the columns of analysis_delly computed from a Delly VCF: the number of calls,
+    of PASS calls, and of PASS calls of each structural variant type
+
+    Parameters
+    -----------
+    - path (str): path of the VCF, plain or (b)gzipped
+
+    """
+    counts = {f"num_{sv_type}": 0 for sv_type in SV_TYPES}
+    calls = passed = 0
+    for fields in read_vcf(path):
+        calls += 1
+        if fields[6] != "PASS":
+            continue
+        passed += 1
+        for info in fields[7].split(";"):
+            if info.startswith("SVTYPE="):
+                key = f"num_{info[len('SVTYPE='):]}"
+                if key in counts:
+                    counts[key] += 1
+                break
+    return {"num_calls": calls, "num_PASS": passed, **counts}
+
+
+def summarize_rsem_genes(path: str) -> Dict[str, Any]:
+    """
+    (str) -> dict
+
+    Returns the columns of analysis_rsem computed from an RSEM genes.results file: the number
+    of genes, the fraction of genes with a non-zero TPM and the quantiles of the TPM of all genes.
+    The TPM column is parsed with NumPy a chunk of lines at a time, and quantiles are exact
+
+    Parameters
+    -----------
+    - path (str): path of the genes.results file, plain or gzipped
+
+    """
+    chunks = []
+    with open_text(path) as f:
+        header = f.readline().rstrip("\n").split("\t")
+        if "TPM" not in header:
+            raise Exception(f"{path} has no TPM column")
+        tpm_index = header.index("TPM")
+        while True:
+            lines = list(islice(f, RSEM_CHUNK_LINES))
+            if not lines:
+                break
+            chunks.append(numpy.fromiter(
+                (float(line.split("\t")[tpm_index]) for line in lines if line.strip()),
+                dtype=numpy.float64
+            ))
+    tpm = numpy.concatenate(chunks) if chunks else numpy.empty(0)
+    if not len(tpm):
+        raise Exception(f"{path} has no genes")
+    quantiles = numpy.quantile(tpm, RSEM_QUANTILES)
+    return {
+        "total": int(len(tpm)),
+        "pct_non_zero": float(numpy.count_nonzero(tpm) / len(tpm)),
+        **{f"Q{q}": float(value) for q, value in zip(RSEM_QUANTILES, quantiles)},
+    }
+
+
+# name of each fallback, with the function computing the columns of a file and the
+# suffixes of the files it reads, in order of preference
+ENGINES: Dict[str, Tuple[Callable[[str], Dict[str, Any]], List[str]]] = {
+    "mutect2": (count_mutect2_calls, [".vcf.gz", ".vcf"]),
+    "delly": (count_delly_calls, [".vcf.gz", ".vcf"]),
+    "rsem": (summarize_rsem_genes, [".genes.results", ".genes.results.gz"]),
+}
+
+
+def run_engine(engine: str, path: str, cache_dir: str) -> Dict[str, Any]:
+    """
+    (str, str, str) -> dict
+
+    Returns the columns computed by engine from the file at path, from the cache if the file
+    was already parsed, otherwise parsing it and caching the result. Run in the process pool
+
+    Parameters
+    -----------
+    - engine (str): name of the fallback, in ENGINES
+    - path (str): path of the file
+    - cache_dir (str): directory of the cached results
+
+    """
+    cache_path = os.path.join(cache_dir, f"{engine}.{get_checksum(path)}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+    values = ENGINES[engine][0](path)
+    #written next to its final path then moved, so a parallel run never reads a partial file
+    with open(cache_path + f".{os.getpid()}", "w") as f:
+        json.dump(values, f)
+    os.replace(cache_path + f".{os.getpid()}", cache_path)
+    return values
+
+
+# FileIndex class maps workflow runs to their output files, read from a file provenance report
+class FileIndex:
+    def __init__(self, path: str) -> None:
+        """
+        Parameters
+        -----------
+        - path (str): path of the index, a tab separated file with "Workflow Run SWID"
+                      and "File Path" columns
+
+        """
+        self.path = path
+        self.files = None   # Dict[workflow run SWID, list of file paths], read on first use
+
+    def load(self) -> Dict[str, List[str]]:
+        """
+        None -> dict[str, list[str]]
+
+        Returns the files of every workflow run of the index, reading it the first time
+        """
+        if self.files is None:
+            self.files = {}
+            with open_text(self.path) as f:
+                header = f.readline().rstrip("\n").split("\t")
+                for column in ["Workflow Run SWID", "File Path"]:
+                    if column not in header:
+                        raise Exception(f"File index {self.path} has no {column} column")
+                swid_index = header.index("Workflow Run SWID")
+                path_index = header.index("File Path")
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) > max(swid_index, path_index):
+                        self.files.setdefault(fields[swid_index], []).append(fields[path_index])
+        return self.files
+
+    def get_file(self, swid: str, suffixes: List[str]) -> Optional[str]:
+        """
+        (str, list[str]) -> str | None
+
+        Returns the file of the workflow run swid with the first of suffixes that it has a
+        file with, or None if it has none
+
+        Parameters
+        -----------
+        - swid (str): the workflow run SWID
+        - suffixes (list[str]): suffixes of the files to look for, in order of preference
+
+        """
+        files = self.load().get(str(swid), [])
+        for suffix in suffixes:
+            for path in files:
+                if path.endswith(suffix):
+                    return path
+        return None
+
+
+# FileFallback class computes the columns of analysis tables from the output files of
+# workflow runs missing from QC-ETL
+class FileFallback:
+    def __init__(self, index_path: str, cache_dir: str, workers: int=None) -> None:
+        """
+        Parameters
+        -----------
+        - index_path (str): path of the file index
+        - cache_dir (str): directory the results computed for each file are cached in
+        - workers (int): number of files parsed at once. Defaults to the number of CPUs
+
+        """
+        self.index = FileIndex(index_path)
+        self.cache_dir = cache_dir
+        self.workers = workers
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_values(self, engine: str, swids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        (str, list[str]) -> dict[str, dict]
+
+        Returns the columns computed by engine for each workflow run of swids that has an output
+        file in the index, by the name of the column in QC-ETL. Files are parsed in parallel.
+        Workflow runs without a file, or whose file cannot be parsed, are left out
+
+        Parameters
+        -----------
+        - engine (str): name of the fallback, in ENGINES
+        - swids (list[str]): the workflow runs missing from QC-ETL
+
+        """
+        if engine not in ENGINES:
+            raise Exception(f"Unknown fallback {engine}, expected one of {', '.join(ENGINES)}")
+        paths = {}
+        for swid in swids:
+            path = self.index.get_file(swid, ENGINES[engine][1])
+            if path:
+                paths[swid] = path
+            else:
+                print(f"No {engine} file found in {self.index.path} for Workflow Run SWID = {swid}")
+        if not paths:
+            return {}
+
+        values = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                swid: pool.submit(run_engine, engine, path, self.cache_dir)
+                for swid, path in paths.items()
+            }
+            for swid, future in futures.items():
+                try:
+                    values[swid] = future.result()
+                    print(f"Computed {engine} values for Workflow Run SWID = {swid} from {paths[swid]}")
+                except Exception as e:
+                    print(f"Could not compute {engine} values from {paths[swid]}: {e}")
+        return values
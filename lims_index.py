@@ -0,0 +1,123 @@
+"""
+Canonical index of the merged lims keys of call ready alignments.
+The "Merged Pinery Lims ID" column holds a serialized list of lims keys whose exact
+formatting (whitespace, quoting) is not guaranteed. Every value of the column is
+parsed once per database snapshot and indexed by a hash of its sorted set of keys,
+so the rows of a set of lims keys can be looked up regardless of how they were written.
+Only the index of the latest snapshot of each column is kept, so a long-running process
+holds one index per column however many times QC-ETL is refreshed.
+"""
+from typing import Callable, List, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+
+LIMS_KEY = re.compile(r"[^\[\]\"',\s]+") # a lims key inside a serialized list of lims keys
+
+_indexes = {}   # Dict[(db, table, column), (snapshot, LimsSetIndex)], shared by all reports in the process
+_indexes_lock = threading.Lock()    # held while an index is looked up or built, so it is built once
+
+
+def parse_lims_keys(value: str) -> List[str]:
+    """
+    (str) -> list[str]
+
+    Parses a serialized list of lims keys
+
+    Parameters
+    -----------
+    - value (str): value of a merged lims key column, e.g. '["a", "b"]'
+
+    """
+    try:
+        keys = json.loads(value)
+        if isinstance(keys, list):
+            return [str(key).strip() for key in keys]
+    except (TypeError, ValueError):
+        pass
+    return LIMS_KEY.findall(str(value))
+
+
+def get_lims_set_hash(lims_keys: List[str]) -> str:
+    """
+    (list[str]) -> str
+
+    Returns the hash of the sorted set of lims_keys
+
+    Parameters
+    -----------
+    - lims_keys (list[str]): lims keys in any order
+
+    """
+    canonical = "\n".join(sorted(set(key.strip() for key in lims_keys)))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def get_snapshot(db_path: str) -> Tuple[str, float]:
+    """
+    (str) -> (str, float)
+
+    Identifies the snapshot of the database at db_path. "latest" is a link that moves
+    with each QC-ETL refresh, so the snapshot is the file it resolves to and its
+    modification time
+
+    Parameters
+    -----------
+    - db_path (str): path to the database
+
+    """
+    path = os.path.realpath(db_path)
+    return path, os.path.getmtime(path)
+
+
+class LimsSetIndex:
+    def __init__(self, values: List[str]) -> None:
+        self.index = {}     # Dict[hash of the set of lims keys, list of column values with that set]
+        for value in values:
+            set_hash = get_lims_set_hash(parse_lims_keys(value))
+            self.index.setdefault(set_hash, []).append(value)
+
+    def lookup(self, lims_keys: List[str]) -> List[str]:
+        """
+        (list[str]) -> list[str]
+
+        Returns the column values that hold exactly the set of lims_keys
+
+        Parameters
+        -----------
+        - lims_keys (list[str]): lims keys in any order
+
+        """
+        return self.index.get(get_lims_set_hash(lims_keys), [])
+
+
+def get_lims_set_index(
+    db: str,
+    snapshot: Tuple[str, float],
+    table: str,
+    column: str,
+    load_values: Callable[[], List[str]]
+) -> LimsSetIndex:
+    """
+    (str, tuple, str, str, function) -> LimsSetIndex
+
+    Returns the index of column in table for snapshot, building it from the values
+    returned by load_values the first time the snapshot is seen. The index replaces
+    the one of the previous snapshot of the column
+
+    Parameters
+    -----------
+    - db (str): name of the database of table
+    - snapshot (tuple): the database snapshot, from get_snapshot
+    - table (str): name of the table being indexed
+    - column (str): name of the merged lims key column
+    - load_values (function): returns every distinct value of column in table
+
+    """
+    key = (db, table, column)
+    with _indexes_lock:
+        if key not in _indexes or _indexes[key][0] != snapshot:
+            _indexes[key] = (snapshot, LimsSetIndex(load_values()))
+        return _indexes[key][1]
@@ -0,0 +1,299 @@
+"""
+Report mart: one local SQLite database holding everything the report tables read.
+The mart is built once after each QC-ETL refresh. For every source table of the report it
+keeps only the key and sample metadata columns and the columns of the `columns` dicts of the
+tables, with derived columns (such as mapped reads, 1 - unmapped / total) computed once and
+stored under the name of the table column. Key columns are normalized and indexed, so a
+report reading from the mart runs indexed lookups against one small file.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import shutil
+import sqlite3
+from lims_index import get_snapshot, parse_lims_keys
+
+KEY_COLUMNS = ["Workflow Run SWID", "Pinery Lims ID", "Merged Pinery Lims ID"]   # columns rows are looked up by
+# key columns holding a serialized list of lims keys, rewritten by normalize_lims_keys. Whitespace
+# is stripped once from the other key columns when the mart is built
+LIMS_SET_COLUMNS = ["Merged Pinery Lims ID"]
+# columns read by the tables outside of their columns dicts: the sample ID and the sequenza gamma and FGA
+METADATA_COLUMNS = ["Tissue Type", "Tissue Origin", "Library Design", "Group ID", "gamma", "fga"]
+SOURCES_TABLE = "mart_sources"  # QC-ETL snapshot each source database was copied from, and the gamma of the mart
+# Parquet type of the columns whose declared SQLite type contains each name, checked in order as SQLite
+# does for type affinity. Columns matching none of them (i.e. computed columns) are typed from their values
+PARQUET_AFFINITIES = [
+    ("INT", "int64"),
+    ("CHAR", "string"),
+    ("CLOB", "string"),
+    ("TEXT", "string"),
+    ("REAL", "float64"),
+    ("FLOA", "float64"),
+    ("DOUB", "float64"),
+]
+
+
+def normalize_key(value: Any) -> Any:
+    """
+    (Any) -> Any
+
+    Strips the whitespace around a key
+
+    Parameters
+    -----------
+    - value (Any): value of a key column
+
+    """
+    return value.strip() if isinstance(value, str) else value
+
+
+def normalize_lims_keys(value: Any) -> Any:
+    """
+    (Any) -> Any
+
+    Rewrites a serialized list of lims keys as the sorted json list of its keys, so the
+    same set of lims keys is always written the same way
+
+    Parameters
+    -----------
+    - value (Any): value of a merged lims key column
+
+    """
+    if value is None:
+        return None
+    return json.dumps(sorted(set(parse_lims_keys(value))))
+
+
+def get_source_columns(tables: List[Any]) -> Dict[Tuple[str, str], Dict[str, str]]:
+    """
+    (list[Table]) -> dict[(str, str), dict[str, str]]
+
+    Returns the columns of each source table read by tables, as (database, table): {column name:
+    SQL expression}. The columns of a table are selected from its first source table, or from
+    each of them when they are alternative sources in different databases (i.e. dnaseqqc and
+    bamqc4). Other source tables (i.e. the sequenza FGA) are only joined for their metadata.
+    Raises an exception if two tables give the same column different expressions
+
+    Parameters
+    -----------
+    - tables (list[Table]): the tables of the report
+
+    """
+    sources = {}
+    for table in tables:
+        source_dbs = table.source_db if isinstance(table.source_db, list) else [table.source_db] * len(table.source_table)
+        for index, (source_db, source_table) in enumerate(zip(source_dbs, table.source_table)):
+            columns = sources.setdefault((source_db, source_table), {})
+            if index > 0 and not isinstance(table.source_db, list):
+                continue
+            for name, expression in table.columns.items():
+                if columns.get(name, expression) != expression:
+                    raise Exception(f"Column {name} of {source_table} is defined differently by {type(table).__name__}")
+                columns[name] = expression
+    return sources
+
+
+def copy_table(con: sqlite3.Connection, source_table: str, columns: Dict[str, str]) -> int:
+    """
+    (sqlite3.Connection, str, dict) -> int
+
+    Copies source_table from the attached source database into the mart, with its key and metadata
+    columns and the columns computed from their expressions. Returns the number of rows copied
+
+    Parameters
+    -----------
+    - con (sqlite3.Connection): connection to the mart, with the source database attached as source
+    - source_table (str): name of the table being copied
+    - columns (dict): name and SQL expression of each column read by the tables
+
+    """
+    available = [row[1] for row in con.execute(f'pragma source.table_info("{source_table}");')]
+    if not available:
+        raise Exception(f"Table {source_table} not found")
+
+    select = []
+    for column in KEY_COLUMNS:
+        if column in LIMS_SET_COLUMNS and column in available:
+            select.append(f'normalize_lims_keys("{column}") as "{column}"')
+        elif column in available:
+            select.append(f'normalize_key("{column}") as "{column}"')
+    select += [f'"{column}"' for column in METADATA_COLUMNS if column in available]
+    select += [f'{expression} as "{name}"' for name, expression in columns.items()]
+
+    con.execute(f'create table "{source_table}" as select {", ".join(select)} from source."{source_table}";')
+    for column in KEY_COLUMNS:
+        if column in available:
+            con.execute(f'create index "{source_table}.{column}" on "{source_table}" ("{column}");')
+    return con.execute(f'select count(*) from "{source_table}";').fetchone()[0]
+
+
+def build_mart(tables: List[Any], base_db_path: str, path: str, gamma: int) -> None:
+    """
+    (list[Table], str, str, int) -> None
+
+    Builds the report mart of tables at path from the QC-ETL databases under base_db_path.
+    The mart is written next to path and moved into place once complete, so reports
+    reading the previous mart are not disturbed. The sequenza gamma the mart is built
+    for is recorded with each source database
+
+    Parameters
+    -----------
+    - tables (list[Table]): the tables of the report
+    - base_db_path (str): directory of the QC-ETL databases
+    - path (str): path of the mart
+    - gamma (int): the sequenza gamma setting the mart is built for
+
+    """
+    building = path + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+    con = sqlite3.connect(building)
+    con.create_function("normalize_key", 1, normalize_key, deterministic=True)
+    con.create_function("normalize_lims_keys", 1, normalize_lims_keys, deterministic=True)
+    con.execute(f'create table {SOURCES_TABLE} (source_db text, path text, mtime real, gamma real);')
+
+    sources = get_source_columns(tables)
+    for source_db in dict.fromkeys(source_db for source_db, _ in sources):
+        db_path = base_db_path + source_db + "/latest"
+        snapshot_path, mtime = get_snapshot(db_path)
+        con.execute("attach database ? as source;", (snapshot_path,))
+        for (db, source_table), columns in sources.items():
+            if db == source_db:
+                count = copy_table(con, source_table, columns)
+                print(f"Copied {count} rows of {source_table}")
+        con.commit()
+        con.execute("detach database source;")
+        con.execute(f"insert into {SOURCES_TABLE} values (?, ?, ?, ?);", (source_db, snapshot_path, mtime, float(gamma)))
+
+    con.commit()
+    con.execute("analyze;")
+    con.close()
+    os.replace(building, path)
+    print(f"Created report mart {path}")
+
+
+def get_stale_sources(path: str, base_db_path: str) -> List[str]:
+    """
+    (str, str) -> list[str]
+
+    Returns the source databases that were refreshed in QC-ETL since the mart at path was built
+
+    Parameters
+    -----------
+    - path (str): path of the mart
+    - base_db_path (str): directory of the QC-ETL databases
+
+    """
+    con = sqlite3.connect(path)
+    sources = con.execute(f"select source_db, path, mtime from {SOURCES_TABLE};").fetchall()
+    con.close()
+    stale = []
+    for source_db, snapshot_path, mtime in sources:
+        db_path = base_db_path + source_db + "/latest"
+        if os.path.exists(db_path) and get_snapshot(db_path) != (snapshot_path, mtime):
+            stale.append(source_db)
+    return stale
+
+
+def get_mart_gamma(path: str) -> Optional[float]:
+    """
+    (str) -> float
+
+    Returns the sequenza gamma the mart at path was built for, or None if the mart
+    does not record it
+
+    Parameters
+    -----------
+    - path (str): path of the mart
+
+    """
+    con = sqlite3.connect(path)
+    columns = [row[1] for row in con.execute(f"pragma table_info({SOURCES_TABLE});")]
+    gammas = con.execute(f"select distinct gamma from {SOURCES_TABLE};").fetchall() if "gamma" in columns else []
+    con.close()
+    return gammas[0][0] if gammas else None
+
+
+def get_parquet_type(declared: str, values: List[Any]) -> str:
+    """
+    (str, list) -> str
+
+    Returns the name of the pyarrow type a column of the mart is exported as: int64, float64
+    or string. The type follows the declared SQLite type of the column, or its values if it has
+    none. SQLite lets a column hold values of any type, so a column holding a real number is
+    float64 and a column holding any text is string. A column with no type nor values is string
+
+    Parameters
+    -----------
+    - declared (str): declared SQLite type of the column, as returned by pragma table_info
+    - values (list): values of the column, with None for missing values
+
+    """
+    column_type = None
+    for affinity, name in PARQUET_AFFINITIES:
+        if affinity in declared.upper():
+            column_type = name
+            break
+    present = [value for value in values if value is not None]
+    if column_type == "string" or any(not isinstance(value, (int, float)) for value in present):
+        return "string"
+    if column_type == "float64" or any(isinstance(value, float) for value in present):
+        return "float64"
+    if column_type == "int64" or present:
+        return "int64"
+    return "string"
+
+
+def export_parquet(path: str, directory: str) -> None:
+    """
+    (str, str) -> None
+
+    Exports every table of the mart at path to directory, as one Parquet file per table.
+    Each file has an explicit schema, with the column types given by get_parquet_type.
+    The export is written next to directory and replaces it once complete
+
+    Parameters
+    -----------
+    - path (str): path of the mart
+    - directory (str): directory of the Parquet files
+
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("pyarrow is required to export Parquet files, install it with pip install pyarrow")
+
+    directory = directory.rstrip("/")
+    building = directory + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    con = sqlite3.connect(path)
+    tables = [row[0] for row in con.execute("select name from sqlite_master where type = 'table';")]
+    for table in tables:
+        declared = {row[1]: row[2] for row in con.execute(f'pragma table_info("{table}");')}
+        cur = con.execute(f'select * from "{table}";')
+        names = [column[0] for column in cur.description]
+        rows = cur.fetchall()
+        fields = []
+        arrays = []
+        for index, name in enumerate(names):
+            values = [row[index] for row in rows]
+            column_type = get_parquet_type(declared[name], values)
+            if column_type == "string":
+                values = [None if value is None else str(value) for value in values]
+            fields.append(pyarrow.field(name, getattr(pyarrow, column_type)()))
+            arrays.append(pyarrow.array(values, type=fields[-1].type))
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields)),
+            os.path.join(building, f"{table}.parquet")
+        )
+    con.close()
+
+    previous = directory + ".previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, previous)
+    os.rename(building, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+    print(f"Exported report mart to {directory}")
@@ -0,0 +1,174 @@
+"""
+Output profiles, which trade the size of the report against the quality of its images.
+A profile sets the resolution and encoding of the plots and how far the logo is downsampled
+before the images are embedded in the report:
+- draft: low resolution plots with a reduced palette and a small logo, for quick review
+- standard: the plots and logo as they have always been rendered
+- archival: vector plots and the full resolution logo
+- interactive: an HTML report whose plots are drawn in the browser from their data, with
+  the sample ID of each point shown on hover. No images are rendered
+"""
+from typing import Any, Dict
+from functools import lru_cache
+import base64
+import io
+import os
+from PIL import Image
+
+PROFILES = {
+    "draft": {
+        "dpi": 50,          # resolution of raster plots
+        "format": "png",    # png, jpeg, webp or svg
+        "colors": 16,       # number of colours raster plots are quantized to, all if None
+        "quality": 75,      # quality of jpeg and webp plots
+        "logo_width": 400,  # width the logo is downsampled to, in pixels. Not downsampled if None
+    },
+    "standard": {
+        "dpi": 80,
+        "format": "png",
+        "colors": None,
+        "quality": 90,
+        "logo_width": None,
+    },
+    "archival": {
+        "dpi": 80,
+        "format": "svg",
+        "colors": None,
+        "quality": 95,
+        "logo_width": None,
+    },
+    "interactive": {
+        "dpi": None,
+        "format": "html",   # plots embedded as data and drawn by the bundled script
+        "colors": None,
+        "quality": None,
+        "logo_width": 400,  # embedded, so the report is a single file
+    },
+}
+DEFAULT_PROFILE = "standard"
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+LOGO = "static/images/OICR_Logo_RGB_ENGLISH.png"   # relative to the report template
+STYLESHEET = "static/css/style.css"
+PLOT_SCRIPT = "static/js/plots.js"                  # draws the plots of interactive reports
+
+
+def get_profile(name: str=None) -> Dict[str, Any]:
+    """
+    (str) -> dict
+
+    Returns the settings of the output profile name
+
+    Parameters
+    -----------
+    - name (str): name of the profile. Defaults to the standard profile
+
+    """
+    if name is None:
+        name = DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise Exception(f"Unknown output profile {name}, expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def is_interactive(profile: Dict[str, Any]) -> bool:
+    """
+    (dict) -> bool
+
+    Returns True if reports of profile are HTML with plots drawn in the browser, instead of PDF
+
+    Parameters
+    -----------
+    - profile (dict): settings of the output profile
+
+    """
+    return profile["format"] == "html"
+
+
+def to_data_uri(image: bytes, format: str) -> str:
+    """
+    (bytes, str) -> str
+
+    Returns image as a data URI that can be embedded in the report
+
+    Parameters
+    -----------
+    - image (bytes): the encoded image
+    - format (str): format image is encoded in
+
+    """
+    return f"data:{MIME_TYPES[format]};base64," + base64.b64encode(image).decode("ascii")
+
+
+def encode_image(png: bytes, profile: Dict[str, Any]) -> bytes:
+    """
+    (bytes, dict) -> bytes
+
+    Re-encodes a PNG in the raster format of profile, reducing its palette if the profile
+    asks for it. PNGs that need no change are returned as they are
+
+    Parameters
+    -----------
+    - png (bytes): the PNG to encode
+    - profile (dict): settings of the output profile
+
+    """
+    if profile["format"] == "png" and not profile["colors"]:
+        return png
+    image = Image.open(io.BytesIO(png))
+    if profile["format"] == "jpeg":
+        image = image.convert("RGB")
+    if profile["colors"]:
+        image = image.convert("RGB").quantize(colors=profile["colors"])
+        if profile["format"] == "jpeg":
+            image = image.convert("RGB")
+    buffer = io.BytesIO()
+    if profile["format"] == "png":
+        image.save(buffer, format="png", optimize=True)
+    else:
+        image.save(buffer, format=profile["format"], quality=profile["quality"])
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+def get_logo(width: int=None) -> Dict[str, Any]:
+    """
+    (int) -> dict
+
+    Returns the source of the logo to use in the report, and the width to display it at.
+    The logo is downsampled to width pixels and embedded as a data URI, but keeps the
+    width it is displayed at so the layout of the header does not change
+
+    Parameters
+    -----------
+    - width (int): width to downsample the logo to. The logo file is used as is if None
+
+    """
+    if width is None:
+        return {"src": f"./{LOGO}", "width": None}
+    image = Image.open(os.path.join(os.path.dirname(__file__), LOGO))
+    display_width = image.width
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="png", optimize=True)
+    return {"src": to_data_uri(buffer.getvalue(), "png"), "width": display_width}
+
+
+@lru_cache(maxsize=None)
+def get_interactive_assets() -> Dict[str, str]:
+    """
+    None -> dict
+
+    Returns the stylesheet and plot script embedded in interactive reports, so the report
+    is a single file that can be opened offline. Read once per process
+    """
+    assets = {}
+    for name, path in [("style", STYLESHEET), ("script", PLOT_SCRIPT)]:
+        with open(os.path.join(os.path.dirname(__file__), path)) as f:
+            assets[name] = f.read()
+    return assets
@@ -1,16 +1,131 @@
 from typing import Dict, Type, List, Callable, Union, Tuple, Set, Any
+from array import array
+import io
+import json
+import math
 import pandas as pd
 import matplotlib.pyplot as plt
+import numpy
 from numpy import median
 import time
 import os
+import threading
+from cohort_stats import COHORT
+from output_profile import get_profile, encode_image, to_data_uri, is_interactive
+
+# Labels class interns the x-axis labels (usually Sample IDs) of a plot, so each
+# data point stores the index of its label instead of the label itself
+class Labels:
+    def __init__(self) -> None:
+        self.names = []     # labels in the order they were first seen
+        self.index = {}     # Dict[label, index of label in self.names]
+
+    def intern(self, name: str) -> int:
+        """
+        (str) -> int
+
+        Returns the index of name, adding it if it has not been seen before
+
+        Parameters
+        -----------
+        - name (str): the label
+
+        """
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return self.index[name]
+
+# Series class holds the data points of a plot in typed arrays
+class Series:
+    def __init__(self, labels: Labels, cases: Labels) -> None:
+        self.labels = labels    # labels of the x-axis, may be shared with other series of a plot
+        self.cases = cases      # cases the points belong to, may be shared with other series of a plot
+        self.x = array("i")     # index of the x-axis label of each point
+        self.y = array("d")     # y-axis value of each point
+        self.case = array("i")  # index of the case of each point
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def append(self, val: float, id: str, case: str) -> None:
+        """
+        (float, str, str) -> None
+
+        Adds the point (id, val) of case to the series
+
+        Parameters
+        -----------
+        - val (float): y-value of the point
+        - id (str): x-axis label of the point
+        - case (str): the case the point belongs to
+
+        """
+        self.x.append(self.labels.intern(id))
+        self.y.append(val)
+        self.case.append(self.cases.intern(case))
+
+    def get_x(self) -> numpy.ndarray:
+        """
+        None -> numpy.ndarray
+
+        Returns a view of the x-axis label indices, without copying them
+        """
+        return numpy.frombuffer(self.x, dtype=numpy.intc)
+
+    def get_y(self) -> numpy.ndarray:
+        """
+        None -> numpy.ndarray
+
+        Returns a view of the y-axis values, without copying them
+        """
+        return numpy.frombuffer(self.y, dtype=numpy.float64)
+
+    def get_labels(self) -> List[str]:
+        """
+        None -> list[str]
+
+        Returns the x-axis label of each point
+        """
+        return [self.labels.names[index] for index in self.x]
+
+    def get_cases(self) -> List[str]:
+        """
+        None -> list[str]
+
+        Returns the case of each point
+        """
+        return [self.cases.names[index] for index in self.case]
+
+def compact_values(values: Any) -> List[Any]:
+    """
+    (iterable) -> list
+
+    Returns values rounded to 6 significant digits, with whole numbers as int, so the data
+    of plots embedded in interactive reports stays small. Values that are not finite are None
+
+    Parameters
+    -----------
+    - values (iterable): the values of a series
+
+    """
+    compact = []
+    for value in values:
+        value = float(value)
+        if not math.isfinite(value):
+            compact.append(None)
+        elif value.is_integer():
+            compact.append(int(value))
+        else:
+            compact.append(float(f"{value:.6g}"))
+    return compact
+
+# pyplot draws on a current figure shared by the whole process, so plots are drawn one at a time
+PLOT_LOCK = threading.Lock()
 
 class Plot:
     def __init__(self, title: str, x_axis: str, y_axis: str, hi: int=-1, lo: int=-1) -> None:
-        self.data = {       # data to be plotted
-            "x": [],        # x-axis data (usually Sample IDs)
-            "y": [],        # y-axis data
-        }
+        self.data = Series(Labels(), Labels())  # data to be plotted, x-axis data is usually Sample IDs
         self.title = title  # title of plot
         self.axis = {       # names of axis
             "x": x_axis,
@@ -19,25 +134,80 @@ class Plot:
         self.hi= hi         # upper bound of y-axis
         self.lo= lo         # lower bound of y-axis
 
-    def generate_plot(self, name: str) -> str:
+    def get_median(self, series: "Series", stats: Dict[str, Dict[str, Any]], group: str) -> float:
+        """
+        (Series, dict, str) -> float
+
+        Returns the median of group from the cohort statistics of the column if they
+        were computed, otherwise the median of series
+
+        Parameters
+        -----------
+        - series (Series): data points of group
+        - stats (dict): cohort statistics of the column for each group, may be None
+        - group (str): the group being plotted
+
+        """
+        if stats and group in stats:
+            return stats[group]["median"]
+        return median(series.get_y())
+
+    def draw_history(self, history: Dict[str, Dict[float, float]], group: str, color: Any, label: str=None) -> None:
+        """
+        (dict, str, Any, str) -> None
+
+        Draws the historical percentiles of group as horizontal lines: dashed for the
+        median, dotted for the other percentiles
+
+        Parameters
+        -----------
+        - history (dict): historical percentiles of the column for each group, may be None
+        - group (str): the group being plotted
+        - color (Any): colour of the lines
+        - label (str): legend label of the historical median line
+
         """
-        (str) -> str
+        if not history or group not in history:
+            return
+        for q, value in history[group].items():
+            plt.axhline(
+                y=value,
+                color=color,
+                linestyle="--" if q == 0.5 else ":",
+                linewidth=1,
+                label=label if q == 0.5 else None,
+            )
+
+    def generate_plot(
+        self,
+        name: str,
+        stats: Dict[str, Dict[str, Any]]=None,
+        history: Dict[str, Dict[float, float]]=None,
+        plot_dir: str=None,
+        profile: Dict[str, Any]=None
+    ) -> str:
+        """
+        (str, dict, dict, str, dict) -> str
 
-        Generates a plot for the name column.
-        Saves the plot to "Analysis_Reports/plots" and returns the path to the plot.
+        Generates a plot for the name column and returns it as a data URI
 
         Parameters
         -----------
         - name (str): y-axis values to be plotted
+        - stats (dict): cohort statistics of the column for each group, used for the median line
+        - history (dict): historical percentiles of the column for each group, drawn if given
+        - plot_dir (str): if set, the plot image is also written to this directory
+        - profile (dict): output profile setting the resolution and format of the plot
 
         """
 
         plt.figure(figsize=(9,2.5), dpi=80)     # fits 4 plots per page
-        plt.scatter(self.data["x"], self.data["y"])
+        plt.scatter(self.data.get_x(), self.data.get_y())
         plt.ylabel(self.axis["y"])              
 
         #plot median line
-        plt.axhline(y=median(self.data["y"]), color='r')
+        plt.axhline(y=self.get_median(self.data, stats, COHORT), color='r')
+        self.draw_history(history, COHORT, 'grey')
 
         # set y-axis range
         if self.hi >= 0 and self.lo >= 0:
@@ -50,58 +220,200 @@ class Plot:
         ax = plt.gca()
         ax.get_xaxis().set_visible(False)  # don't show x-axis
 
-        working_dir = os.path.join(os.getcwd(), "temp")
-        os.makedirs(working_dir, exist_ok=True)
+        return self.save_plot(name, plot_dir, profile)
 
-        current_time = time.strftime('%Y-%m-%d', time.localtime(time.time()))
-        outputfile = os.path.join(working_dir, '{0}.{1}._plot.png'.format(name, current_time))
+    def save_plot(self, name: str, plot_dir: str=None, profile: Dict[str, Any]=None) -> str:
+        """
+        (str, str, dict) -> str
 
+        Renders the current figure in memory, closes it and returns the image as a data URI
+        that can be embedded in the report. The image is also written to plot_dir if it is set
+
+        Parameters
+        -----------
+        - name (str): name of the plot, used to name the file in plot_dir
+        - plot_dir (str): directory the image is also written to
+        - profile (dict): output profile setting the resolution and format of the image.
+                          Defaults to the standard profile
+
+        """
+        if profile is None:
+            profile = get_profile()
+        format = profile["format"]
+        buffer = io.BytesIO()
         plt.savefig(
-            outputfile,
+            buffer,
+            format="svg" if format == "svg" else "png",
+            dpi=profile["dpi"],
             bbox_inches="tight"
         )
         
         #close plot to save memory since we don't need it anymore
         plt.close()
-        return outputfile
+        image = buffer.getvalue()
+        if format != "svg":
+            image = encode_image(image, profile)
+
+        if plot_dir:
+            os.makedirs(plot_dir, exist_ok=True)
+            current_time = time.strftime('%Y-%m-%d', time.localtime(time.time()))
+            outputfile = os.path.join(plot_dir, '{0}.{1}._plot.{2}'.format(name, current_time, format))
+            with open(outputfile, "wb") as f:
+                f.write(image)
+
+        return to_data_uri(image, format)
+
+    def get_series_data(self, series: Series, name: str, stats: Dict[str, Dict[str, Any]], history: Dict[str, Dict[float, float]], group: str) -> Dict[str, Any]:
+        """
+        (Series, str, dict, dict, str) -> dict
+
+        Returns the points of series with the median and historical percentiles of group,
+        as drawn by the interactive report
+
+        Parameters
+        -----------
+        - series (Series): data points of group
+        - name (str): name of the series in the legend, None if the plot has a single series
+        - stats (dict): cohort statistics of the column for each group, may be None
+        - history (dict): historical percentiles of the column for each group, may be None
+        - group (str): the group being plotted
+
+        """
+        return {
+            "name": name,
+            "x": series.x.tolist(),
+            "y": compact_values(series.y),
+            "median": compact_values([self.get_median(series, stats, group)])[0] if len(series) else None,
+            "history": {
+                str(q): value for q, value in zip(history[group], compact_values(history[group].values()))
+            } if history and group in history else {},
+        }
+
+    def get_plot_data(self, stats: Dict[str, Dict[str, Any]]=None, history: Dict[str, Dict[float, float]]=None) -> Dict[str, Any]:
+        """
+        (dict, dict) -> dict
+
+        Returns the data the interactive report draws the plot from. Points store the index
+        of their sample ID in labels
+
+        Parameters
+        -----------
+        - stats (dict): cohort statistics of the column for each group, used for the median line
+        - history (dict): historical percentiles of the column for each group, drawn if given
+
+        """
+        return {
+            "y_axis": self.axis["y"],
+            "hi": self.hi,
+            "lo": self.lo,
+            "labels": self.data.labels.names,
+            "series": [self.get_series_data(self.data, None, stats, history, COHORT)],
+        }
 
-    def load_context(self, process_col) -> Dict[str, str]:
+    def save_plot_data(self, name: str, stats=None, history=None, plot_dir=None) -> str:
         """
-        (str) -> dict[str, str]
+        (str, dict, dict, str) -> str
 
-        Loads and returns the context for the plot process_col, used in jinja2 templating
+        Returns the data of the plot as json that can be embedded in a script element of the
+        report. The json is also written to plot_dir if it is set
+
+        Parameters
+        -----------
+        - name (str): name of the plot, used to name the file in plot_dir
+        - stats (dict): cohort statistics of the column for each group
+        - history (dict): historical percentiles of the column for each group
+        - plot_dir (str): directory the data is also written to
+
+        """
+        data = json.dumps(self.get_plot_data(stats, history), separators=(",", ":"))
+        if plot_dir:
+            os.makedirs(plot_dir, exist_ok=True)
+            current_time = time.strftime('%Y-%m-%d', time.localtime(time.time()))
+            with open(os.path.join(plot_dir, '{0}.{1}._plot.json'.format(name, current_time)), "w") as f:
+                f.write(data)
+        #a sample ID cannot close the script element it is embedded in
+        return data.replace("</", "<\\/")
+
+    def load_context(self, process_col, stats=None, history=None, plot_dir=None, profile=None) -> Dict[str, str]:
+        """
+        (str, dict, dict, str, dict) -> dict[str, str]
+
+        Loads and returns the context for the plot process_col, used in jinja2 templating.
+        With an interactive profile the context holds the data of the plot instead of an image
 
         Parameters
         -----------
         - process_col (str): name of the process and column to be plotted
+        - stats (dict): cohort statistics of the column for each group
+        - history (dict): historical percentiles of the column for each group
+        - plot_dir (str): if set, the plot image is also written to this directory
+        - profile (dict): output profile setting the resolution and format of the plot
 
         """
+        if profile and is_interactive(profile):
+            return {
+                "title": self.title,                                                # title of plot
+                "data": self.save_plot_data(process_col, stats, history, plot_dir), # json the plot is drawn from
+            }
+        with PLOT_LOCK:
+            fig_path = self.generate_plot(process_col, stats, history, plot_dir, profile)
         context = {
             "title": self.title,        # title of plot
-            "fig_path": self.generate_plot(process_col),    # path to plot generated
+            "fig_path": fig_path,       # data URI of plot generated
         }
         return context
     
-    def add_data(self, val:str, id:str) -> None:
+    def add_data(self, val:str, id:str, case:str) -> None:
         """
-        (str, str) -> None
+        (str, str, str) -> None
 
-        Add val and id to the data of the plot.
+        Add val and id to the data of the plot. Values that are not numbers are skipped.
 
         Parameters
         -----------
         - val (str): val to be added (y-value)
         - id (str): id that corresponds to val (x-value)
+        - case (str): the case the point belongs to
+
+        """
+        try:
+            self.data.append(float(val), id, case)
+        except (TypeError, ValueError):
+            pass
+
+    def get_series(self) -> Dict[str, List[Any]]:
+        """
+        None -> dict[str, list]
+
+        Returns the data of the plot in a form that can be saved as json
+
+        """
+        return {"x": self.data.get_labels(), "y": self.data.y.tolist(), "case": self.data.get_cases()}
+
+    def merge_series(self, partials: List[Dict[str, List[Any]]]) -> None:
+        """
+        (list[dict[str, list]]) -> None
+
+        Adds the data points of several shards, as returned by get_series, to the data of the plot.
+        Points are added by case, in the order a report of all the cases adds them
+
+        Parameters
+        -----------
+        - partials (list[dict]): data of the plot for each shard, as returned by get_series
 
         """
-        self.data["x"].append(id)
-        self.data["y"].append(val)
+        points = [point for series in partials for point in zip(series["case"], series["x"], series["y"])]
+        #cases are processed in sorted order, and the points of a case all come from one shard
+        for case, id, val in sorted(points, key=lambda point: point[0]):
+            self.add_data(val, id, case)
 
 #SeqPlot class defines the plot for Raw Sequence Data and Call Ready Alignments Data
 class SeqPlot(Plot):
     def __init__(self, title: str, x_axis: str, y_axis: str, hi: int=-1, lo: int=-1) -> None:
-        self.data = {       # data to be plotted
+        self.data = {       # data to be plotted, Dict[sample type, Series]
         }
+        self.labels = Labels()  # x-axis labels shared by the series of all sample types
+        self.cases = Labels()   # cases of the points, shared by the series of all sample types
         self.title = title  # title of plot
         self.axis = {       # names of axis
             "x": x_axis,
@@ -110,44 +422,115 @@ class SeqPlot(Plot):
         self.hi= hi         # upper bound of y-axis
         self.lo= lo         # lower bound of y-axis
     
-    def add_data(self, sample_type: str,val:str, id:str) -> None:
+    def add_data(self, sample_type: str,val:str, id:str, case:str) -> None:
         """
-        (str, str) -> None
+        (str, str, str, str) -> None
 
-        Add val and id to the data of the plot.
+        Add val and id to the data of the plot. Values that are not numbers are skipped.
 
         Parameters
         -----------
+        - sample_type (str): sample type the point belongs to (Normal, Tumour)
         - val (str): val to be added (y-value)
         - id (str): id that corresponds to val (x-value)
+        - case (str): the case the point belongs to
 
         """
         if sample_type not in self.data.keys():
-            self.data[sample_type] = {"x": [], "y": []}
-        self.data[sample_type]["x"].append(id)
-        self.data[sample_type]["y"].append(val)
+            self.data[sample_type] = Series(self.labels, self.cases)
+        try:
+            self.data[sample_type].append(float(val), id, case)
+        except (TypeError, ValueError):
+            pass
+
+    def get_series(self) -> Dict[str, Dict[str, List[Any]]]:
+        """
+        None -> dict[str, dict[str, list]]
+
+        Returns the data of the plot, per sample type, in a form that can be saved as json
+
+        """
+        return {
+            stype: {"x": series.get_labels(), "y": series.y.tolist(), "case": series.get_cases()}
+            for stype, series in self.data.items()
+        }
+
+    def merge_series(self, partials: List[Dict[str, Dict[str, List[Any]]]]) -> None:
+        """
+        (list[dict[str, dict[str, list]]]) -> None
+
+        Adds the data points of several shards, as returned by get_series, to the data of the plot.
+        Points of every sample type are added by case, in the order a report of all the cases adds them
+
+        Parameters
+        -----------
+        - partials (list[dict]): data of the plot per sample type for each shard, as returned by get_series
+
+        """
+        points = [
+            (case, stype, id, val)
+            for series in partials for stype, values in series.items()
+            for case, id, val in zip(values["case"], values["x"], values["y"])
+        ]
+        for case, stype, id, val in sorted(points, key=lambda point: point[0]):
+            self.add_data(stype, val, id, case)
     
-    def generate_plot(self, name: str) -> str:
+    def get_plot_data(self, stats: Dict[str, Dict[str, Any]]=None, history: Dict[str, Dict[float, float]]=None) -> Dict[str, Any]:
         """
-        (str) -> str
+        (dict, dict) -> dict
 
-        Generates a plot for the name column.
-        Saves the plot to "Analysis_Reports/plots" and returns the path to the plot.
+        Returns the data the interactive report draws the plot from, with one series per
+        sample type. Points store the index of their sample ID in labels
+
+        Parameters
+        -----------
+        - stats (dict): cohort statistics of the column for each sample type, used for the median lines
+        - history (dict): historical percentiles of the column for each sample type, drawn if given
+
+        """
+        return {
+            "y_axis": self.axis["y"],
+            "hi": self.hi,
+            "lo": self.lo,
+            "labels": self.labels.names,
+            "series": [
+                self.get_series_data(series, stype, stats, history, stype)
+                for stype, series in self.data.items()
+            ],
+        }
+
+    def generate_plot(
+        self,
+        name: str,
+        stats: Dict[str, Dict[str, Any]]=None,
+        history: Dict[str, Dict[float, float]]=None,
+        plot_dir: str=None,
+        profile: Dict[str, Any]=None
+    ) -> str:
+        """
+        (str, dict, dict, str, dict) -> str
+
+        Generates a plot for the name column and returns it as a data URI
 
         Parameters
         -----------
         - name (str): y-axis values to be plotted
+        - stats (dict): cohort statistics of the column for each sample type, used for the median lines
+        - history (dict): historical percentiles of the column for each sample type, drawn if given
+        - plot_dir (str): if set, the plot image is also written to this directory
+        - profile (dict): output profile setting the resolution and format of the plot
 
         """
         plt.figure(figsize=(14,5), dpi=80)     # fits 4 plots per page
         #draw plots for different sample types
         for stype in self.data.keys():
-            sc = plt.scatter(self.data[stype]["x"], self.data[stype]["y"], label=stype)
+            sc = plt.scatter(self.data[stype].get_x(), self.data[stype].get_y(), label=stype)
             plt.axhline(
-                y=median(self.data[stype]["y"]),
+                y=self.get_median(self.data[stype], stats, stype),
                 c=sc.get_facecolors()[0].tolist(), #get colour of scatter plot and set median line to be same colour
                 label=f"{stype} median"
             )
+            self.draw_history(history, stype, sc.get_facecolors()[0].tolist(), f"{stype} historical median")
             
         plt.ylabel(self.axis["y"])              
         plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
@@ -163,16 +546,4 @@ class SeqPlot(Plot):
         ax = plt.gca()
         ax.get_xaxis().set_visible(False)  # don't show x-axis
 
-        working_dir = os.path.join(os.getcwd(), "temp")
-        os.makedirs(working_dir, exist_ok=True)
-        current_time = time.strftime('%Y-%m-%d', time.localtime(time.time()))
-        outputfile = os.path.join(working_dir, '{0}.{1}._plot.png'.format(name, current_time))
-
-        plt.savefig(
-            outputfile,
-            bbox_inches="tight"
-        )
-        
-        #close plot to save memory since we don't need it anymore
-        plt.close()
-        return outputfile
+        return self.save_plot(name, plot_dir, profile)
@@ -0,0 +1,171 @@
+"""
+Query tracing for the SQL statements the report runs against the QC-ETL databases.
+Each statement is recorded with its text, the keys it was run for, how long it took
+and how many rows it returned. Statements slower than a threshold also have their
+EXPLAIN QUERY PLAN captured so that statements scanning whole tables can be flagged.
+"""
+from typing import Dict, List, Any
+import json
+import re
+import time
+
+# matches plan details such as "SCAN bamqc4_bamqc4_5", "SCAN TABLE bamqc4_bamqc4_5" or
+# "SCAN bamqc4_bamqc4_5 USING COVERING INDEX ...", which reads the whole index. Lookups are SEARCH
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?(?P<table>\S+)")
+# string literals and placeholder lists, masked out when grouping statements
+LITERAL = re.compile(r"'[^']*'")
+PLACEHOLDERS = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+
+
+class QueryLog:
+    def __init__(self, log_file: str=None, slow_ms: float=100.0) -> None:
+        self.log_file = log_file    # file each statement is written to as a json line
+        self.slow_ms = slow_ms      # statements taking at least this long have their plan captured
+        self.records = []           # one record per statement run
+        self.handle = open(log_file, "w") if log_file else None
+
+    def execute(self, cur, statement: str, params=(), keys=None) -> List[tuple]:
+        """
+        (SQLCursor, str, tuple, list) -> list[tuple]
+
+        Runs statement on cur, records it and returns all rows
+
+        Parameters
+        -----------
+        - cur (SQLCursor): SQL cursor connected to the correct database
+        - statement (str): the SQL statement to run
+        - params (tuple): values bound to the placeholders of statement
+        - keys (list): keys the statement was run for. Defaults to params
+
+        """
+        start = time.perf_counter()
+        rows = cur.execute(statement, params).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        record = {
+            "statement": " ".join(statement.split()),
+            "keys": list(params) if keys is None else list(keys),
+            "elapsed_ms": round(elapsed, 3),
+            "rows": len(rows),
+            "plan": [],
+            "full_scans": [],
+        }
+        if elapsed >= self.slow_ms:
+            record["plan"] = self.explain(cur, statement, params)
+            record["full_scans"] = self.get_full_scans(record["plan"])
+
+        self.records.append(record)
+        if self.handle:
+            self.handle.write(json.dumps(record) + "\n")
+        return rows
+
+    def explain(self, cur, statement: str, params=()) -> List[str]:
+        """
+        (SQLCursor, str, tuple) -> list[str]
+
+        Returns the detail lines of the EXPLAIN QUERY PLAN of statement
+
+        Parameters
+        -----------
+        - cur (SQLCursor): SQL cursor connected to the correct database
+        - statement (str): the SQL statement to explain
+        - params (tuple): values bound to the placeholders of statement
+
+        """
+        try:
+            plan = cur.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+        except Exception as e:
+            return [f"could not explain statement: {e}"]
+        return [step[-1] for step in plan]
+
+    def get_full_scans(self, plan: List[str]) -> List[str]:
+        """
+        (list[str]) -> list[str]
+
+        Returns the tables that plan scans from start to end, either directly or through
+        one of their indexes. Index lookups (SEARCH ... USING INDEX) are not full scans
+
+        Parameters
+        -----------
+        - plan (list[str]): detail lines of an EXPLAIN QUERY PLAN
+
+        """
+        tables = []
+        for detail in plan:
+            match = FULL_SCAN.match(detail)
+            if match:
+                tables.append(match.group("table"))
+        return tables
+
+    def get_summary(self, top: int=10) -> List[Dict[str, Any]]:
+        """
+        (int) -> list[dict]
+
+        Groups the recorded statements by their text, with string literals and
+        placeholder lists masked out, and returns the top groups by total time
+
+        Parameters
+        -----------
+        - top (int): number of statements to return
+
+        """
+        groups = {}
+        for record in self.records:
+            statement = LITERAL.sub("?", record["statement"])
+            statement = PLACEHOLDERS.sub("(?, ...)", statement)
+            if statement not in groups:
+                groups[statement] = {
+                    "statement": statement,
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "full_scans": set(),
+                }
+            group = groups[statement]
+            group["calls"] += 1
+            group["total_ms"] += record["elapsed_ms"]
+            group["max_ms"] = max(group["max_ms"], record["elapsed_ms"])
+            group["rows"] += record["rows"]
+            group["full_scans"].update(record["full_scans"])
+
+        summary = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+        return summary[:top]
+
+    def write_summary(self, top: int=10) -> str:
+        """
+        (int) -> str
+
+        Formats the top statements by total time, writes them next to the log file
+        (if there is one) and returns the formatted summary
+
+        Parameters
+        -----------
+        - top (int): number of statements to include
+
+        """
+        lines = [f"Top {top} statements by total time ({len(self.records)} statements run)"]
+        for rank, group in enumerate(self.get_summary(top), 1):
+            lines.append(
+                f"{rank}. {group['total_ms']:.1f} ms total, {group['calls']} calls, "
+                f"{group['max_ms']:.1f} ms max, {group['rows']} rows"
+            )
+            if group["full_scans"]:
+                lines.append(f"   FULL SCAN of {', '.join(sorted(group['full_scans']))}")
+            lines.append(f"   {group['statement']}")
+        summary = "\n".join(lines)
+
+        if self.log_file:
+            with open(f"{self.log_file}.summary.txt", "w") as f:
+                f.write(summary + "\n")
+        return summary
+
+    def close(self) -> None:
+        """
+        None -> None
+
+        Closes the log file
+        """
+        if self.handle:
+            self.handle.close()
+            self.handle = None
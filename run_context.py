@@ -0,0 +1,179 @@
+"""
+State of one report run.
+Everything a report reads while it is generated (the input cases, the database location,
+the query log, where plots go) lives on a RunContext that is passed to the sections and
+tables of the report, so several reports can be generated in the same process at once.
+"""
+from typing import Any, Dict, List, Tuple
+import json
+import os
+import sqlite3
+import threading
+from output_profile import get_profile
+from backends import DataSource, get_source
+
+
+# ConnectionPool class keeps connections to the QC-ETL databases open between reports.
+# sqlite3 connections belong to the thread that opened them, so each thread has its own
+class ConnectionPool:
+    def __init__(self) -> None:
+        self.local = threading.local()  # .connections: Dict[database path, (resolved path, connection)]
+
+    def connect(self, db_path: str) -> sqlite3.Connection:
+        """
+        (str) -> sqlite3.Connection
+
+        Returns the connection of the current thread to the database at db_path. The connection
+        is reused for as long as db_path resolves to the same file, i.e. until the next QC-ETL refresh
+
+        Parameters
+        -----------
+        - db_path (str): path to the database
+
+        """
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+        path = os.path.realpath(db_path)
+        if db_path in self.local.connections:
+            open_path, con = self.local.connections[db_path]
+            if open_path == path:
+                return con
+            con.close()
+        con = sqlite3.connect(path)
+        self.local.connections[db_path] = (path, con)
+        return con
+
+
+class RunContext:
+    def __init__(
+        self,
+        input_data: Dict[str, Any],
+        use_stage: bool=False,
+        shard: Tuple[int, int]=None,
+        gamma: int=500,
+        query_log: Any=None,
+        plot_dir: str=None,
+        connections: ConnectionPool=None,
+        profile: str=None,
+        sections: List[str]=None,
+        skip_sections: List[str]=None,
+        tables: List[str]=None,
+        mart: str=None,
+        source: DataSource=None,
+        export: Any=None,
+        lane_rollup: bool=False,
+        fallback: Any=None
+    ) -> None:
+        """
+        Parameters
+        -----------
+        - input_data (dict): the input json, with the project, release and cases of the report
+        - use_stage (bool): set to True if using data from staging
+        - shard (tuple): (index, count) of the shard of cases to process, with 1 <= index <= count
+        - gamma (int): the sequenza gamma setting whose solution is reported
+        - query_log (QueryLog): traces each statement run, if set
+        - plot_dir (str): if set, plot images are also written to this directory
+        - connections (ConnectionPool): connections kept open between reports, if set
+        - profile (str): output profile (draft, standard or archival). Defaults to standard
+        - sections (list[str]): names of the sections to include. All sections if None
+        - skip_sections (list[str]): names of the sections to leave out
+        - tables (list[str]): class names of the tables to include. All tables of the included sections if None
+        - mart (str): report mart read instead of the QC-ETL databases, if set: a SQLite file,
+                      a directory of Parquet files or a json fixture
+        - source (DataSource): source the tables read from. Defaults to the mart if set, and
+                               to the QC-ETL databases otherwise
+        - export (TableExport): writes the rows of each table as they are loaded, if set
+        - lane_rollup (bool): set to True to combine the lanes of each sample by sequencing run
+                              in the lane level tables. Each lane is still exported
+        - fallback (FileFallback): computes the rows of workflow runs missing from QC-ETL from
+                                   their output files, if set
+
+        """
+        env = "staging" if use_stage else "production"
+        self.project = input_data["project"]
+        self.release = input_data["release"]
+        self.data = input_data["cases"]             # input of each case
+        self.cases = sorted(self.data.keys())       # cases of the report
+        if shard:
+            #keep every count-th case, starting from the index-th, so shards are deterministic
+            index, count = shard
+            self.cases = self.cases[index - 1::count]
+            self.data = {case: self.data[case] for case in self.cases}
+        self.use_stage = use_stage
+        self.base_db_path = f"/scratch2/groups/gsi/{env}/qcetl_v1/"    # base path to databases that are queried
+        self.gamma = gamma
+        self.query_log = query_log
+        self.plot_dir = plot_dir
+        self.connections = connections
+        self.profile = get_profile(profile)     # settings of the output profile
+        self.sections = sections
+        self.skip_sections = skip_sections if skip_sections else []
+        self.tables = tables
+        self.mart = mart                        # report mart read instead of the QC-ETL databases
+        if source is None:
+            source = get_source(self.base_db_path, mart, connections, query_log)
+        self.source = source                    # where the tables read their data from
+        self.export = export
+        self.lane_rollup = lane_rollup
+        self.fallback = fallback
+
+    def get_selection(self) -> Dict[str, List[str]]:
+        """
+        None -> dict
+
+        Returns the sections and tables selected for the report, as keyword arguments of RunContext
+        """
+        return {
+            "sections": self.sections,
+            "skip_sections": self.skip_sections,
+            "tables": self.tables,
+        }
+
+    def is_partial(self) -> bool:
+        """
+        None -> bool
+
+        Returns True if only some of the sections or tables of the report are selected
+        """
+        return bool(self.sections or self.skip_sections or self.tables)
+
+    def close(self) -> None:
+        """
+        None -> None
+
+        Closes the connections the run opened to its data source, and completes the export
+        """
+        self.source.close()
+        if self.export:
+            self.export.close()
+
+    def __enter__(self) -> "RunContext":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        (type, Exception, traceback) -> None
+
+        Closes the run at the end of a with block. If the block raised an exception the
+        connections are still closed, but the export is left incomplete
+        """
+        if exc_type is None:
+            self.close()
+        else:
+            self.source.close()
+
+    @staticmethod
+    def from_file(input_file: str, **kwargs) -> "RunContext":
+        """
+        (str, ...) -> RunContext
+
+        Returns the context of a report of the input json in input_file
+
+        Parameters
+        -----------
+        - input_file (str): name of the input file
+        - kwargs: the other arguments of RunContext
+
+        """
+        with open(input_file) as f:
+            return RunContext(json.load(f), **kwargs)
@@ -9,8 +9,10 @@ from tables import (
     WGCallReadyTable,
     WTCallReadyTable,
     WGLaneLevelTable,
+    SEQUENZA_FGA_GAMMA,
 )
 from typing import List, Any
+from output_profile import get_logo, get_interactive_assets, is_interactive
 from datetime import date
 
 # Section class defines a section of the report
@@ -20,13 +22,75 @@ class Section:
     tables: List[Any] # tables of section
     name: str   # name of section, used as key in context for jinja2 templating
 
-    def load_context(self):
+    def __init__(self, run):
+        self.run = run  # the report run the section belongs to
+
+    def load_data(self):
         """
         None -> dict
 
+        Returns a dict of the context of the tables of the section and the data series
+        of their plots, by the class name of the table. Plots are not rendered, so the data
+        can be saved and merged with the data of other shards
+
+        """
+        data = {
+            "tables": {},
+            "series": {},
+        }
+        for table in self.tables:
+            key = type(table).__name__
+            data["tables"][key] = table.load_context()
+            data["series"][key] = {
+                column: plot.get_series() for column, plot in table.plots.items()
+            }
+        return data
+
+    def merge_data(self, partials):
+        """
+        (list[dict]) -> dict
+
+        Combines the data of the section loaded for several shards of the cases and
+        adds their plot series to the plots of the section
+
+        Parameters
+        ----------
+        - partials (list[dict]): data returned by load_data for each shard
+
+        """
+        data = {
+            "tables": {},
+            "series": {},
+        }
+        for table in self.tables:
+            key = type(table).__name__
+            data["tables"][key] = table.merge_context(
+                [partial["tables"][key] for partial in partials]
+            )
+            for column, plot in table.plots.items():
+                plot.merge_series([partial["series"][key][column] for partial in partials])
+            data["series"][key] = {
+                column: plot.get_series() for column, plot in table.plots.items()
+            }
+        return data
+
+    def load_context(self, data=None, baseline=None):
+        """
+        (dict, BaselineStore) -> dict
+
         Returns a dict of the context of the section and its tables
 
+        Parameters
+        ----------
+        - data (dict): data of the section, as returned by load_data or merge_data.
+                       Loaded from the tables if not given
+        - baseline (BaselineStore): store of the previous releases. If given, their percentiles
+                                    are overlaid on the tables and plots, and the values of
+                                    this release are staged to be added to the store
+
         """
+        if data is None:
+            data = self.load_data()
         context = {
             "title": self.title,
             "blurb": self.blurb,
@@ -34,40 +98,66 @@ class Section:
             "plots": {},
         }
         for tcount, table in enumerate(self.tables):
-            context["tables"][tcount] = table.load_context()
+            context["tables"][tcount] = data["tables"][type(table).__name__]
+            stats = table.get_stats(context["tables"][tcount]["data"])
+            if self.run.export:
+                self.run.export.write_table(self, table, context["tables"][tcount]["data"])
+                if "lanes" in context["tables"][tcount]:
+                    self.run.export.write_table(self, table, context["tables"][tcount]["lanes"], "lanes")
+            history = {}
+            if baseline:
+                history = {
+                    column: baseline.get_history(table, column)
+                    for column in table.get_stats_columns()
+                }
+                baseline.stage(table, stats)
+            context["tables"][tcount]["summary"] = table.get_summary_rows(stats, history)
+            context["tables"][tcount]["pages"] = table.get_pages(
+                context["tables"][tcount]["data"],
+                context["tables"][tcount]["summary"]
+            )
             context["tables"][tcount]["plots"] = {}
             for pcount, (column, plot) in enumerate(table.plots.items()):
-                context["tables"][tcount]["plots"][pcount] = plot.load_context(f"{table.process}_{column}")
+                context["tables"][tcount]["plots"][pcount] = plot.load_context(
+                    f"{table.process}_{column}",
+                    stats.get_column(column),
+                    history.get(column),
+                    self.run.plot_dir,
+                    self.run.profile
+                )
         return context
 
 #CallReadyAlignmentsSection class defines the section for call ready alignments
 class CallReadyAlignmentsSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Call Ready Alignments"
         self.blurb = """
         All data from each sample is merged and processed to a call ready state.
         """
         self.name = "call_ready"
         self.tables = [
-            WGCallReadyTable(),
-            WTCallReadyTable(),
+            WGCallReadyTable(run),
+            WTCallReadyTable(run),
         ]
 
 #CasesSection class defines the section for cases
 class CasesSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Cases"
         self.blurb = """
         The following cases are included in this release.
         """
         self.name = "cases"
         self.tables = [
-            CasesTable(),
+            CasesTable(run),
         ]
 
 # DellySection class defines the section for delly workflow
 class DellySection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Genomic Structural Variants"
         self.blurb = """
         Summary metrics for structural variants  generated from the WG Tumour/Normal pairs.
@@ -75,14 +165,15 @@ class DellySection(Section):
         """
         self.name = "delly"
         self.tables = [
-            DellyTable(),
+            DellyTable(run),
         ]
 
 # HeaderSection class defines the header of the report
 class HeaderSection(Section):
-    def __init__(self, project, release):
-        self.project = project
-        self.release = release
+    def __init__(self, run):
+        super().__init__(run)
+        self.project = run.project
+        self.release = run.release
         self.title = "Marathon of Hope"
         self.name = "header"
         self.blurb = """
@@ -105,12 +196,16 @@ class HeaderSection(Section):
             "title": self.title,
             "blurb": self.blurb,
             "release": self.release,
+            "logo": get_logo(self.run.profile["logo_width"]),
+            # stylesheet and plot script embedded in interactive reports
+            "interactive": get_interactive_assets() if is_interactive(self.run.profile) else None,
         }
         return context
     
 #Mutect2Section class defines the section for the mutect2 workflow
 class Mutect2Section(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Mutations"
         self.blurb = """
         Summary metrics for somatic mutations (snvs + indels) generated from the WG Tumour/Normal pairs.
@@ -118,25 +213,27 @@ class Mutect2Section(Section):
         """
         self.name = "mutect2"
         self.tables = [
-            Mutect2Table(),
+            Mutect2Table(run),
         ]
 
 #RawSeqDataSection class defines the section for raw sequence data
 class RawSeqDataSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Raw Sequence Data"
         self.blurb = """
         Samples were sequenced on one or more sequencing runs.
         """
         self.name = "raw_seq_data"
         self.tables = [
-            WGLaneLevelTable(),
-            WTLaneLevelTable(),
+            WGLaneLevelTable(run),
+            WTLaneLevelTable(run),
         ]
 
 #RSEMSection class defines the section for RSEM workflow
 class RSEMSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Gene Expression"
         self.blurb = """
         Summary metrics for normalized expression (TPM, transcripts per million) for genes in gencode release 31 
@@ -145,27 +242,30 @@ class RSEMSection(Section):
         """
         self.name = "rsem"
         self.tables = [
-            RSEMTable(),
+            RSEMTable(run),
         ]
 
 #SequenzaSection class defines the section for Sequenza
 class SequenzaSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Copy Number Alterations"
-        self.blurb = """
+        fga_note = "" if run.gamma == SEQUENZA_FGA_GAMMA else f" FGA is only released for gamma = {SEQUENZA_FGA_GAMMA}."
+        self.blurb = f"""
         Summary metrics for somatic copy number alterations generated from the WG Tumour/Normal pairs.
         \nInitial calls are generated with varscan, then processed with Sequenza.
         Multiple copy number profiles are generated and released over a range of tunable gamma settings.
-        Metrics displayed are for gamma = 500.
+        Metrics displayed are for gamma = {run.gamma}.{fga_note}
         """
         self.name = "sequenza"
         self.tables = [
-            SequenzaTable(),
+            SequenzaTable(run),
         ]
 
 #StarFusionSection class defines the section for StarFusion
 class StarFusionSection(Section):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Gene Fusions"
         self.blurb = """
         Summary metrics for identified gene fusions.
@@ -173,5 +273,5 @@ class StarFusionSection(Section):
         """
         self.name = "starfusion"
         self.tables = [
-            StarFusionTable(),
+            StarFusionTable(run),
         ]
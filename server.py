@@ -0,0 +1,281 @@
+"""
+Report daemon that keeps one process resident between reports.
+Reports are requested over HTTP, on a TCP port or a Unix socket, by posting the input json
+to /report. The process keeps the QC-ETL connections, the lims key indexes, the compiled
+template, the parsed stylesheet and the plotting libraries loaded, so a request only pays
+for the report itself. Requests are queued in a bounded job queue and run by a fixed number
+of workers; requests arriving while the queue is full are turned away with a 503.
+"""
+from typing import Any, Callable, Dict, List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from urllib.parse import urlparse, parse_qs
+import json
+import os
+import queue
+import threading
+import traceback
+from output_profile import PROFILES, is_interactive
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "html": "text/html; charset=utf-8",
+}
+
+
+# Job class defines one report requested from the daemon
+class Job:
+    def __init__(
+        self,
+        input_data: Dict[str, Any],
+        format: str,
+        use_stage: bool,
+        gamma: int,
+        profile: str=None,
+        selection: Dict[str, List[str]]=None
+    ) -> None:
+        self.input_data = input_data    # input json of the report
+        self.format = format            # pdf or html
+        self.use_stage = use_stage      # set to True if using data from staging
+        self.gamma = gamma              # the sequenza gamma setting whose solution is reported
+        self.profile = profile          # output profile setting the resolution and format of images
+        self.selection = selection if selection else {}    # sections and tables to include, as in RunContext
+        self.done = threading.Event()   # set once the report is generated or has failed
+        self.result = None              # the report document
+        self.error = None               # the error the report failed with
+
+
+# JobQueue class defines the bounded queue of jobs and the workers that run them
+class JobQueue:
+    def __init__(self, generate: Callable[[Job], bytes], workers: int=1, queue_size: int=8) -> None:
+        self.generate = generate                            # generates the document of a job
+        self.jobs = queue.Queue(maxsize=max(queue_size, 1)) # jobs waiting for a worker (0 would be unbounded)
+        self.workers = workers                              # number of jobs run at the same time
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def submit(self, job: Job) -> None:
+        """
+        (Job) -> None
+
+        Queues job. Raises queue.Full if the queue is full
+
+        Parameters
+        -----------
+        - job (Job): the job to run
+
+        """
+        self.jobs.put_nowait(job)
+
+    def work(self) -> None:
+        """
+        None -> None
+
+        Runs queued jobs, forever
+        """
+        while True:
+            job = self.jobs.get()
+            try:
+                job.result = self.generate(job)
+            except Exception as e:
+                traceback.print_exc()
+                job.error = e
+            finally:
+                job.done.set()
+                self.jobs.task_done()
+
+
+# ReportRequestHandler class defines the HTTP interface of the daemon
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    job_queue: JobQueue     # queue the requested reports are submitted to
+    use_stage = False       # default for requests that do not set stage
+    gamma = 500             # default for requests that do not set gamma
+    profile = None          # default for requests that do not set profile
+    validate = None         # returns the problems of the input json of a request, if set
+
+    def address_string(self) -> str:
+        """
+        None -> str
+
+        Returns the address of the client, for logging. Unix socket clients have no address
+        """
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return str(self.client_address[0])
+        return "unix"
+
+    def send_body(self, status: int, body: bytes, content_type: str) -> None:
+        """
+        (int, bytes, str) -> None
+
+        Sends the response
+
+        Parameters
+        -----------
+        - status (int): HTTP status code
+        - body (bytes): body of the response
+        - content_type (str): content type of body
+
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "30")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, message: Dict[str, Any]) -> None:
+        """
+        (int, dict) -> None
+
+        Sends message as a json response
+
+        Parameters
+        -----------
+        - status (int): HTTP status code
+        - message (dict): body of the response
+
+        """
+        self.send_body(status, json.dumps(message).encode(), "application/json")
+
+    def do_GET(self) -> None:
+        """
+        None -> None
+
+        Reports the status of the daemon on /status
+        """
+        if urlparse(self.path).path != "/status":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self.send_json(200, {
+            "queued": self.job_queue.jobs.qsize(),
+            "queue_size": self.job_queue.jobs.maxsize,
+            "workers": self.job_queue.workers,
+        })
+
+    def do_POST(self) -> None:
+        """
+        None -> None
+
+        Generates the report for the input json posted to /report and sends it back.
+        The query string may set format (pdf or html), gamma, stage and profile, and select
+        sections, skip_sections and tables as comma-separated names
+        """
+        url = urlparse(self.path)
+        if url.path != "/report":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        format = params.get("format", "pdf")
+        if format not in CONTENT_TYPES:
+            self.send_json(400, {"error": f"format must be one of {', '.join(CONTENT_TYPES)}, not {format}"})
+            return
+        try:
+            gamma = int(params.get("gamma", self.gamma))
+            length = int(self.headers.get("Content-Length", 0))
+            input_data = json.loads(self.rfile.read(length))
+            for key in ["project", "release", "cases"]:
+                if key not in input_data:
+                    raise ValueError(f"input json has no {key}")
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        use_stage = params.get("stage", str(self.use_stage)).lower() in ["1", "true", "yes"]
+        profile = params.get("profile", self.profile)
+        if profile is not None and profile not in PROFILES:
+            self.send_json(400, {"error": f"profile must be one of {', '.join(PROFILES)}, not {profile}"})
+            return
+        if profile is not None and is_interactive(PROFILES[profile]) and format != "html":
+            self.send_json(400, {"error": f"profile {profile} is only available with format html"})
+            return
+
+        selection = {
+            key: [name for name in params[key].split(",") if name]
+            for key in ["sections", "skip_sections", "tables"] if key in params
+        }
+
+        if self.validate:
+            try:
+                problems = self.validate(input_data, selection)
+            except Exception as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            if problems:
+                self.send_json(400, {"error": f"Found {len(problems)} problems in the input", "problems": problems})
+                return
+
+        job = Job(input_data, format, use_stage, gamma, profile, selection)
+        try:
+            self.job_queue.submit(job)
+        except queue.Full:
+            self.send_json(503, {"error": "Too many reports queued, try again later"})
+            return
+
+        job.done.wait()
+        if job.error:
+            self.send_json(500, {"error": str(job.error)})
+            return
+        self.send_body(200, job.result, CONTENT_TYPES[format])
+
+
+class UnixReportServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(
+    generate: Callable[[Job], bytes],
+    host: str="127.0.0.1",
+    port: int=8000,
+    socket_path: str=None,
+    workers: int=1,
+    queue_size: int=8,
+    use_stage: bool=False,
+    gamma: int=500,
+    profile: str=None,
+    validate: Callable[[Dict[str, Any], Dict[str, List[str]]], List[str]]=None
+) -> None:
+    """
+    (function, str, int, str, int, int, bool, int, str, function) -> None
+
+    Serves reports until interrupted
+
+    Parameters
+    -----------
+    - generate (function): generates the document of a Job
+    - host (str): address to listen on
+    - port (int): port to listen on
+    - socket_path (str): Unix socket to listen on instead of host and port
+    - workers (int): number of jobs run at the same time
+    - queue_size (int): number of jobs that can wait for a worker
+    - use_stage (bool): default for requests that do not set stage
+    - gamma (int): default for requests that do not set gamma
+    - profile (str): default for requests that do not set profile
+    - validate (function): returns the problems of the input json of a request for its selection,
+                           which is turned away with a 400 if there are any. Not checked if None
+
+    """
+    handler = type("Handler", (ReportRequestHandler,), {
+        "job_queue": JobQueue(generate, workers, queue_size),
+        "use_stage": use_stage,
+        "gamma": gamma,
+        "profile": profile,
+        "validate": staticmethod(validate) if validate else None,
+    })
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixReportServer(socket_path, handler)
+        print(f"Serving reports on {socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"Serving reports on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,170 @@
+/*
+ * Draws the plots of interactive reports as SVG, from the data embedded in the report.
+ * Each plot is a script element of type application/json with class plot-data, holding
+ * the y-axis name and bounds, the sample IDs (labels) and one series per sample type, with
+ * the index of the label and the value of each point, the median and historical percentiles.
+ * Runs offline, with no dependencies. Hovering over a point shows its sample ID and value.
+ */
+(function () {
+    "use strict";
+
+    var SVG = "http://www.w3.org/2000/svg";
+    // default colours of matplotlib, so the plots look as in the PDF report
+    var COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf"];
+    var WIDTH = 900;
+    var HEIGHT = 260;
+    var MARGIN = {top: 10, right: 170, bottom: 10, left: 70};
+
+    function element(name, attributes, parent) {
+        var node = document.createElementNS(SVG, name);
+        for (var key in attributes) {
+            node.setAttribute(key, attributes[key]);
+        }
+        if (parent) {
+            parent.appendChild(node);
+        }
+        return node;
+    }
+
+    // returns about count round tick values between lo and hi
+    function ticks(lo, hi, count) {
+        var step = Math.pow(10, Math.floor(Math.log10((hi - lo) / count)));
+        var error = (hi - lo) / count / step;
+        step *= error >= 5 ? 10 : error >= 2 ? 5 : error >= 1.5 ? 2 : 1;
+        var values = [];
+        for (var value = Math.ceil(lo / step) * step; value <= hi + step / 1e6; value += step) {
+            values.push(Number(value.toPrecision(12)));
+        }
+        return values;
+    }
+
+    // returns the range of the y-axis: the range of the points and lines, padded as matplotlib
+    // does, then replaced by the bounds of the plot that are set (not -1)
+    function getRange(plot) {
+        var lo = Infinity;
+        var hi = -Infinity;
+        plot.series.forEach(function (series) {
+            var values = series.y.concat([series.median]);
+            for (var q in series.history) {
+                values.push(series.history[q]);
+            }
+            values.forEach(function (value) {
+                if (value !== null) {
+                    lo = Math.min(lo, value);
+                    hi = Math.max(hi, value);
+                }
+            });
+        });
+        if (lo === Infinity) {
+            lo = 0;
+            hi = 1;
+        }
+        var pad = hi > lo ? (hi - lo) * 0.05 : Math.abs(lo) * 0.05 || 1;
+        lo -= pad;
+        hi += pad;
+        if (plot.lo >= 0) {
+            lo = plot.lo;
+        }
+        if (plot.hi >= 0) {
+            hi = plot.hi;
+        }
+        return [lo, hi];
+    }
+
+    function hline(svg, y, color, dash, width) {
+        return element("line", {
+            x1: MARGIN.left, x2: WIDTH - MARGIN.right, y1: y, y2: y,
+            stroke: color, "stroke-width": width, "stroke-dasharray": dash
+        }, svg);
+    }
+
+    function draw(container, plot, tooltip) {
+        var range = getRange(plot);
+        var count = Math.max(plot.labels.length, 1);
+        var width = WIDTH - MARGIN.left - MARGIN.right;
+        var height = HEIGHT - MARGIN.top - MARGIN.bottom;
+        var scaleX = function (x) { return MARGIN.left + width * (count > 1 ? 0.03 + 0.94 * x / (count - 1) : 0.5); };
+        var scaleY = function (y) { return MARGIN.top + height * (1 - (y - range[0]) / (range[1] - range[0])); };
+        var svg = element("svg", {viewBox: "0 0 " + WIDTH + " " + HEIGHT, width: "100%", "font-size": 11, "font-family": "Arial, sans-serif"});
+
+        element("rect", {x: MARGIN.left, y: MARGIN.top, width: width, height: height, fill: "none", stroke: "black"}, svg);
+        ticks(range[0], range[1], 5).forEach(function (value) {
+            var y = scaleY(value);
+            element("line", {x1: MARGIN.left - 4, x2: MARGIN.left, y1: y, y2: y, stroke: "black"}, svg);
+            element("text", {x: MARGIN.left - 7, y: y + 4, "text-anchor": "end"}, svg).textContent = value.toLocaleString();
+        });
+        var label = element("text", {x: 14, y: MARGIN.top + height / 2, "text-anchor": "middle", transform: "rotate(-90 14 " + (MARGIN.top + height / 2) + ")"}, svg);
+        label.textContent = plot.y_axis;
+
+        var clip = "clip" + Math.random().toString(36).slice(2);
+        element("rect", {x: MARGIN.left, y: MARGIN.top, width: width, height: height}, element("clipPath", {id: clip}, svg));
+        var area = element("g", {"clip-path": "url(#" + clip + ")"}, svg);
+        var legend = [];
+
+        plot.series.forEach(function (series, index) {
+            var color = COLORS[index % COLORS.length];
+            // a plot with a single series has its median in red, as in the PDF report
+            var median = series.name === null ? "#ff0000" : color;
+            var points = element("g", {fill: color}, area);
+            for (var i = 0; i < series.x.length; i++) {
+                if (series.y[i] === null) {
+                    continue;
+                }
+                var point = element("circle", {cx: scaleX(series.x[i]), cy: scaleY(series.y[i]), r: 4}, points);
+                point.dataset.label = plot.labels[series.x[i]] + (series.name === null ? "" : " (" + series.name + ")") + ": " + series.y[i].toLocaleString();
+            }
+            if (series.median !== null) {
+                hline(area, scaleY(series.median), median, "none", 1.5);
+            }
+            for (var q in series.history) {
+                hline(area, scaleY(series.history[q]), series.name === null ? "grey" : color, q === "0.5" ? "6 3" : "2 3", 1);
+            }
+            if (series.name !== null) {
+                legend.push([series.name, color, "point"], [series.name + " median", color, "line"]);
+                if (series.history["0.5"] !== undefined) {
+                    legend.push([series.name + " historical median", color, "dashed"]);
+                }
+            }
+        });
+
+        legend.forEach(function (entry, index) {
+            var x = WIDTH - MARGIN.right + 12;
+            var y = MARGIN.top + 12 + index * 16;
+            if (entry[2] === "point") {
+                element("circle", {cx: x + 8, cy: y - 4, r: 4, fill: entry[1]}, svg);
+            } else {
+                element("line", {x1: x, x2: x + 16, y1: y - 4, y2: y - 4, stroke: entry[1], "stroke-width": 1.5, "stroke-dasharray": entry[2] === "dashed" ? "6 3" : "none"}, svg);
+            }
+            element("text", {x: x + 22, y: y}, svg).textContent = entry[0];
+        });
+
+        svg.addEventListener("mouseover", function (event) {
+            if (event.target.dataset && event.target.dataset.label) {
+                tooltip.textContent = event.target.dataset.label;
+                tooltip.style.display = "block";
+                event.target.setAttribute("r", 6);
+            }
+        });
+        svg.addEventListener("mousemove", function (event) {
+            tooltip.style.left = (event.pageX + 12) + "px";
+            tooltip.style.top = (event.pageY + 12) + "px";
+        });
+        svg.addEventListener("mouseout", function (event) {
+            if (event.target.dataset && event.target.dataset.label) {
+                tooltip.style.display = "none";
+                event.target.setAttribute("r", 4);
+            }
+        });
+        container.parentNode.insertBefore(svg, container);
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        var tooltip = document.createElement("div");
+        tooltip.className = "plot-tooltip";
+        document.body.appendChild(tooltip);
+        var plots = document.querySelectorAll("script.plot-data");
+        for (var i = 0; i < plots.length; i++) {
+            draw(plots[i], JSON.parse(plots[i].textContent), tooltip);
+        }
+    });
+})();
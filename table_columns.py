@@ -9,9 +9,12 @@ for json keys if possible.
 # add columns that are used in multiple tables here for re-usability 
 class CommonColumns:
     SampleID = "sample_id"
+    SampleType = "sample_type"
     TotalClusters = "total_clusters"
     MappedReads = "mapped_reads"
     Case = "case"
+    Outliers = "outliers"   # columns of a row flagged as cohort outliers
+    LimsKey = "lims_key"    # lims key of a lane, or the lims keys of the lanes combined into a row
 
 class CasesTableColumns:
     Case = CommonColumns.Case
@@ -72,7 +75,7 @@ class StarFusionTableColumns:
     NumRecords = "num_records"
 
 class WGLaneLevelTableColumns:
-    SampleType = "sample_type"
+    SampleType = CommonColumns.SampleType
     Case = CommonColumns.Case
     SampleID = CommonColumns.SampleID
     CoverageDedup = "coverage_dedup"
@@ -81,6 +84,9 @@ class WGLaneLevelTableColumns:
     TotalClusters = CommonColumns.TotalClusters
     MappedReads = CommonColumns.MappedReads
     Lane = "lane"
+    NumLanes = "num_lanes"  # lanes combined into a row when lanes are rolled up by run
+    Source = "source"
+    LimsKey = CommonColumns.LimsKey
     
 class WGCallReadyTableColumns:
     SampleType = WGLaneLevelTableColumns.SampleType
@@ -101,6 +107,8 @@ class WTLaneLevelTableColumns:
     MappedReads = CommonColumns.MappedReads
     RRNAContamination = "rrna_contam"
     Lane = "lane"
+    NumLanes = WGLaneLevelTableColumns.NumLanes
+    LimsKey = CommonColumns.LimsKey
 
 class WTCallReadyTableColumns:
     Case = CommonColumns.Case
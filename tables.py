@@ -1,6 +1,9 @@
-from typing import Dict, List
-import sqlite3
+from typing import Dict, List, Tuple
+from functools import lru_cache
 import json
+import math
+import os
+import pandas as pd
 from table_columns import (
     CommonColumns,
     RSEMTableColumns,
@@ -18,47 +21,75 @@ from plot import (
     Plot,
     SeqPlot,
 )
+from cohort_stats import (
+    CohortStats,
+    COHORT,
+)
+from run_context import RunContext
+from lims_index import get_lims_set_index
 
 NUM_DP = 2 # number of decimal points
+SEQUENZA_FGA_GAMMA = 500    # the only gamma QC-ETL computes the sequenza FGA for
+SAMPLE_ID_COLUMNS = {  # metadata making up a sample ID, selected as plain columns
+    "Tissue Type": None,
+    "Tissue Origin": None,
+    "Library Design": None,
+    "Group ID": None,
+}
+SAMPLE_CODES = "static/data/sample_codes.json"    # definitions of the codes of sample IDs, from MISO
+
+# page geometry used to split tables into pages, in CSS px (landscape A4 with 10mm margins, see style.css)
+PAGE_HEIGHT_PX = 718        # height of the content of a page
+TABLE_WIDTH_PX = 976        # width of a case_table
+TABLE_MARGIN_PX = 60        # margins above and below a case_table
+TITLE_HEIGHT_PX = 60        # title and blurb above the first page of a table
+FONT_PX = 9                 # font size of a case_table
+LINE_HEIGHT = 1.2           # height of a line of text, relative to the font size
+CHAR_WIDTH = 0.6            # average width of a character, relative to the font size
+CELL_PADDING_PX = 8         # padding above and below a cell
+HEADER_PADDING_PX = 12      # padding above and below a heading
 
 # The Table class defines each table that is generated
 class Table:
-    base_db_path: str       # base path to databases that are queried
+    run: RunContext         # the report run, with the input cases and database location
     title: str              # title of table
     blurb = ""              # descriptive blurb of table
     headings: Dict[str,str] # headings for each column to be displayed on table
-    columns: Dict[str, int] # columns we want from sql table. Must match EXACTLY
-    data: Dict              # data from input file
+    columns: Dict[str, str] # columns we want from sql table, as SQL expressions. Must match EXACTLY
     source_table: str       # table we query from
     source_db: str          # database we query from
     process: List[str]      # workflow names
-    plots = {}              # Plots to generate for this table
-    data = {}
+    plots: Dict[str, Plot]  # Plots to generate for this table
     pipeline_step: str
     glossary: Dict[str,str] # Dict[name of column, definition]
-    pct_stats = set()       # set of columns where the data is a percentage (i.e. 0 < data < 1) WHEN IT IS PULLED FROM database
+    pct_stats: set          # set of columns where the data is a percentage (i.e. 0 < data < 1) WHEN IT IS PULLED FROM database
                             # some stats are already multipled by 100 and should NOT be added
-
-    def __init__(self, input_file, use_stage):
-        env = "staging" if use_stage else "production"
-
-        with open(input_file) as f:
-            Table.data = json.load(f)
-            Table.project = Table.data["project"]
-            Table.release = Table.data["release"]
-            Table.data = Table.data["cases"]
-        Table.cases = list(Table.data.keys())
-        Table.cases.sort()
-        Table.base_db_path = f"/scratch2/groups/gsi/{env}/qcetl_v1/" 
+    lanes: List[Dict]       # rows of each lane, kept for the export when lane level rows are rolled up by run
+    fallback: str           # fallback computing the columns from the output files of workflow runs missing from
+                            # QC-ETL, see fallback.py. None if the table has none
+    fallback_library: str   # library design of the tumour samples whose files the fallback reads
+    samples: List[Tuple[str, str]]  # (library design, sample type) of the samples of each case the table
+                                    # reads from the input json, checked by validate.py
+    reads_analysis: bool    # True if the table reads the workflow runs of pipeline_step from the input json
+
+    def __init__(self, run):
+        self.run = run
+        self.plots = {}
+        self.pct_stats = set()
+        self.lanes = None
+        self.fallback = None
+        self.samples = []
+        self.reads_analysis = True
 
     def get_select(self):
         """
-        None -> str, dict[str, int]
+        None -> dict[str, str], dict[str, int]
         
-        Creates an index dictionary that maps what column of the table corresponds to
-        the i-th index of the select block.
+        Returns the columns to select from the data source, by name with the SQL expression
+        computing each of them, and an index dictionary that maps what column of the table
+        corresponds to the i-th value of the selected row.
 
-        Ex. the select block "num1, num2, num3, num4" will produce an index dictionary
+        Ex. the columns num1, num2, num3, num4 will produce an index dictionary
             {
                 num1: 0,
                 num2: 1,
@@ -68,15 +99,13 @@ class Table:
     
         """
         indices = {}
-        select_block = ""
-        for index, (key, value) in enumerate(self.columns.items()):
+        for index, key in enumerate(self.columns.keys()):
             indices[key] = index
-            select_block = select_block + f"{value}, "
-        return select_block[:-2], indices
+        return dict(self.columns), indices
 
-    def add_plot_data(self, plot, val, id):
+    def add_plot_data(self, plot, val, id, case):
         """
-        (str, Any, str) -> None
+        (str, Any, str, str) -> None
         
         Checks if plot is a graph we want to generate for this table and then
         adds the data-point (val, id) to the correct plot data.
@@ -86,38 +115,69 @@ class Table:
         - plot (str): name of the column we want to plot
         - val  (any): y-value being plotted
         - id (str): x-value being plotted
+        - case (str): the case the data-point belongs to
     
         """
         if plot in self.plots.keys():
-            self.plots[plot].add_data(val, id)
+            self.plots[plot].add_data(val, id, case)
     
-    def get_sample_id(self, cur, case, swid, pk, table_index=0):
+    def get_sample_id(self, case, rows, swid, pk):
         """
-        (SQLCursor, str, str, str, int) -> str
+        (str, list[tuple], str, str) -> str
         
-        Gets the sample id for case where the pk (primary key) equals swid
+        Gets the sample id for case from the first of the rows where the pk (primary key)
+        equals swid. Rows start with the sample metadata
 
         Parameters
         ----------
-        - cur (SQLCursor): SQL cursor connected to the correct database
         - case (str): the case of the sample being queried
-        - swid (str): the swid of the sample being queried
-        - pk (str): the primary key that swid refers to
+        - rows (list[tuple]): the rows returned for swid
         - swid (str): the value of the primary key of the sample being queried
+        - pk (str): the primary key that swid refers to
     
         """
-        try:
-            row = cur.execute(
-                f"""
-                select "Tissue Type", "Tissue Origin", "Library Design", "Group ID"
-                from {self.source_table[table_index]}
-                where "{pk}" like '%{swid}%';
-                """
-            ).fetchall()[0]
-            return f"{case}_{row[0]}_{row[1]}_{row[2]}_{row[3]}"
-        except:
+        if not rows:
             print(f"No data found for {case}, where {pk} = {swid}")
             return "nd"
+        row = rows[0]
+        return f"{case}_{row[0]}_{row[1]}_{row[2]}_{row[3]}"
+
+    def get_substring_rows(self, db, table, key_column, keys, columns):
+        """
+        (str, str, str, list, dict[str, str]) -> dict[str, list[tuple]]
+        
+        Gets the rows of keys that are only found as part of a longer value of key_column,
+        as matched by a LIKE '%key%' lookup, ignoring case. Returns the rows grouped by key.
+        The distinct values of key_column are read once, so only keys that match no value
+        exactly should be looked up this way. No rows are looked up while the requests of a
+        batch are recorded, as every key is missing then
+
+        Parameters
+        ----------
+        - db (str): name of the QC-ETL database holding table
+        - table (str): name of the table being queried
+        - key_column (str): the column keys are matched against
+        - keys (list): the keys that were not found exactly
+        - columns (dict): the columns being selected from the SQL table, from get_select
+    
+        """
+        if not keys or self.run.source.records_only:
+            return {}
+        values = [str(value) for value in self.run.source.get_values(db, table, key_column) if value is not None]
+        matches = {key: [value for value in values if key.lower() in value.lower()] for key in keys}
+        found = self.run.source.get_rows(
+            db,
+            table,
+            key_column,
+            list(dict.fromkeys(value for key_values in matches.values() for value in key_values)),
+            columns
+        )
+        rows = {}
+        for key, key_values in matches.items():
+            key_rows = [row for value in key_values for row in found.get(value.strip(), [])]
+            if key_rows:
+                rows[key] = key_rows
+        return rows
 
     def get_row_data(self, indices, row, table_cols, entry):
         """
@@ -134,6 +194,10 @@ class Table:
     
         """
         for column in self.columns.keys():
+            if row[indices[column]] is None:
+                #a column with no value (e.g. the Ti/Tv ratio of a run with no transversions) is nd
+                entry[column] = "nd"
+                continue
             entry[column] = (
                 #multiply by 100 if the current column is a percentage that is in decimal form
                 row[indices[column]] * 100
@@ -147,7 +211,7 @@ class Table:
                 else round(entry[column], NUM_DP)
             )
             #add each data point to the correct graph
-            self.add_plot_data(column, entry[column], entry[table_cols.SampleID])
+            self.add_plot_data(column, entry[column], entry[table_cols.SampleID], entry[table_cols.Case])
         return entry
 
     def get_nd_entry(self, indices, case, source_table):
@@ -179,48 +243,92 @@ class Table:
         dict represents a row in the table and each kvp in the dict
         represent a column in the specific row
         """
-        #connect to the correct database
-        con = sqlite3.connect(self.base_db_path + self.source_db + "/latest")
-        cur = con.cursor()
-
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
 
-        for case in Table.cases:
-            context  = {
-                case: []
-            }
-            #get wfr, used as primary key to query SQL table
+        #get wfr of each case, used as primary key to query SQL table
+        wfrs = {}
+        for case in self.run.cases:
             wfr = None
-            for limkey, run_info in Table.data[case]["analysis"][self.pipeline_step].items():
+            for limkey, run_info in self.run.data[case]["analysis"][self.pipeline_step].items():
                 if run_info["wf"] in self.process:
                     wfr = limkey
             if not wfr:
                 raise Exception(f"No limkey found for {case} -- {self.process}")
+            wfrs[case] = wfr
+
+        rows = self.run.source.get_rows(
+            self.source_db,
+            self.source_table[0],
+            "Workflow Run SWID",
+            list(wfrs.values()),
+            {**SAMPLE_ID_COLUMNS, **columns}
+        )
+        fallback_rows = self.get_fallback_rows([wfr for wfr in wfrs.values() if not rows.get(wfr)])
+        rows.update(fallback_rows)
 
+        for case in self.run.cases:
+            context  = {
+                case: []
+            }
+            wfr_rows = rows.get(wfrs[case], [])
             try:
-                row = cur.execute(
-                    f"""
-                    select {select_block}
-                    from {self.source_table[0]}
-                    where "Workflow Run SWID" like '%{wfr}%';
-                    """
-                ).fetchall()[0]
+                row = wfr_rows[0]
                 entry = {}
                 entry[CommonColumns.Case] = case
-                entry[CommonColumns.SampleID] = self.get_sample_id(cur, case, wfr, "Workflow Run SWID")
-                context[case].append(self.get_row_data(indices, row, CommonColumns, entry))
+                if wfrs[case] in fallback_rows:
+                    entry[CommonColumns.SampleID] = self.get_fallback_sample_id(case)
+                else:
+                    entry[CommonColumns.SampleID] = self.get_sample_id(case, wfr_rows, wfrs[case], "Workflow Run SWID")
+                context[case].append(self.get_row_data(indices, row[4:], CommonColumns, entry))
             except:
                 entry = self.get_nd_entry(indices, case ,self.source_table[0])
                 entry[CommonColumns.Case] = case
-                entry[CommonColumns.SampleID] = self.get_sample_id(cur, case, wfr, "Workflow Run SWID")
+                if wfrs[case] in fallback_rows:
+                    entry[CommonColumns.SampleID] = self.get_fallback_sample_id(case)
+                else:
+                    entry[CommonColumns.SampleID] = self.get_sample_id(case, wfr_rows, wfrs[case], "Workflow Run SWID")
                 context[case].append(entry)
             data.append(context)
-        
-        cur.close()
-        con.close()
         return data
 
+    def get_fallback_rows(self, wfrs):
+        """
+        (list[str]) -> dict[str, list[tuple]]
+        
+        Returns the rows of the workflow runs in wfrs computed by the fallback of the table from
+        their output files, in the form returned by the data source with no sample metadata.
+        Returns no rows if the table has no fallback or the run has no file index
+
+        Parameters
+        ----------
+        - wfrs (list[str]): the workflow runs with no row in QC-ETL
+    
+        """
+        if not self.fallback or not self.run.fallback or not wfrs:
+            return {}
+        values = self.run.fallback.get_values(self.fallback, wfrs)
+        names = [expression.strip().strip('"') for expression in self.columns.values()]
+        return {
+            wfr: [(None,) * len(SAMPLE_ID_COLUMNS) + tuple(wfr_values.get(name) for name in names)]
+            for wfr, wfr_values in values.items()
+        }
+
+    def get_fallback_sample_id(self, case):
+        """
+        (str) -> str
+        
+        Returns the sample id of a row computed by the fallback: the tumour samples of case
+        with the library design of the fallback, from the input json
+
+        Parameters
+        ----------
+        - case (str): the case of the row
+    
+        """
+        samples = self.run.data[case].get(self.fallback_library, {}).get("Tumour", {})
+        return ", ".join(sorted(samples)) if samples else "nd"
+
     def load_context(self):
         """
         None -> dict[str, Any]
@@ -234,6 +342,199 @@ class Table:
             "blurb": self.blurb,
             "glossary": self.glossary,
         }
+        if self.lanes is not None:
+            context["lanes"] = self.lanes
+        return context
+
+    def get_stats_group(self, row):
+        """
+        (dict) -> str
+        
+        Returns the group row belongs to when computing cohort statistics
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
+    
+        """
+        return COHORT
+
+    def get_group_label(self, group):
+        """
+        (str) -> str
+        
+        Returns the name of group to display in the table
+
+        Parameters
+        ----------
+        - group (str): a group returned by get_stats_group
+    
+        """
+        return "Cohort"
+
+    def get_row_key(self, row):
+        """
+        (dict) -> tuple
+        
+        Returns the key identifying row when comparing the rows of two releases
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
+    
+        """
+        return (row.get(CommonColumns.Case), row.get(CommonColumns.SampleID))
+
+    def get_stats_columns(self):
+        """
+        None -> list[str]
+        
+        Returns the columns cohort statistics are computed for: the columns pulled
+        from the database and the columns that are plotted
+        """
+        return list(dict.fromkeys(list(self.columns.keys()) + list(self.plots.keys())))
+
+    def get_stats(self, data):
+        """
+        (list[dict]) -> CohortStats
+        
+        Computes the cohort statistics of each column of the table and flags the
+        columns of each row that are cohort outliers
+
+        Parameters
+        ----------
+        - data (list[dict]): the rows of the table, as returned by get_data
+    
+        """
+        rows = [row for context in data for case_rows in context.values() for row in case_rows]
+        stats = CohortStats(rows, self.get_stats_columns(), self.get_stats_group)
+        for row in rows:
+            row[CommonColumns.Outliers] = []
+        for column, positions in stats.outliers.items():
+            for position in positions:
+                rows[position][CommonColumns.Outliers].append(column)
+        return stats
+
+    def get_row_height(self, values, padding):
+        """
+        (list, int) -> float
+        
+        Estimates the height of a row of the table, in px, from the length of the text
+        of each cell. Long values wrap onto several lines in columns of equal width
+
+        Parameters
+        ----------
+        - values (list): values of the cells of the row
+        - padding (int): padding above and below each cell
+    
+        """
+        column_width = TABLE_WIDTH_PX / max(len(self.headings), 1) - 2 * CELL_PADDING_PX
+        chars_per_line = max(int(column_width / (CHAR_WIDTH * FONT_PX)), 1)
+        lines = max([math.ceil(len(str(value)) / chars_per_line) for value in values] + [1])
+        return lines * FONT_PX * LINE_HEIGHT + 2 * padding
+
+    def get_pages(self, data, summary):
+        """
+        (list[dict], list[dict]) -> list[list[dict]]
+        
+        Splits the rows of the table, followed by its summary rows, into pages. Each page
+        is rendered as its own table with the headings repeated, so the layout of a page
+        does not depend on the length of the table. Each row is returned as a dict with
+        the row and its class (odd or even for the rows of alternate cases, or summary)
+
+        Parameters
+        ----------
+        - data (list[dict]): rows of the table by case, as returned by get_data
+        - summary (list[dict]): summary rows of the table, as returned by get_summary_rows
+    
+        """
+        rows = []
+        for count, entry in enumerate(data):
+            for case_rows in entry.values():
+                for row in case_rows:
+                    rows.append({"row": row, "class": "odd" if count % 2 == 0 else "even"})
+        rows += [{"row": row, "class": "summary"} for row in summary]
+
+        header_height = self.get_row_height(self.headings.values(), HEADER_PADDING_PX)
+        page_height = PAGE_HEIGHT_PX - TABLE_MARGIN_PX - header_height
+        pages = [[]]
+        available = page_height - TITLE_HEIGHT_PX
+        for item in rows:
+            height = self.get_row_height([item["row"].get(column, "") for column in self.headings], CELL_PADDING_PX)
+            if height > available and pages[-1]:
+                pages.append([])
+                available = page_height
+            pages[-1].append(item)
+            available -= height
+        return pages
+
+    def get_summary_rows(self, stats, history=None):
+        """
+        (CohortStats, dict) -> list[dict]
+        
+        Returns the median, minimum and maximum of each column for each group as
+        rows to display at the end of the table, followed by the historical median
+        of each group if history is given
+
+        Parameters
+        ----------
+        - stats (CohortStats): the cohort statistics of the table
+        - history (dict): historical percentiles of each column for each group,
+                          from BaselineStore.get_history
+    
+        """
+        columns = self.get_stats_columns()
+        if not columns:
+            return []
+        label_column = list(self.headings.keys())[0]
+        summary = []
+        for group in stats.groups:
+            for name, stat in [("median", "median"), ("minimum", "min"), ("maximum", "max")]:
+                row = {label_column: f"{self.get_group_label(group)} {name}"}
+                for column in columns:
+                    group_stats = stats.get_column(column).get(group)
+                    row[column] = self.format_stat(group_stats[stat]) if group_stats else ""
+                summary.append(row)
+            if history and any(group in groups for groups in history.values()):
+                row = {label_column: f"{self.get_group_label(group)} historical median"}
+                for column in columns:
+                    percentiles = history.get(column, {}).get(group)
+                    row[column] = self.format_stat(percentiles[0.5]) if percentiles else ""
+                summary.append(row)
+        return summary
+
+    def format_stat(self, value):
+        """
+        (float) -> float | int
+        
+        Rounds a summary statistic for display
+
+        Parameters
+        ----------
+        - value (float): the statistic
+    
+        """
+        value = round(value, NUM_DP)
+        #show whole numbers (i.e. call counts) without decimal places
+        return int(value) if value.is_integer() else value
+
+    def merge_context(self, contexts):
+        """
+        (list[dict[str, Any]]) -> dict[str, Any]
+        
+        Combines the contexts of the table loaded for several shards of the cases
+        into the context of the whole table
+
+        Parameters
+        ----------
+        - contexts (list[dict]): contexts returned by load_context for each shard
+    
+        """
+        context = dict(contexts[0])
+        for key in ["data", "lanes"]:
+            if key in context:
+                data = [entry for shard in contexts for entry in shard[key]]
+                context[key] = sorted(data, key=lambda d: list(d.keys()))
         return context
 
 # SeqTable class defines a table for Raw Sequence data (WG and WT) and
@@ -241,9 +542,9 @@ class Table:
 # Main addition from Table class is that SeqTable can specify in the
 # plots/tables if the sample is Matched Normal or Tumour
 class SeqTable(Table):
-    def add_plot_data(self, plot, sample_type, val, id):
+    def add_plot_data(self, plot, sample_type, val, id, case):
         """
-        (str, str, Any, str) -> None
+        (str, str, Any, str, str) -> None
         
         Checks if plot is a graph we want to generate for this table and then
         adds the data-point (val, id) to the correct plot data.
@@ -254,14 +555,114 @@ class SeqTable(Table):
         - sample_type (str): specifies what type the sample is (Normal, Tumour)
         - val  (any): y-value being plotted
         - id (str): x-value being plotted
+        - case (str): the case the data-point belongs to
     
         """
         if plot in self.plots.keys():
-            self.plots[plot].add_data(sample_type, val, id)
+            self.plots[plot].add_data(sample_type, val, id, case)
+
+    def get_row_key(self, row):
+        """
+        (dict) -> tuple
+        
+        Returns the key identifying row when comparing the rows of two releases.
+        The sample type tells apart the samples of a case whose sample ID is not known
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
+    
+        """
+        return super().get_row_key(row) + (row.get(CommonColumns.SampleType),)
 
-    def get_row_data(self, indices, row, table_cols, entry, sample_type):
+    def get_stats_group(self, row):
         """
-        (dict, tuple, ColumnObject, dict, str) -> dict
+        (dict) -> str
+        
+        Returns the sample type (Normal, Tumour) of row, so cohort statistics are
+        computed for each sample type
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
+    
+        """
+        display_types = {display: stype for stype, display in self.sample_types.items()}
+        return display_types.get(
+            row.get(CommonColumns.SampleType),
+            list(self.sample_types.keys())[0]
+        )
+
+    def get_group_label(self, group):
+        """
+        (str) -> str
+        
+        Returns the name of the sample type group to display in the table
+
+        Parameters
+        ----------
+        - group (str): a sample type returned by get_stats_group
+    
+        """
+        return self.sample_types.get(group, group)
+
+    def get_merged_rows(self, lims_sets, columns):
+        """
+        (dict[Any, list[str]], dict[str, str]) -> dict[Any, list[tuple]]
+        
+        Gets the call ready rows merged from each set of lims keys in lims_sets. Rows are
+        found through the canonical lims-set index of "Merged Pinery Lims ID", then fetched
+        with one batched query. Each row holds the sample metadata followed by columns
+
+        Parameters
+        ----------
+        - lims_sets (dict): maps a name to the set of lims keys being queried
+        - columns (dict): the columns being selected from the SQL table, from get_select
+    
+        """
+        source = self.run.source
+        index = get_lims_set_index(
+            self.source_db,
+            source.get_snapshot(self.source_db),
+            self.source_table[0],
+            "Merged Pinery Lims ID",
+            lambda: source.get_values(self.source_db, self.source_table[0], "Merged Pinery Lims ID")
+        )
+        values = {name: index.lookup(lims_keys) for name, lims_keys in lims_sets.items()}
+        rows = source.get_rows(
+            self.source_db,
+            self.source_table[0],
+            "Merged Pinery Lims ID",
+            [value for name_values in values.values() for value in name_values],
+            {**SAMPLE_ID_COLUMNS, **columns}
+        )
+        return {
+            name: [row for value in name_values for row in rows.get(value, [])]
+            for name, name_values in values.items()
+        }
+
+    def get_merged_sample_id(self, case, rows, lims_keys):
+        """
+        (str, list[tuple], list[str]) -> str
+        
+        Gets the sample id for case from the first of the call ready rows merged from lims_keys
+
+        Parameters
+        ----------
+        - case (str): the case of the sample being queried
+        - rows (list[tuple]): the rows returned by get_merged_rows for lims_keys
+        - lims_keys (list[str]): the lims keys the rows were merged from
+    
+        """
+        if not rows:
+            print(f"No data found for {case}, where Merged Pinery Lims ID = {sorted(lims_keys)}")
+            return "nd"
+        row = rows[0]
+        return f"{case}_{row[0]}_{row[1]}_{row[2]}_{row[3]}"
+
+    def get_row_data(self, indices, row, table_cols, entry, sample_type, plot=True):
+        """
+        (dict, tuple, ColumnObject, dict, str, bool) -> dict
         
         Returns the a dict of the an entire row of values for the table
 
@@ -272,6 +673,7 @@ class SeqTable(Table):
         - table_cols (ColumnObject): table-specific column object, found in table_columns.py
         - entry (dict): dictionary that maps the column with its value for the current row
         - sample_type (str): specifies what type the sample is (Normal, Tumour)
+        - plot (bool): set to False to leave the values out of the plots of the table
 
         """
         for column in self.columns.keys():
@@ -285,12 +687,130 @@ class SeqTable(Table):
                 if isinstance(entry[column], str)
                 else round(entry[column],NUM_DP)
             )
-            self.add_plot_data(column, sample_type, entry[column], entry[table_cols.Case])
+            if plot:
+                self.add_plot_data(column, sample_type, entry[column], entry[table_cols.Case], entry[table_cols.Case])
         return entry
 
+    def set_lane_rollup(self, table_cols):
+        """
+        (ColumnObject) -> None
+        
+        Adds the number of lanes of each row to the headings and glossary of a lane level
+        table whose lanes are rolled up by sequencing run, and explains the rollup in its blurb
+
+        Parameters
+        ----------
+        - table_cols (ColumnObject): table-specific column object, found in table_columns.py
+    
+        """
+        headings = {}
+        for column, heading in self.headings.items():
+            headings[column] = heading
+            if column == table_cols.Lane:
+                headings[table_cols.NumLanes] = "Lanes"
+        self.headings = headings
+        self.glossary = {
+            table_cols.NumLanes: "Number of lanes of the sequencing run combined into the row",
+            **self.glossary,
+        }
+        sums = " and ".join(self.headings[column] for column in self.headings if column in self.lane_sums)
+        self.blurb = f"""
+        The lanes of each sample are combined by sequencing run. {sums} are summed over the lanes,
+        the other values are averaged weighted by {self.headings[self.lane_weight]}. The values of
+        each lane are included in the data export.
+        """
+
+    def get_rollup_row(self, indices, rows):
+        """
+        (dict, list[tuple]) -> tuple
+        
+        Returns one row combining the rows of the lanes of a sequencing run. Columns in
+        self.lane_sums are summed, the others are averaged weighted by self.lane_weight,
+        or averaged if no lane has a weight. Values that are not numbers are left out,
+        and a column with no value is None
+
+        Parameters
+        ----------
+        - indices (dict): dictionary that maps the column with what index it is in the SQL query
+        - rows (list[tuple]): rows of the lanes, as returned from the sql query
+    
+        """
+        combined = [None] * len(indices)
+        weight_index = indices[self.lane_weight]
+        for column, index in indices.items():
+            values = [
+                (row[index], row[weight_index]) for row in rows
+                if isinstance(row[index], (int, float))
+            ]
+            if not values:
+                continue
+            if column in self.lane_sums:
+                combined[index] = sum(value for value, _ in values)
+                continue
+            weighted = [(value, weight) for value, weight in values if isinstance(weight, (int, float)) and weight > 0]
+            if weighted:
+                combined[index] = sum(value * weight for value, weight in weighted) / sum(weight for _, weight in weighted)
+            else:
+                combined[index] = sum(value for value, _ in values) / len(values)
+        return tuple(combined)
+
+    def rollup_lanes(self, lanes, indices, table_cols):
+        """
+        (list[tuple[dict, tuple]], dict, ColumnObject) -> list[dict]
+        
+        Returns one row for each sample and sequencing run, combining the rows of its lanes
+        with get_rollup_row. The values of the combined rows are added to the plots
+
+        Parameters
+        ----------
+        - lanes (list[tuple]): the row of the table of each lane, with the row returned from
+                               the sql query for the lane, or None if it has no data
+        - indices (dict): dictionary that maps the column with what index it is in the SQL query
+        - table_cols (ColumnObject): table-specific column object, found in table_columns.py
+    
+        """
+        runs = {}
+        for entry, row in lanes:
+            runs.setdefault((entry[table_cols.SampleID], entry[table_cols.Lane]), []).append((entry, row))
+
+        data = []
+        for run_lanes in runs.values():
+            entry = {
+                column: value for column, value in run_lanes[0][0].items()
+                if column not in self.columns
+            }
+            entry[table_cols.NumLanes] = len(run_lanes)
+            entry[table_cols.LimsKey] = ", ".join(sorted(lane[table_cols.LimsKey] for lane, _ in run_lanes))
+            if hasattr(table_cols, "Source"):
+                sources = [lane[table_cols.Source] for lane, _ in run_lanes if lane[table_cols.Source] != "nd"]
+                entry[table_cols.Source] = ", ".join(dict.fromkeys(sources)) if sources else "nd"
+            rows = [row for _, row in run_lanes if row is not None]
+            try:
+                combined = self.get_rollup_row(indices, rows)
+                if None in combined:
+                    raise Exception("Lanes have no value for some columns")
+                data.append(self.get_row_data(indices, combined, table_cols, entry, self.get_stats_group(entry)))
+            except:
+                entry.update({column: "nd" for column in indices.keys()})
+                data.append(entry)
+        return data
+
+@lru_cache(maxsize=None)
+def get_sample_codes() -> Dict[str, Dict[str, str]]:
+    """
+    None -> dict[str, dict[str, str]]
+
+    Returns the definition of each tissue type, tissue origin and library design code of sample
+    IDs, by column of the cases table. The definitions are from the Configuration tab in MISO,
+    and are read from static/data/sample_codes.json once per process
+    """
+    with open(os.path.join(os.path.dirname(__file__), SAMPLE_CODES)) as f:
+        return json.load(f)
+
 # CasesTable class defines the Cases table
 class CasesTable(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Cases"
         self.blurb = ""
         self.headings = {
@@ -307,124 +827,93 @@ class CasesTable(Table):
         self.source_db = ""
         self.process = ""
         self.glossary = {}
+        self.samples = [("WG", "Normal"), ("WG", "Tumour"), ("WT", "Tumour")]
+        self.reads_analysis = False
 
     def get_data(self):
         """
         None -> list[dict]
         
-        Queries self.table for the values defined in self.columns and returns a list of dict
-        with the column mapped to its value. Each dict represents a row in the table and each 
-        kvp in the dict represent a column in the specific row
+        Returns the rows of the table, one per sample of each case, with the project, tissue and
+        library codes parsed from the sample ID. The sample IDs of all cases are split at once
         """
-        #takes the glossary and tranforms it into a string for easier display in templating
-        def _get_glossary_string(glossary):
-            keys = list(glossary.keys())
-            keys.sort()
-            entries = [f"{k}: {glossary[k]}" for k in keys]
-            return entries
-
-        metadata_indices = {
-            "proj": 0,
-            "proj_num": 1,
-            "tiss_origin": 2,
-            "tiss_type": 3,
-            "lib": 4,
-        }
+        samples = [
+            (case_id, id)
+            for case_id in self.run.cases
+            for library, stype in self.samples
+            for id in self.run.data[case_id][library][stype]
+        ]
+        data = [{case_id: []} for case_id in self.run.cases]
+        if not samples:
+            return data
+
+        #sample IDs are <project>_<number>_<tissue origin>_<tissue type>_<library design>_...
+        ids = pd.Series([id for _, id in samples])
+        metadata = ids.str.split("_", expand=True).reindex(columns=range(5))
+        invalid = ids[metadata.isna().any(axis=1)]
+        if len(invalid):
+            raise Exception(f"Sample IDs must have at least 5 parts separated by _: {', '.join(invalid)}")
+        columns = zip(
+            metadata[0] + "_" + metadata[1],
+            metadata[3],
+            metadata[2],
+            metadata[4],
+        )
 
-        # definitions are from the Configuration tab in MISO
-        tissue_types = {
-            'X': 'Xenograft derived from some tumour. Note: may not necessarily be a mouse xenograft',
-            'U': 'Unspecified', 'T': 'Unclassifed tumour', 'S': 'Serum from blood where clotting proteins have been removed',
-            'R': 'Reference or non-tumour, non-diseased tissue sample. Typically used as a donor-specific comparison to a diseased tissue, usually a cancer',
-            'P': 'Primary tumour', 'O': 'Organoid', 'n': 'Unknown', 'M': 'Metastatic tumour',
-            'F': 'Fibroblast cells', 'E': 'Endothelial cells', 'C': 'Cell line derived from a tumour',
-            'B': 'Benign tumour', 'A': 'Cells taken from Ascites fluid'
-        }
-        tissue_origin = {
-            'Ab': 'Abdomen', 'Ad': 'Adipose', 'Ae': 'Adnexa', 'Ag': 'Adrenal', 'An': 'Anus',
-            'Ao': 'Anorectal', 'Ap': 'Appendix', 'As': 'Ascites', 'At': 'Astrocytoma', 'Av': 'Ampulla',
-            'Ax': 'Axillary', 'Ba': 'Back', 'Bd': 'Bile', 'Bi': 'Biliary', 'Bl': 'Bladder',
-            'Bm': 'Bone', 'Bn': 'Brain', 'Bo': 'Bone', 'Br': 'Breast', 'Bu': 'Buccal',
-            'Bw': 'Bowel', 'Cb': 'Cord', 'Cc': 'Cecum', 'Ce': 'Cervix', 'Cf': 'Cell-Free', 'Ch': 'Chest',
-            'Cj': 'Conjunctiva', 'Ck': 'Cheek', 'Cn': 'Central', 'Co': 'Colon', 'Cr': 'Colorectal',
-            'Cs': 'Cul-de-sac', 'Ct': 'Circulating', 'Di': 'Diaphragm', 'Du': 'Duodenum',
-            'En': 'Endometrial', 'Ep': 'Epidural', 'Es': 'Esophagus', 'Ey': 'Eye', 'Fa': 'Fallopian',
-            'Fb': 'Fibroid', 'Fs': 'Foreskin', 'Ft': 'Foot', 'Ga': 'Gastric', 'Gb': 'Gallbladder',
-            'Ge': 'Gastroesophageal', 'Gi': 'Gastrointestinal', 'Gj': 'Gastrojejunal', 'Gn': 'Gingiva',
-            'Gt': 'Genital', 'Hp': 'Hypopharynx', 'Hr': 'Heart', 'Ic': 'ileocecum', 'Il': 'Ileum',
-            'Ki': 'Kidney', 'La': 'Lacrimal', 'Lb': 'Limb', 'Le': 'Leukocyte', 'Lg': 'Leg',
-            'Li': 'Large', 'Ln': 'Lymph', 'Lp': 'Lymphoblast', 'Lu': 'Lung', 'Lv': 'Liver', 
-            'Lx': 'Larynx', 'Ly': 'Lymphocyte', 'Md': 'Mediastinum', 'Me': 'Mesenchyme', 'Mn': 'Mandible',
-            'Mo': 'Mouth', 'Ms': 'Mesentary', 'Mu': 'Muscle', 'Mx': 'Maxilla', 'Nk': 'Neck',
-            'nn': 'Unknown', 'No': 'Nose', 'Np': 'Nasopharynx', 'Oc': 'Oral', 'Om': 'Omentum',
-            'Or': 'Orbit', 'Ov': 'Ovary', 'Pa': 'Pancreas', 'Pb': 'Peripheral', 'Pc': 'Pancreatobiliary',
-            'Pd': 'Parathyroid', 'Pe': 'Pelvic', 'Pg': 'Parotid', 'Ph': 'Paratracheal', 'Pi': 'Penis',
-            'Pl': 'Plasma', 'Pm': 'Peritoneum', 'Pn': 'Peripheral', 'Po': 'Peri-aorta', 'Pr': 'Prostate',
-            'Pt': 'Palate', 'Pu': 'Pleura', 'Py': 'periampullary', 'Ra': 'Right', 'Rc': 'Rectosigmoid',
-            'Re': 'Rectum', 'Ri': 'Rib', 'Rp': 'Retroperitoneum', 'Sa': 'Saliva', 'Sb': 'Small',
-            'Sc': 'Scalp', 'Se': 'Serum', 'Sg': 'Salivary', 'Si': 'Small', 'Sk': 'Skin', 'Sm': 'Skeletal',
-            'Sn': 'Spine', 'So': 'Soft', 'Sp': 'Spleen', 'Sr': 'Serosa', 'Ss': 'Sinus', 'St': 'Stomach',
-            'Su': 'Sternum', 'Ta': 'Tail', 'Te': 'Testes', 'Tg': 'Thymic', 'Th': 'Thymus',
-            'Tn': 'Tonsil', 'To': 'Throat', 'Tr': 'Trachea', 'Tu': 'Tongue', 'Ty': 'Thyroid',
-            'Uc': 'Urachus', 'Ue': 'Ureter', 'Um': 'Umbilical', 'Up': 'Urine', 'Ur': 'Urethra',
-            'Us': 'Urine', 'Ut': 'Uterus', 'Uw': 'Urine', 'Vg': 'Vagina', 'Vu': 'Vulva', 'Wm': 'Worm'
-        }
-        library_design = {
-            'WT': 'Whole Transcriptome', 'WG': 'Whole Genome', 'TS': 'Targeted Sequencing',
-            'TR': 'Total RNA', 'SW': 'Shallow Whole Genome', 'SM': 'smRNA', 'SC': 'Single Cell',
-            'NN': 'Unknown', 'MR': 'mRNA', 'EX': 'Exome', 'CT': 'ctDNA', 'CM': 'cfMEDIP',
-            'CH': 'ChIP-Seq', 'BS': 'Bisulphite Sequencing', 'AS': 'ATAC-Seq'
-            }
+        rows = {case_id: context[case_id] for case_id, context in zip(self.run.cases, data)}
+        for (case_id, id), (case, tissue_type, tissue_origin, library_design) in zip(samples, columns):
+            rows[case_id].append(
+                {
+                    CasesTableColumns.Case: case,
+                    CasesTableColumns.TissueType: tissue_type,
+                    CasesTableColumns.TissueOrigin: tissue_origin,
+                    CasesTableColumns.LibraryDesign: library_design,
+                    CasesTableColumns.ExternalID: self.run.data[case_id]["external_id"],
+                    CasesTableColumns.SampleID: id,
+                }
+            )
+        self.glossary = self.get_glossary(data)
+        return data
 
-        data = []
-        glossary = {
-            CasesTableColumns.TissueType: {},
-            CasesTableColumns.TissueOrigin: {},
-            CasesTableColumns.LibraryDesign: {},
-        }
+    def get_glossary(self, data):
+        """
+        (list[dict]) -> dict[str, str]
+        
+        Returns the glossary of the codes used in the rows of data, with the definitions
+        of each column joined into a string for easier display in templating
 
-        for case_id, case in Table.data.items():
-            context = {
-                case_id: []
-            }
-            ids = (
-                list(case["WG"]["Normal"].keys())
-                + list(case["WG"]["Tumour"].keys())
-                + list(case["WT"]["Tumour"].keys())
+        Parameters
+        ----------
+        - data (list[dict]): the rows of the table, as returned by get_data
+    
+        """
+        glossary = {}
+        for column, column_definitions in get_sample_codes().items():
+            codes = set(
+                row[column]
+                for context in data
+                for rows in context.values()
+                for row in rows
             )
+            entries = [f"{code}: {column_definitions[code]}" for code in sorted(codes)]
+            glossary[column] = ", ".join(entries) + "."
+        return glossary
 
-            for id in ids:
-                metadata = id.split("_")
-                context[case_id].append(
-                    {
-                        CasesTableColumns.Case: (
-                            metadata[metadata_indices["proj"]]
-                            + "_" +
-                            metadata[metadata_indices["proj_num"]]
-                        ),
-                        CasesTableColumns.TissueType: metadata[
-                            metadata_indices["tiss_type"]
-                        ],
-                        CasesTableColumns.TissueOrigin: metadata[
-                            metadata_indices["tiss_origin"]
-                        ],
-                        CasesTableColumns.LibraryDesign: metadata[
-                            metadata_indices["lib"]
-                        ],
-                        CasesTableColumns.ExternalID: case["external_id"],
-                        CasesTableColumns.SampleID: id,
-                    }
-                )            
-                glossary[CasesTableColumns.TissueType][metadata[metadata_indices["tiss_type"]]] = tissue_types[metadata[metadata_indices["tiss_type"]]]
-                glossary[CasesTableColumns.TissueOrigin][metadata[metadata_indices["tiss_origin"]]] = tissue_origin[metadata[metadata_indices["tiss_origin"]]]
-                glossary[CasesTableColumns.LibraryDesign][metadata[metadata_indices["lib"]]] = library_design[metadata[metadata_indices["lib"]]]
-            data.append(context)
-
-            for key, value in glossary.items():
-                self.glossary[key] = ", ".join(_get_glossary_string(value)) + "."
+    def merge_context(self, contexts):
+        """
+        (list[dict[str, Any]]) -> dict[str, Any]
+        
+        Combines the contexts of the table loaded for several shards of the cases.
+        The glossary is rebuilt from the codes used in the combined rows
 
-        data = sorted(data, key=lambda d: list(d.keys()))
-        return data
+        Parameters
+        ----------
+        - contexts (list[dict]): contexts returned by load_context for each shard
+    
+        """
+        context = super().merge_context(contexts)
+        context["glossary"] = self.get_glossary(context["data"])
+        return context
     
     def load_context(self):
         """
@@ -443,7 +932,8 @@ class CasesTable(Table):
 
 #DellyTable class defines a table for the delly workflow
 class DellyTable(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Genomic Structural Variants"
         self.headings = {
             DellyTableColumns.Case: "Case",
@@ -469,6 +959,8 @@ class DellyTable(Table):
         self.source_table = ["analysis_delly_analysis_delly_1"]
         self.source_db = "analysis_delly"
         self.process = ["delly_matched_by_tumor_group", "delly"]
+        self.fallback = "delly"
+        self.fallback_library = "WG"
         self.plots = {
             DellyTableColumns.NumPASS: Plot(
                 title="SV PASS Calls",
@@ -488,7 +980,8 @@ class DellyTable(Table):
 
 #Mutect2Table class defines a table for the mutect2 workflow   
 class Mutect2Table(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Mutations"
         self.blurb = ""
         self.headings = {
@@ -518,6 +1011,8 @@ class Mutect2Table(Table):
         self.source_table = ["analysis_mutect2_analysis_mutect2_1"]
         self.source_db = "analysis_mutect2"
         self.process = ["mutect2_matched_by_tumor_group", "mutect2"]
+        self.fallback = "mutect2"
+        self.fallback_library = "WG"
         self.plots = {
             Mutect2TableColumns.NumPASS: Plot(
                 title="Mutation Calls",
@@ -534,7 +1029,8 @@ class Mutect2Table(Table):
 
 #RSEMTable defines a table for the RSEM workflow
 class RSEMTable(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Gene Expression"
         self.blurb = ""
         self.headings = {
@@ -569,6 +1065,8 @@ class RSEMTable(Table):
         self.source_table = ["analysis_rsem_analysis_rsem_1"]
         self.source_db = "analysis_rsem"
         self.process = ["rsem"]
+        self.fallback = "rsem"
+        self.fallback_library = "WT"
         self.plots = {
             "pct_non_zero": Plot(
                 title="Percent Expressed",
@@ -586,8 +1084,13 @@ class RSEMTable(Table):
 
 #SequenzaTable class defines a table for the Sequenza workflow
 # SequenzaTable pulls data from two SQL databases for one table
+# Every gamma solution is pulled in the same query and kept in self.solutions,
+# but the table and plots show the solution for self.gamma. QC-ETL only has the FGA
+# of SEQUENZA_FGA_GAMMA, which is fetched on its own whatever the gamma
 class SequenzaTable(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
+        self.gamma = run.gamma
         self.title = "Copy Number Alterations"
         self.blurb = ""
         self.headings = {
@@ -598,9 +1101,9 @@ class SequenzaTable(Table):
             SequenzaTableColumns.FGA: "FGA (%)"
         }
         self.glossary = {
-            SequenzaTableColumns.Cellularity: "Cellularity estimate (gamma=500)",
-            SequenzaTableColumns.Ploidy: "Ploidy estimate (gamma = 500)",
-            SequenzaTableColumns.FGA: "Fraction of the genome altered (gamma = 500)"
+            SequenzaTableColumns.Cellularity: f"Cellularity estimate (gamma = {self.gamma})",
+            SequenzaTableColumns.Ploidy: f"Ploidy estimate (gamma = {self.gamma})",
+            SequenzaTableColumns.FGA: f"Fraction of the genome altered (gamma = {SEQUENZA_FGA_GAMMA})"
         }
         self.columns = {
             SequenzaTableColumns.Cellularity: "\"cellularity\"",
@@ -609,7 +1112,7 @@ class SequenzaTable(Table):
         self.pipeline_step = "calls.copynumber"
         self.source_table = [
             "analysis_sequenza_analysis_sequenza_alternative_solutions_1",
-            "analysis_sequenza_analysis_sequenza_gamma_500_fga_1"
+            f"analysis_sequenza_analysis_sequenza_gamma_{SEQUENZA_FGA_GAMMA}_fga_1"
         ]
         self.source_db = "analysis_sequenza"
         self.process = ["sequenza_by_tumor_group", "sequenza"]
@@ -618,6 +1121,7 @@ class SequenzaTable(Table):
                SequenzaTableColumns.FGA, 
             ]
         )
+        self.solutions = {}     # Dict[case, Dict[gamma as float, Dict[column, value]]] for every gamma solution
         self.plots = {
             SequenzaTableColumns.Cellularity: Plot(
                 title="Cellularity",
@@ -638,6 +1142,39 @@ class SequenzaTable(Table):
             ),
         }
     
+    def get_solutions(self, wfrs, columns):
+        """
+        (list, dict[str, str]) -> dict[str, list[tuple]], dict[str, list[tuple]]
+        
+        Gets every gamma solution and the FGA of every workflow run in wfrs, with one batched
+        query for each table. QC-ETL only has the FGA of gamma 500, so it is read on its own
+        rather than joined to the solution of the reported gamma. Returns the rows of each table
+        grouped by workflow run. Solution rows hold the gamma, the sample metadata and the columns
+        in columns, FGA rows hold the sample metadata and the FGA, in that order
+
+        Parameters
+        ----------
+        - wfrs (list): the workflow run SWIDs being queried
+        - columns (dict): the columns being selected from the solutions table, from get_select
+    
+        """
+        solutions, fga = self.source_table
+        solution_rows = self.run.source.get_rows(
+            self.source_db,
+            solutions,
+            "Workflow Run SWID",
+            wfrs,
+            {"gamma": None, **SAMPLE_ID_COLUMNS, **columns}
+        )
+        fga_rows = self.run.source.get_rows(
+            self.source_db,
+            fga,
+            "Workflow Run SWID",
+            wfrs,
+            {**SAMPLE_ID_COLUMNS, "fga": None}
+        )
+        return solution_rows, fga_rows
+
     def get_data(self):
         """
         None -> list[dict]
@@ -646,40 +1183,58 @@ class SequenzaTable(Table):
         with the column mapped to its value. Each dict represents a row in the table and each 
         kvp in the dict represent a column in the specific row
         """
-        #connect to database
-        con = sqlite3.connect(self.base_db_path + self.source_db + "/latest")
-        cur = con.cursor()
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
-    
-        for case in Table.cases:
-            context = {
-                case: []
-            }
+
+        wfrs = {}
+        for case in self.run.cases:
             wfr = None
-            for limkey, run_info in Table.data[case]["analysis"][self.pipeline_step].items():
+            for limkey, run_info in self.run.data[case]["analysis"][self.pipeline_step].items():
                 if run_info["wf"] in self.process:
                     wfr = limkey
             if not wfr:
                 raise Exception(f"No limkey found for {case} -- {self.process}")
+            wfrs[case] = wfr
+
+        rows, fga_rows = self.get_solutions(list(wfrs.values()), columns)
+        gamma = float(self.gamma)
+    
+        for case in self.run.cases:
+            context = {
+                case: []
+            }
+            #index every gamma solution of the case by its gamma, as stored as integer, real or text
+            solutions = {float(row[0]): row for row in rows.get(wfrs[case], []) if row[0] is not None}
+            self.solutions[case] = {
+                solution_gamma: {column: row[5 + index] for column, index in indices.items()}
+                for solution_gamma, row in solutions.items()
+            }
+            case_fga_rows = fga_rows.get(wfrs[case], [])
+
             entry = {}
             entry[SequenzaTableColumns.Case] = case
-            entry[SequenzaTableColumns.SampleID] = self.get_sample_id(
-                cur, case, wfr, "Workflow Run SWID"
-            )
+            #sample metadata of the case, from either table
+            if solutions:
+                metadata = list(solutions.values())[0][1:5]
+            elif case_fga_rows:
+                metadata = case_fga_rows[0][:4]
+            else:
+                metadata = None
+            if metadata:
+                entry[SequenzaTableColumns.SampleID] = f"{case}_{metadata[0]}_{metadata[1]}_{metadata[2]}_{metadata[3]}"
+            else:
+                print(f"No data found for {case}, where Workflow Run SWID = {wfrs[case]}")
+                entry[SequenzaTableColumns.SampleID] = "nd"
 
             #get FGA
             try:
-                row = cur.execute(
-                    f"""
-                    select fga from {self.source_table[1]} where "Workflow Run SWID" like '%{wfr}%';
-                    """
-                ).fetchall()[0]
-                entry[SequenzaTableColumns.FGA] = round(row[0] * 100, NUM_DP)            
+                row = case_fga_rows[0]
+                entry[SequenzaTableColumns.FGA] = round(row[-1] * 100, NUM_DP)            
                 self.add_plot_data(
                     SequenzaTableColumns.FGA,
                     entry[SequenzaTableColumns.FGA],
-                    entry["sample_id"]
+                    entry["sample_id"],
+                    case
                 )
             except:
                 print(f"No data found for {case} in {self.source_table[1]}")
@@ -687,11 +1242,7 @@ class SequenzaTable(Table):
             
             #get rest of column values
             try:
-                row = cur.execute(
-                    f"""
-                    select {select_block} from {self.source_table[0]} where "Workflow Run SWID" like '%{wfr}%' and gamma = 500;
-                    """
-                ).fetchall()[0]
+                row = solutions[gamma][5:]
                 context[case].append(
                     self.get_row_data(indices, row, SequenzaTableColumns, entry)
                 )
@@ -701,14 +1252,12 @@ class SequenzaTable(Table):
                     entry[column] = "nd"
                 context[case].append(entry)
             data.append(context)
-        
-        cur.close()
-        con.close()
         return data
 
 #StarFusion class defines a table for the starfusion workflow
 class StarFusionTable(Table):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Gene Fusions"
         self.blurb = ""
         self.headings = {
@@ -736,7 +1285,8 @@ class StarFusionTable(Table):
 
 #WGCallReadyTable class defines a table for the bamqc4merged workflow
 class WGCallReadyTable(SeqTable):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Whole Genome Libraries, tumour and matched normal"
         self.blurb = ""
         self.headings = {
@@ -804,6 +1354,8 @@ class WGCallReadyTable(SeqTable):
             "Normal": "Matched Normal",
             "Tumour": "Tumour",
         }
+        self.samples = [("WG", stype) for stype in self.sample_types]
+        self.reads_analysis = False
 
     def get_data(self):
         """
@@ -814,42 +1366,38 @@ class WGCallReadyTable(SeqTable):
         Each dict represents a row in the table and each kvp in the 
         dict represent a column in the specific row
         """
-        #connect to database
-        con = sqlite3.connect(self.base_db_path+ self.source_db + "/latest")
-        cur = con.cursor()
-
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
 
-        for case in Table.cases:
+        lims_sets = {}
+        for case in self.run.cases:
+            for stype in self.sample_types.keys():
+                lim_keys = []
+                for key in self.run.data[case]["WG"][stype].keys():
+                    lim_keys = lim_keys + list(self.run.data[case]["WG"][stype][key].keys())
+                lims_sets[(case, stype)] = lim_keys
+        rows = self.get_merged_rows(lims_sets, columns)
+
+        for case in self.run.cases:
             context = {
                 case: []
             }
             for stype, display_type in self.sample_types.items():
-                #primary key is a string of list of limkeys
-                lim_keys = []
-                for key in Table.data[case]["WG"][stype].keys():
-                    lim_keys = lim_keys + list(Table.data[case]["WG"][stype][key].keys())
-                lim_keys.sort()
-                lims = "[\"" + '\", \"'.join(lim_keys) + "\"]"
-
+                lim_keys = lims_sets[(case, stype)]
+                sample_rows = rows[(case, stype)]
                 try:
-                    row = cur.execute(
-                        f"""
-                        select {select_block} from {self.source_table[0]} where "Merged Pinery Lims ID"  like '%{lims}%';
-                        """
-                    ).fetchall()[0]
+                    row = sample_rows[0]
                     entry = {}
                     entry[WGCallReadyTableColumns.Case] = case
                     entry[WGCallReadyTableColumns.SampleType] = display_type
-                    entry[WGCallReadyTableColumns.SampleID] = self.get_sample_id(
-                        cur, case, lims, "Merged Pinery Lims ID"
+                    entry[WGCallReadyTableColumns.SampleID] = self.get_merged_sample_id(
+                        case, sample_rows, lim_keys
                     )                
                     entry[WGCallReadyTableColumns.NumLimsKeys] = len(lim_keys)
                     context[case].append(
                         self.get_row_data(
                             indices,
-                            row,
+                            row[4:],
                             WGCallReadyTableColumns,
                             entry,
                             stype
@@ -863,19 +1411,18 @@ class WGCallReadyTable(SeqTable):
                     )
                     entry[WGCallReadyTableColumns.Case] = case
                     entry[WGCallReadyTableColumns.SampleType] = display_type
-                    entry[WGCallReadyTableColumns.SampleID] = self.get_sample_id(
-                        cur, case, lims, "Merged Pinery Lims ID"
+                    entry[WGCallReadyTableColumns.SampleID] = self.get_merged_sample_id(
+                        case, sample_rows, lim_keys
                     )   
                     context[case].append(entry)
             data.append(context)
-        cur.close()
-        con.close()
         data = sorted(data, key=lambda d: list(d.keys()))
         return data
 
 #WGLaneLevelTable class defines a table for the bamqc4 workflow
 class WGLaneLevelTable(SeqTable):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Whole Genome Libraries, tumour and matched normal"
         self.blurb = ""
         self.headings = {
@@ -949,6 +1496,32 @@ class WGLaneLevelTable(SeqTable):
             "Normal": "Matched Normal",
             "Tumour": "Tumour",
         }
+        self.samples = [("WG", stype) for stype in self.sample_types]
+        self.reads_analysis = False
+        self.lane_sums = set(     # columns summed over the lanes of a run, the others are weighted means
+            [
+                WGLaneLevelTableColumns.CoverageDedup,
+                WGLaneLevelTableColumns.TotalClusters,
+            ]
+        )
+        self.lane_weight = WGLaneLevelTableColumns.TotalClusters
+        if self.run.lane_rollup:
+            self.set_lane_rollup(WGLaneLevelTableColumns)
+
+    def get_row_key(self, row):
+        """
+        (dict) -> tuple
+        
+        Returns the key identifying row when comparing the rows of two releases.
+        Samples have one row per lane, and lanes of a sequencing run share the run
+        in their Lane column, so rows are told apart by their lims keys
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
+    
+        """
+        return super().get_row_key(row) + (row.get(WGLaneLevelTableColumns.LimsKey),)
 
     def get_sample_id(self, stype, case, swid):
         """
@@ -964,34 +1537,67 @@ class WGLaneLevelTable(SeqTable):
         - swid (str): the swid of the sample being queried
     
         """
-        lims_lane_mapping = Table.data[case]["WG"][stype]
+        lims_lane_mapping = self.run.data[case]["WG"][stype]
         for id, value in lims_lane_mapping.items():
             if swid in value.keys():
                 return id, value[swid]["run"]
         raise Exception("There is no Sample ID associated with the limkey")
 
-    def get_row(self, target_cur, src_table_index, select_block, lims):
+    def get_rows(self, columns, lims_keys):
         """
-        (SQLCursor, int, str, str) -> List(tuple)
+        (dict[str, str], list) -> dict[str, tuple], dict[str, int]
         
-        Gets the columns in select_block from the src_table_index-th table in self.table
-        that matches lims
+        Resolves all lims_keys against dnaseqqc in one batched query, then resolves
+        only the keys that were missing against bamqc4 in a second batched query.
+        Keys found in neither table are then matched as part of a longer key, first in
+        dnaseqqc then in bamqc4, with get_substring_rows. Returns the row found for each
+        key and the index (in self.source_table) of the table each row came from
 
         Parameters
         ----------
-        - target_cur (SQLCursor): SQL cursor connected to the correct database
-        - src_table_index (int): the index of the table being queried
-        - select_block (str): the columns being selected from the SQL table
-        - lims (str): the primary key of the sample
+        - columns (dict): the columns being selected from the SQL table, from get_select
+        - lims_keys (list): the primary keys of the lanes
     
         """
-        rows = target_cur.execute(
-            f"""
-            select {select_block}
-            from {self.source_table[src_table_index]}
-            where "Pinery Lims ID" like '%{lims}%';
-            """).fetchall()
-        return rows
+        rows = self.run.source.get_rows(
+            self.source_db[0],
+            self.source_table[0],
+            "Pinery Lims ID",
+            lims_keys,
+            columns
+        )
+        sources = {lims: 0 for lims in rows.keys()}
+
+        missing = [lims for lims in lims_keys if lims not in rows]
+        bamqc4_rows = self.run.source.get_rows(
+            self.source_db[1],
+            self.source_table[1],
+            "Pinery Lims ID",
+            missing,
+            columns
+        )
+        rows.update(bamqc4_rows)
+        sources.update({lims: 1 for lims in bamqc4_rows.keys()})
+
+        #lanes used to be matched with LIKE '%lims%', which also found keys stored as part of a longer value
+        for index in range(len(self.source_table)):
+            missing = [lims for lims in dict.fromkeys(lims_keys) if lims not in rows]
+            substring_rows = self.get_substring_rows(
+                self.source_db[index],
+                self.source_table[index],
+                "Pinery Lims ID",
+                missing,
+                columns
+            )
+            rows.update(substring_rows)
+            sources.update({lims: index for lims in substring_rows.keys()})
+
+        for lims, lims_rows in rows.items():
+            if len(lims_rows) > 1:
+                raise Exception(
+                    f"Multiple rows returned for limkeys {lims}"
+                )
+        return {lims: lims_rows[0] for lims, lims_rows in rows.items()}, sources
 
     def get_data(self):
         """
@@ -1001,62 +1607,34 @@ class WGLaneLevelTable(SeqTable):
         with the column mapped to its value. Each dict represents a row in the table and each 
         kvp in the dict represent a column in the specific row
 
-        Note: get_data needs to check two tables: dnaseqqc and bamqc4. If data is not found in dnaseqqc, 
-                then query bamqc4
+        Note: get_data needs to check two tables: dnaseqqc and bamqc4. Lanes not found in dnaseqqc
+                are looked up in bamqc4. The table each lane came from is recorded in its row
         """
-        dnaseqqc_con = sqlite3.connect(
-            self.base_db_path
-            + self.source_db[0]
-            + "/latest"
-        )
-        dnaseqqc_cur = dnaseqqc_con.cursor()
-
-        bamqc4_con = sqlite3.connect(
-            self.base_db_path
-            + self.source_db[1]
-            + "/latest"
-        )
-        bamqc4_cur = bamqc4_con.cursor()
-
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
 
-        for case in Table.cases:
-            context = {
-                case: []
-            }
-            for stype, display_type in self.sample_types.items():
+        lanes = {}
+        for case in self.run.cases:
+            for stype in self.sample_types.keys():
                 lims_keys = []
-                for key in Table.data[case]["WG"][stype].keys():
+                for key in self.run.data[case]["WG"][stype].keys():
                     lims_keys = lims_keys + list(
-                        Table.data[case]["WG"][stype][key].keys()
+                        self.run.data[case]["WG"][stype][key].keys()
                     )
+                lanes[(case, stype)] = lims_keys
 
-                for lims in lims_keys:
-                    target_cur = dnaseqqc_cur
-                    src_table_index = 0
-
-                    rows = self.get_row(
-                        target_cur,
-                        src_table_index,
-                        select_block,
-                        lims
-                    )
-                    if 0 == len(rows):
-                        target_cur = bamqc4_cur
-                        src_table_index = 1
-                        rows = self.get_row(
-                            target_cur,
-                            src_table_index,
-                            select_block,
-                            lims
-                        )
-
-                    if len(rows) > 1:
-                        raise Exception(
-                            f"Multiple rows returned for limkeys {lims}"
-                        )
+        all_keys = [lims for lims_keys in lanes.values() for lims in lims_keys]
+        rows, sources = self.get_rows(columns, all_keys)
+        lane_rows = {}  # Dict[case, list of (row of each lane, row from the source)], to roll lanes up
 
+        for case in self.run.cases:
+            context = {
+                case: []
+            }
+            lane_rows[case] = []
+            for stype, display_type in self.sample_types.items():
+                for lims in lanes[(case, stype)]:
+                    src_table_index = sources.get(lims, 1)
                     try:
                         entry = {}
                         (
@@ -1064,37 +1642,46 @@ class WGLaneLevelTable(SeqTable):
                             entry[WGLaneLevelTableColumns.Lane]
                         ) = self.get_sample_id(stype, case, lims)
                         entry[WGLaneLevelTableColumns.Case] = case
-                        entry[WGLaneLevelTableColumns.SampleType] = display_type              
+                        entry[WGLaneLevelTableColumns.SampleType] = display_type
+                        entry[WGLaneLevelTableColumns.LimsKey] = lims
+                        entry[WGLaneLevelTableColumns.Source] = self.source_table[src_table_index]
                         context[case].append(
                             self.get_row_data(
                                 indices,
-                                rows[0],
+                                rows[lims],
                                 WGLaneLevelTableColumns,
                                 entry,
                                 stype,
+                                plot=not self.run.lane_rollup,
                             )
                         )
                     except:
                         entry = self.get_nd_entry(indices, case, self.source_table[src_table_index])
                         entry[WGLaneLevelTableColumns.Case] = case
                         entry[WGLaneLevelTableColumns.SampleType] = display_type
+                        entry[WGLaneLevelTableColumns.LimsKey] = lims
+                        entry[WGLaneLevelTableColumns.Source] = "nd"
                         (
                             entry[WGLaneLevelTableColumns.SampleID],
                             entry[WGLaneLevelTableColumns.Lane]
                         ) = self.get_sample_id(stype, case, lims)
                         context[case].append(entry)    
+                    lane_rows[case].append((context[case][-1], rows.get(lims)))
 
             data.append(context)
-        dnaseqqc_cur.close()
-        dnaseqqc_con.close()
-        bamqc4_cur.close()
-        bamqc4_con.close()
         data = sorted(data, key=lambda d: list(d.keys()))
+        if self.run.lane_rollup:
+            self.lanes = data
+            data = [
+                {case: self.rollup_lanes(lane_rows[case], indices, WGLaneLevelTableColumns)}
+                for context in self.lanes for case in context
+            ]
         return data
 
 #WTCallReadyTable class defines a table for the rnaseqqc2merged workflow
 class WTCallReadyTable(SeqTable):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Whole Transcriptome Libraries, tumour only"
         self.blurb = ""
         self.headings = {
@@ -1178,54 +1765,49 @@ class WTCallReadyTable(SeqTable):
         Note: get_data needs to check two tables: dnaseqqc and bamqc4. If data is not found in dnaseqqc, 
                 then query bamqc4
         """
-        con = sqlite3.connect(self.base_db_path+ self.source_db + "/latest")
-        cur = con.cursor()
-
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
 
-        for case in Table.cases:
+        lims_sets = {}
+        for case in self.run.cases:
+            for stype in self.sample_types.keys():
+                #primary key is a list of limkeys
+                lims_sets[(case, stype)] = list(
+                    self.run.data[case]["analysis"][self.pipeline_step].values()
+                )[0]["limkeys"].split(':')
+        rows = self.get_merged_rows(lims_sets, columns)
+
+        for case in self.run.cases:
             context = {
                 case: []
             }
             for stype in self.sample_types.keys():
-                #primary key is a string of list of limkeys
-                limkeys = list(
-                    Table.data[case]["analysis"][self.pipeline_step].values()
-                )[0]["limkeys"].split(':')
-                limkeys.sort()
-                lims = "[\"" + "\", \"".join(limkeys) + "\"]"
-
+                limkeys = lims_sets[(case, stype)]
+                sample_rows = rows[(case, stype)]
                 try:
-                    row = cur.execute(
-                        f"""
-                        select {select_block} from {self.source_table[0]} where "Merged Pinery Lims ID"  = '{lims}';
-                        """
-                    ).fetchall()[0]
+                    row = sample_rows[0]
                     entry = {}
                     entry[WTCallReadyTableColumns.Case] = case
-                    entry[WTCallReadyTableColumns.SampleID] = self.get_sample_id(
-                        cur, case, lims, "Merged Pinery Lims ID"
+                    entry[WTCallReadyTableColumns.SampleID] = self.get_merged_sample_id(
+                        case, sample_rows, limkeys
                     )
                     entry[WTCallReadyTableColumns.NumLimsKeys] = len(limkeys)
-                    context[case].append(self.get_row_data(indices, row, WTCallReadyTableColumns, entry, stype))
+                    context[case].append(self.get_row_data(indices, row[4:], WTCallReadyTableColumns, entry, stype))
                 except:
                     entry = self.get_nd_entry(indices, case, self.source_table[0])
                     entry[WTCallReadyTableColumns.Case] = case
-                    entry[WTCallReadyTableColumns.SampleID] = self.get_sample_id(
-                        cur, case, lims, "Merged Pinery Lims ID"
+                    entry[WTCallReadyTableColumns.SampleID] = self.get_merged_sample_id(
+                        case, sample_rows, limkeys
                     )
                     entry[WTCallReadyTableColumns.NumLimsKeys] = len(limkeys) 
                     context[case].append(entry)
             data.append(context)
-
-        cur.close()
-        con.close()
         return data
 
 #WTLaneLevelTable class defines a table for the rnaseqqc2 workflow
 class WTLaneLevelTable(SeqTable):
-    def __init__(self):
+    def __init__(self, run):
+        super().__init__(run)
         self.title = "Whole Transcriptome Libraries, tumour only"
         self.blurb = ""
         self.headings = {
@@ -1298,7 +1880,32 @@ class WTLaneLevelTable(SeqTable):
         self.sample_types = {
             "Tumour": "Tumour",
         }
+        self.samples = [("WT", "Tumour")]
+        self.reads_analysis = False
+        self.lane_sums = set(     # columns summed over the lanes of a run, the others are weighted means
+            [
+                WTLaneLevelTableColumns.TotalClusters,
+            ]
+        )
+        self.lane_weight = WTLaneLevelTableColumns.TotalClusters
+        if self.run.lane_rollup:
+            self.set_lane_rollup(WTLaneLevelTableColumns)
+    
+    def get_row_key(self, row):
+        """
+        (dict) -> tuple
+        
+        Returns the key identifying row when comparing the rows of two releases.
+        Samples have one row per lane, and lanes of a sequencing run share the run
+        in their Lane column, so rows are told apart by their lims keys
+
+        Parameters
+        ----------
+        - row (dict): a row of the table
     
+        """
+        return super().get_row_key(row) + (row.get(WTLaneLevelTableColumns.LimsKey),)
+
     def get_sample_id(self, case, swid):
         """
         (str, str) -> str, str
@@ -1312,7 +1919,7 @@ class WTLaneLevelTable(SeqTable):
         - swid (str): the swid of the sample being queried
     
         """
-        lims_lane_mapping = Table.data[case]["WT"]["Tumour"]
+        lims_lane_mapping = self.run.data[case]["WT"]["Tumour"]
         for id, value in lims_lane_mapping.items():
             if swid in value.keys():
                 return id, value[swid]["run"]
@@ -1330,51 +1937,65 @@ class WTLaneLevelTable(SeqTable):
         Note: get_data needs to check two tables: dnaseqqc and bamqc4.
         If data is not found in dnaseqqc, then query bamqc4
         """
-        con = sqlite3.connect(self.base_db_path+ self.source_db + "/latest")
-        cur = con.cursor()
-
-        select_block, indices = self.get_select()
+        columns, indices = self.get_select()
         data = []
 
-        for case in Table.cases:
+        lanes = {}
+        for case in self.run.cases:
+            lims_keys = []
+            for key in self.run.data[case]["WT"]["Tumour"].keys():
+                lims_keys = lims_keys + list(
+                    self.run.data[case]["WT"]["Tumour"][key].keys()
+                )
+            lanes[case] = lims_keys
+        rows = self.run.source.get_rows(
+            self.source_db,
+            self.source_table[0],
+            "Pinery Lims ID",
+            [lims for lims_keys in lanes.values() for lims in lims_keys],
+            columns
+        )
+        lane_rows = {}  # Dict[case, list of (row of each lane, row from the source)], to roll lanes up
+
+        for case in self.run.cases:
             context = {
                 case: []
             }
+            lane_rows[case] = []
             for stype in self.sample_types.keys():
-                lims_keys = []
-                for key in Table.data[case]["WT"]["Tumour"].keys():
-                    lims_keys = lims_keys + list(
-                        Table.data[case]["WT"]["Tumour"][key].keys()
-                    )
-
-                for lims in lims_keys:
-                    rows = cur.execute(
-                        f"""
-                        select {select_block} from {self.source_table[0]} where "Pinery Lims ID" = '{lims}';
-                        """).fetchall()
-                    if len(rows) > 1:
+                for lims in lanes[case]:
+                    lims_rows = rows.get(lims, [])
+                    if len(lims_rows) > 1:
                         raise Exception(f"Multiple rows returned for limkeys {lims}")
                     
                     try:
                         entry = {}
                         entry[WTLaneLevelTableColumns.Case] = case
+                        entry[WTLaneLevelTableColumns.LimsKey] = lims
                         (entry[WTLaneLevelTableColumns.SampleID],
                         entry[WTLaneLevelTableColumns.Lane]
                         ) = self.get_sample_id(case, lims)
                         context[case].append(
                             self.get_row_data(
-                            indices, rows[0], WTLaneLevelTableColumns, entry, stype
+                            indices, lims_rows[0], WTLaneLevelTableColumns, entry, stype,
+                            plot=not self.run.lane_rollup
                             )
                         )
                     except:
                         entry = self.get_nd_entry(indices, case, self.source_table[0])
                         entry[WTLaneLevelTableColumns.Case] = case
+                        entry[WTLaneLevelTableColumns.LimsKey] = lims
                         (
                             entry[WTLaneLevelTableColumns.SampleID],
                             entry[WTLaneLevelTableColumns.Lane]
                         ) = self.get_sample_id(case, lims)
                         context[case].append(entry)
+                    lane_rows[case].append((context[case][-1], lims_rows[0] if lims_rows else None))
             data.append(context)
-        cur.close()
-        con.close()
+        if self.run.lane_rollup:
+            self.lanes = data
+            data = [
+                {case: self.rollup_lanes(lane_rows[case], indices, WTLaneLevelTableColumns)}
+                for context in self.lanes for case in context
+            ]
         return data
@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import pytest
+from backends import ParquetSource, SQLiteMartSource, SQLiteSource
+from mart import build_mart, export_parquet
+from query_log import QueryLog
+from run_context import RunContext
+from tables import SAMPLE_ID_COLUMNS, Mutect2Table
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+KEYS = ["1001", "1002", "1003", "1005"]
+
+
+@pytest.fixture
+def qcetl(tmp_path):
+    """
+    Writes the QC-ETL databases of fixtures/qcetl.json under tmp_path, as {db}/latest
+    """
+    with open(os.path.join(FIXTURES, "qcetl.json")) as f:
+        databases = json.load(f)
+    for db, tables in databases.items():
+        os.makedirs(tmp_path / db)
+        con = sqlite3.connect(str(tmp_path / db / "latest"))
+        for table, rows in tables.items():
+            columns = list(rows[0])
+            names = ", ".join(f'"{column}"' for column in columns)
+            con.execute(f"create table {table} ({names});")
+            con.executemany(
+                f'insert into {table} values ({", ".join(["?"] * len(columns))});',
+                [tuple(row[column] for column in columns) for row in rows]
+            )
+        con.commit()
+        con.close()
+    return str(tmp_path) + "/"
+
+
+def get_table():
+    run = RunContext({"project": "", "release": "", "cases": {}}, source=SQLiteSource(""))
+    return Mutect2Table(run)
+
+
+def get_rows(source, table):
+    columns, _ = table.get_select()
+    return source.get_rows(
+        table.source_db,
+        table.source_table[0],
+        "Workflow Run SWID",
+        KEYS,
+        {**SAMPLE_ID_COLUMNS, **columns}
+    )
+
+
+def test_sources_read_the_same_rows(qcetl, tmp_path):
+    table = get_table()
+    qcetl_source = SQLiteSource(qcetl)
+    qcetl_rows = get_rows(qcetl_source, table)
+    qcetl_source.close()
+    # keys stored with whitespace around them in QC-ETL are not matched there
+    assert sorted(qcetl_rows) == ["1001"]
+
+    # the mart strips them once when it is built, and returns the rows of QC-ETL for the other keys
+    mart = str(tmp_path / "mart.db")
+    build_mart([table], qcetl, mart, 500)
+    mart_source = SQLiteMartSource(mart)
+    mart_rows = get_rows(mart_source, table)
+    mart_source.close()
+    assert sorted(mart_rows) == ["1001", "1002", "1003"]
+    assert mart_rows["1001"] == qcetl_rows["1001"]
+
+    pytest.importorskip("pyarrow")
+    export = str(tmp_path / "mart")
+    export_parquet(mart, export)
+    assert get_rows(ParquetSource(export), table) == mart_rows
+
+
+def test_keys_are_looked_up_through_the_index(qcetl):
+    con = sqlite3.connect(qcetl + "analysis_mutect2/latest")
+    con.execute('create index swid on analysis_mutect2_analysis_mutect2_1 ("Workflow Run SWID");')
+    con.commit()
+    con.close()
+
+    query_log = QueryLog(slow_ms=0)
+    source = SQLiteSource(qcetl, query_log=query_log)
+    rows = source.get_rows(
+        "analysis_mutect2",
+        "analysis_mutect2_analysis_mutect2_1",
+        "Workflow Run SWID",
+        [" 1001", "1004 "],
+        {"num_calls": None}
+    )
+    source.close()
+    # keys are stripped before they are bound, and matched against the bare, indexed column
+    assert rows == {"1001": [(120,)], "1004": [(10,)]}
+    assert query_log.records[0]["keys"] == ["1001", "1004"]
+    assert query_log.records[0]["full_scans"] == []
+    assert any("USING INDEX swid" in detail for detail in query_log.records[0]["plan"])
+
+
+def test_parquet_export_has_an_explicit_schema(tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    mart = str(tmp_path / "mart.db")
+    con = sqlite3.connect(mart)
+    con.execute('create table runs ("Workflow Run SWID", num_calls INT, titv_ratio REAL, mixed, empty);')
+    con.executemany(
+        "insert into runs values (?, ?, ?, ?, ?);",
+        [("1001", 10, None, 1, None), ("1002", 2.5, None, "nd", None)]
+    )
+    con.execute("create table no_rows (num_calls INT, titv_ratio REAL, metric);")
+    con.commit()
+    con.close()
+
+    export = str(tmp_path / "mart")
+    export_parquet(mart, export)
+    runs = pyarrow.parquet.read_table(os.path.join(export, "runs.parquet"))
+    # declared types are kept, and columns holding values of several types fall back to text
+    assert [str(field.type) for field in runs.schema] == ["string", "double", "double", "string", "string"]
+    assert runs.column("num_calls").to_pylist() == [10.0, 2.5]
+    assert runs.column("mixed").to_pylist() == ["1", "nd"]
+    no_rows = pyarrow.parquet.read_table(os.path.join(export, "no_rows.parquet"))
+    assert [str(field.type) for field in no_rows.schema] == ["int64", "double", "string"]
+    assert no_rows.num_rows == 0
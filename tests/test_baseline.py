@@ -0,0 +1,50 @@
+import numpy
+import pytest
+from baseline import BaselineStore, QuantileSketch
+from cohort_stats import COHORT, CohortStats
+
+
+class Table:
+    pass
+
+
+def test_quantiles_after_merging_two_sketches():
+    first = QuantileSketch()
+    first.add(numpy.arange(0, 500))
+    second = QuantileSketch()
+    second.add(numpy.arange(500, 1001))
+    first.merge(second)
+    assert first.get_count() == 1001
+    assert (first.min, first.max) == (0, 1000)
+    for q in [0.05, 0.5, 0.95]:
+        assert first.get_quantile(q) == pytest.approx(1000 * q, abs=5)
+
+
+def test_sketch_round_trip():
+    sketch = QuantileSketch()
+    sketch.add([3, 1, 2, numpy.nan])
+    copy = QuantileSketch.from_dict(sketch.to_dict())
+    assert copy.get_count() == 3
+    assert copy.get_quantile(0.5) == sketch.get_quantile(0.5)
+
+
+def test_release_is_committed_once(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    table = Table()
+    stats = CohortStats([{"value": value} for value in range(10)], ["value"], lambda row: COHORT)
+
+    store = BaselineStore(path)
+    store.stage(table, stats)
+    store.commit("PROJ", "R1")
+
+    store = BaselineStore(path)
+    assert store.releases == ["PROJ/R1"]
+    assert store.sketches["Table.value"][COHORT].get_count() == 10
+    # a re-issued report of the same release is not added again
+    store.stage(table, stats)
+    store.commit("PROJ", "R1")
+
+    store = BaselineStore(path)
+    assert store.releases == ["PROJ/R1"]
+    assert store.sketches["Table.value"][COHORT].get_count() == 10
+    assert store.get_history(table, "value")[COHORT][0.5] == pytest.approx(4.5, abs=0.5)
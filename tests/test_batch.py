@@ -0,0 +1,67 @@
+from backends import FixtureSource, RecordingSource, SharedSource
+from run_context import RunContext
+from tables import DellyTable, Mutect2Table
+
+METADATA = {"Tissue Type": "P", "Tissue Origin": "Pa", "Library Design": "WG", "Group ID": "G"}
+FIXTURE = {
+    "analysis_mutect2_analysis_mutect2_1": [
+        {"Workflow Run SWID": str(wfr), **METADATA, "num_calls": wfr, "num_PASS": wfr // 2,
+         "num_SNPs": 3, "num_indels": 1, "titv_ratio": 2.0}
+        for wfr in [100, 200, 300]
+    ],
+    "analysis_delly_analysis_delly_1": [
+        {"Workflow Run SWID": str(wfr), **METADATA, "num_calls": wfr, "num_PASS": 5, "num_BND": 1,
+         "num_DEL": 2, "num_DUP": 0, "num_INS": 1, "num_INV": 1}
+        for wfr in [101, 201, 301]
+    ],
+}
+
+
+class CountingSource(FixtureSource):
+    def __init__(self, tables):
+        super().__init__(tables)
+        self.calls = 0
+
+    def get_rows(self, *args, **kwargs):
+        self.calls += 1
+        return super().get_rows(*args, **kwargs)
+
+
+def get_input(release, cases):
+    return {
+        "project": "PROJ",
+        "release": release,
+        "cases": {
+            case: {
+                "analysis": {
+                    "calls.mutations": {str(wfr): {"wf": "mutect2", "limkeys": []}},
+                    "calls.structuralvariants": {str(wfr + 1): {"wf": "delly", "limkeys": []}},
+                },
+            }
+            for case, wfr in cases.items()
+        },
+    }
+
+
+def get_data(input_data, source):
+    run = RunContext(input_data, source=source)
+    return [table.get_data() for table in [Mutect2Table(run), DellyTable(run)]]
+
+
+def test_batch_rows_equal_separate_runs():
+    inputs = [
+        get_input("R1", {"PROJ_0001": 100, "PROJ_0002": 200}),
+        get_input("R2", {"PROJ_0002": 200, "PROJ_0003": 300}),
+    ]
+    separate = [get_data(input_data, FixtureSource(FIXTURE)) for input_data in inputs]
+
+    source = CountingSource(FIXTURE)
+    recording = RecordingSource(source)
+    for input_data in inputs:
+        get_data(input_data, recording)
+    shared = SharedSource(source, recording.fetch())
+    # each table is fetched once, for the keys of every release
+    assert source.calls == 2
+    assert [get_data(input_data, shared) for input_data in inputs] == separate
+    assert source.calls == 2
+    assert separate[1][0][0]["PROJ_0002"][0]["num_calls"] == 200
@@ -0,0 +1,37 @@
+import pytest
+from cohort_stats import COHORT, CohortStats
+
+
+def test_summary_of_each_group():
+    rows = [
+        {"type": "Normal", "value": 1},
+        {"type": "Normal", "value": 3},
+        {"type": "Tumour", "value": 10},
+        {"type": "Tumour", "value": "nd"},
+    ]
+    stats = CohortStats(rows, ["value"], lambda row: row["type"])
+    assert stats.groups == ["Normal", "Tumour"]
+    normal = stats.get_column("value")["Normal"]
+    assert normal["n"] == 2
+    assert normal["median"] == 2
+    assert (normal["min"], normal["max"]) == (1, 3)
+    # values that are not numbers are left out
+    assert stats.get_column("value")["Tumour"]["n"] == 1
+
+
+def test_mad_outlier_flags():
+    values = [10, 11, 9, 10, 12, 8, 10, 100]
+    rows = [{"value": value} for value in values]
+    stats = CohortStats(rows, ["value"], lambda row: COHORT)
+    summary = stats.get_column("value")[COHORT]
+    assert summary["median"] == 10
+    assert summary["mad"] == pytest.approx(1)
+    # only the row far from the median, in MADs, is an outlier
+    assert stats.outliers["value"] == [7]
+
+
+def test_no_outliers_without_spread():
+    rows = [{"value": 5}] * 4 + [{"value": 6}]
+    stats = CohortStats(rows, ["value"], lambda row: COHORT)
+    assert stats.get_column("value")[COHORT]["mad"] == 0
+    assert stats.outliers["value"] == []
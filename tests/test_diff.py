@@ -0,0 +1,86 @@
+import pytest
+from context_cache import ContextCache
+from diff import diff_releases, diff_table, get_delta
+
+
+class Table:
+    title = "Table"
+    headings = {"case": "Case", "sample_id": "Sample ID", "value": "Value", "note": "Note"}
+
+    def get_row_key(self, row):
+        return (row.get("case"), row.get("sample_id"))
+
+
+class Section:
+    name = "section"
+    title = "Section"
+    tables = [Table()]
+
+
+def get_row(case, value, note=""):
+    return {"case": case, "sample_id": f"{case}_S", "value": value, "note": note}
+
+
+def test_delta():
+    assert get_delta(1, 1.5) == 0.5
+    assert get_delta("nd", 2) == ""
+    assert get_delta(True, False) == ""
+
+
+def test_added_removed_and_changed_rows():
+    old = {"A": [get_row("A", 1)], "B": [get_row("B", 2, "x")]}
+    new = {"B": [get_row("B", 3, "y")], "C": [get_row("C", 4)]}
+    diff = diff_table(Table(), old, new)
+    assert diff["added"] == ["C / C_S"]
+    assert diff["removed"] == ["A / A_S"]
+    assert diff["changed"] == [
+        {"row": "B / B_S", "column": "Value", "old": 2, "new": 3, "delta": 1},
+        {"row": "B / B_S", "column": "Note", "old": "x", "new": "y", "delta": ""},
+    ]
+
+
+def test_unchanged_rows():
+    rows = {"A": [get_row("A", 1)]}
+    assert diff_table(Table(), rows, rows) == {"title": "Table", "added": [], "removed": [], "changed": []}
+
+
+def test_keys_with_unset_parts():
+    old = {"A": [{"case": "A", "sample_id": None, "value": 1}]}
+    new = {"A": [{"case": "A", "sample_id": "A_S", "value": 1}]}
+    diff = diff_table(Table(), old, new)
+    assert diff["added"] == ["A / A_S"]
+    assert diff["removed"] == ["A / "]
+
+
+def test_rows_sharing_a_key_raise():
+    rows = {"A": [get_row("A", 1), get_row("A", 2)]}
+    with pytest.raises(Exception, match="share the key A / A_S"):
+        diff_table(Table(), rows, {})
+
+
+def test_added_and_removed_cases():
+    old = {"project": "P", "release": "R1", "rows": {"section": {"Table": {"A": [get_row("A", 1)]}}}}
+    new = {"project": "P", "release": "R2", "rows": {"section": {"Table": {"B": [get_row("B", 1)]}}}}
+    context = diff_releases([Section()], old, new)
+    assert context["cases"] == {"added": ["B"], "removed": ["A"]}
+    assert context["sections"]["section"]["tables"][0]["added"] == ["B / B_S"]
+
+
+def test_tables_are_matched_by_class_name():
+    old = {"project": "P", "release": "R1", "rows": {"section": {"OtherTable": {}}}}
+    new = {"project": "P", "release": "R2", "rows": {"section": {"Table": {}}}}
+    with pytest.raises(Exception, match="Release R1 of P has no rows for Table"):
+        diff_releases([Section()], old, new)
+
+
+def test_context_cache(tmp_path):
+    case_input = {"A": {"analysis": {}}}
+    rows = {"section": {"Table": [get_row("A", 1)]}}
+    cache = ContextCache(str(tmp_path), {"gamma": 500}, [("db", 1.0)])
+    assert cache.load(case_input) is None
+    cache.save(case_input, rows)
+    assert cache.load(case_input) == rows
+    # rows are cached for the input of the case, the settings and the QC-ETL refresh
+    assert cache.load({"A": {"analysis": {"step": {}}}}) is None
+    assert ContextCache(str(tmp_path), {"gamma": 100}, [("db", 1.0)]).load(case_input) is None
+    assert ContextCache(str(tmp_path), {"gamma": 500}, [("db", 2.0)]).load(case_input) is None
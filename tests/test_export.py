@@ -0,0 +1,38 @@
+import csv
+import os
+import pytest
+from export import TableExport
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.parquet
+
+
+class Section:
+    name = "section"
+
+
+class Table:
+    title = "Table"
+    headings = {"case": "Case", "count": "Count", "ratio": "Ratio", "mixed": "Mixed"}
+    pct_stats = set()
+
+
+def test_write_table_with_mixed_column(tmp_path):
+    export = TableExport(str(tmp_path))
+    data = [
+        {"A": [{"case": "A", "count": 1, "ratio": 0.5, "mixed": 1}]},
+        {"B": [{"case": "B", "count": 2, "ratio": 1, "mixed": "12;3"}]},
+        {"C": [{"case": "C", "count": "nd", "ratio": "nd", "mixed": "nd"}]},
+    ]
+    export.write_table(Section(), Table(), data)
+
+    table = pyarrow.parquet.read_table(os.path.join(str(tmp_path), "section.Table.parquet"))
+    assert table.schema.field("count").type == pyarrow.int64()
+    assert table.schema.field("ratio").type == pyarrow.float64()
+    assert table.schema.field("mixed").type == pyarrow.string()
+    assert table.column("mixed").to_pylist() == ["1", "12;3", None]
+
+    with open(os.path.join(str(tmp_path), "section.Table.csv"), newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["case", "count", "ratio", "mixed", "outliers"]
+    assert rows[1:] == [["A", "1", "0.5", "1", ""], ["B", "2", "1", "12;3", ""], ["C", "", "", "", ""]]
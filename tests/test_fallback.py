@@ -0,0 +1,93 @@
+import gzip
+import os
+import shutil
+import pytest
+from fallback import count_delly_calls, count_mutect2_calls, summarize_rsem_genes
+from run_context import RunContext
+from tables import Mutect2Table
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def get_fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+def test_count_mutect2_calls():
+    assert count_mutect2_calls(get_fixture("mutect2.vcf")) == {
+        "num_calls": 8,
+        "num_PASS": 7,
+        "num_SNPs": 4,
+        "num_indels": 2,
+        "titv_ratio": 3.0,
+    }
+
+
+def test_count_mutect2_calls_without_transversions():
+    values = count_mutect2_calls(get_fixture("mutect2_transitions.vcf"))
+    assert values["num_SNPs"] == 2
+    assert values["titv_ratio"] is None
+
+
+def test_count_mutect2_calls_gzipped(tmp_path):
+    path = str(tmp_path / "mutect2.vcf.gz")
+    with open(get_fixture("mutect2.vcf"), "rb") as f, gzip.open(path, "wb") as out:
+        shutil.copyfileobj(f, out)
+    assert count_mutect2_calls(path) == count_mutect2_calls(get_fixture("mutect2.vcf"))
+
+
+def test_count_delly_calls():
+    assert count_delly_calls(get_fixture("delly.vcf")) == {
+        "num_calls": 6,
+        "num_PASS": 5,
+        "num_BND": 1,
+        "num_DEL": 2,
+        "num_DUP": 1,
+        "num_INS": 1,
+        "num_INV": 0,
+    }
+
+
+def test_summarize_rsem_genes():
+    values = summarize_rsem_genes(get_fixture("sample.genes.results"))
+    assert values["total"] == 11
+    assert values["pct_non_zero"] == pytest.approx(10 / 11)
+    # the TPM of the genes are 0 to 10, so each quantile is 10 times q
+    for q in [0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95]:
+        assert values[f"Q{q}"] == pytest.approx(10 * q)
+
+
+class NoRows:
+    def get_rows(self, db, table, key_column, keys, columns):
+        return {}
+
+
+class VCFFallback:
+    def __init__(self, path):
+        self.path = path
+
+    def get_values(self, engine, wfrs):
+        return {wfr: count_mutect2_calls(self.path) for wfr in wfrs}
+
+
+def test_fallback_row_without_titv_ratio():
+    input_data = {
+        "project": "PROJ",
+        "release": "1",
+        "cases": {
+            "PROJ_0001": {
+                "WG": {"Tumour": {"PROJ_0001_Pa_P_WG": {}}},
+                "analysis": {"calls.mutations": {"123": {"wf": "mutect2"}}},
+            },
+        },
+    }
+    run = RunContext(
+        input_data,
+        source=NoRows(),
+        fallback=VCFFallback(get_fixture("mutect2_transitions.vcf"))
+    )
+    row = Mutect2Table(run).get_data()[0]["PROJ_0001"][0]
+    assert row["sample_id"] == "PROJ_0001_Pa_P_WG"
+    assert row["num_calls"] == 3
+    assert row["num_PASS"] == 2
+    assert row["titv_ratio"] == "nd"
@@ -0,0 +1,70 @@
+from backends import FixtureSource, RecordingSource, SharedSource
+from run_context import RunContext
+from table_columns import WGLaneLevelTableColumns
+from tables import WGLaneLevelTable
+
+
+def get_lane(lims, coverage):
+    return {
+        "Pinery Lims ID": lims,
+        "coverage_dedup": coverage,
+        "insert_size_avg": 300,
+        "mark_dup_pct_dup": 0.1,
+        "total_clusters": 1000,
+        "mapped_reads": 0.99,
+    }
+
+
+FIXTURE = {
+    "dnaseqqc_dnaseqqc_5": [
+        get_lane("1_LANE_A", 10),
+        # stored as part of a longer value, which the LIKE lookup of the lanes used to find
+        get_lane("RUN1_2_LANE_B", 20),
+        get_lane("4_LANE_D_OLD", 41),
+    ],
+    "bamqc4_bamqc4_5": [
+        get_lane("3_lane_c_x", 30),
+        get_lane("4_LANE_D", 40),
+    ],
+}
+
+INPUT = {
+    "project": "PROJ",
+    "release": "R1",
+    "cases": {
+        "PROJ_0001": {
+            "WG": {
+                "Normal": {"PROJ_0001_N": {"1_LANE_A": {"run": "RUN1"}, "2_LANE_B": {"run": "RUN1"}}},
+                "Tumour": {"PROJ_0001_T": {"3_LANE_C": {"run": "RUN2"}, "4_LANE_D": {"run": "RUN2"}}},
+            },
+        },
+    },
+}
+
+
+def get_lanes(source):
+    data = WGLaneLevelTable(RunContext(INPUT, source=source)).get_data()
+    return {
+        entry[WGLaneLevelTableColumns.LimsKey]: (
+            entry[WGLaneLevelTableColumns.Source],
+            entry[WGLaneLevelTableColumns.CoverageDedup],
+        )
+        for context in data for entries in context.values() for entry in entries
+    }
+
+
+def test_lanes_found_as_part_of_a_longer_key():
+    assert get_lanes(FixtureSource(FIXTURE)) == {
+        "1_LANE_A": ("dnaseqqc_dnaseqqc_5", 10),
+        "2_LANE_B": ("dnaseqqc_dnaseqqc_5", 20),
+        "3_LANE_C": ("bamqc4_bamqc4_5", 30),
+        # an exact match in bamqc4 is kept over a longer key in dnaseqqc
+        "4_LANE_D": ("bamqc4_bamqc4_5", 40),
+    }
+
+
+def test_batch_lanes_found_as_part_of_a_longer_key():
+    source = FixtureSource(FIXTURE)
+    recording = RecordingSource(source)
+    get_lanes(recording)
+    assert get_lanes(SharedSource(source, recording.fetch())) == get_lanes(source)
@@ -0,0 +1,59 @@
+import threading
+import lims_index
+from lims_index import LimsSetIndex, get_lims_set_hash, get_lims_set_index, parse_lims_keys
+
+
+def test_parse_lims_keys():
+    assert parse_lims_keys('["a", "b"]') == ["a", "b"]
+    # values that are not json are split on their quotes, commas and whitespace
+    assert parse_lims_keys("['a' , 'b']") == ["a", "b"]
+    assert parse_lims_keys("[a,b]") == ["a", "b"]
+
+
+def test_lims_set_hash_ignores_order_and_duplicates():
+    assert get_lims_set_hash(["b", "a", "a"]) == get_lims_set_hash(["a", " b"])
+    assert get_lims_set_hash(["a"]) != get_lims_set_hash(["a", "b"])
+
+
+def test_lookup_of_merged_key_set():
+    values = ['["a", "b"]', "['b','a']", '["a", "b", "c"]', '["c"]']
+    index = LimsSetIndex(values)
+    assert index.lookup(["b", "a"]) == ['["a", "b"]', "['b','a']"]
+    assert index.lookup(["c", "a", "b"]) == ['["a", "b", "c"]']
+    assert index.lookup(["a"]) == []
+
+
+def test_index_is_built_once_per_snapshot():
+    loads = []
+
+    def load_values():
+        loads.append(1)
+        return ['["a", "b"]']
+
+    index = get_lims_set_index("db", ("test.db", 1.0), "table", "column", load_values)
+    assert get_lims_set_index("db", ("test.db", 1.0), "table", "column", load_values) is index
+    assert len(loads) == 1
+    # a new snapshot replaces the index of the previous one
+    assert get_lims_set_index("db", ("test.db", 2.0), "table", "column", load_values) is not index
+    assert len(loads) == 2
+    assert [key for key in lims_index._indexes if key[0] == "db"] == [("db", "table", "column")]
+
+
+def test_index_is_built_once_by_concurrent_reports():
+    loads = []
+    started = threading.Barrier(8)
+
+    def load_values():
+        loads.append(1)
+        return ['["a"]']
+
+    def lookup():
+        started.wait()
+        get_lims_set_index("concurrent", ("test.db", 1.0), "table", "column", load_values)
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
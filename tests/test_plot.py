@@ -0,0 +1,49 @@
+from plot import Plot, SeqPlot
+
+CASES = ["C0", "C1", "C2", "C3", "C4"]
+
+
+def add_points(plot, cases):
+    for case in cases:
+        plot.add_data(CASES.index(case), f"{case}_a", case)
+        plot.add_data(CASES.index(case) + 0.5, f"{case}_b", case)
+
+
+def test_merged_series_match_a_single_plot():
+    whole = Plot("title", "x", "y")
+    add_points(whole, CASES)
+
+    # shards hold every other case, as with --shard
+    shards = []
+    for index in range(2):
+        shard = Plot("title", "x", "y")
+        add_points(shard, CASES[index::2])
+        shards.append(shard.get_series())
+    merged = Plot("title", "x", "y")
+    merged.merge_series(shards)
+
+    assert merged.get_series() == whole.get_series()
+    assert merged.data.labels.names == whole.data.labels.names
+
+
+def test_merged_sample_types_match_a_single_plot():
+    def add_seq_points(plot, cases):
+        for case in cases:
+            if case != "C0":
+                plot.add_data("Tumour", 2, case, case)
+            plot.add_data("Normal", 1, case, case)
+
+    whole = SeqPlot("title", "x", "y")
+    add_seq_points(whole, CASES)
+
+    shards = []
+    for index in range(3):
+        shard = SeqPlot("title", "x", "y")
+        add_seq_points(shard, CASES[index::3])
+        shards.append(shard.get_series())
+    merged = SeqPlot("title", "x", "y")
+    merged.merge_series(shards)
+
+    assert merged.get_series() == whole.get_series()
+    assert list(merged.data) == ["Normal", "Tumour"]
+    assert merged.labels.names == CASES
@@ -0,0 +1,37 @@
+import os
+import pytest
+from backends import FixtureSource
+from export import TableExport
+from run_context import RunContext
+
+
+class ClosingSource(FixtureSource):
+    def __init__(self):
+        super().__init__({})
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def get_run(tmp_path):
+    return RunContext(
+        {"project": "", "release": "", "cases": {}},
+        source=ClosingSource(),
+        export=TableExport(str(tmp_path), ["csv"]),
+    )
+
+
+def test_run_is_closed_at_the_end_of_a_with_block(tmp_path):
+    with get_run(tmp_path) as run:
+        pass
+    assert run.source.closed
+    assert os.path.exists(tmp_path / "schema.json")
+
+
+def test_failed_run_is_closed_without_completing_the_export(tmp_path):
+    with pytest.raises(Exception, match="failed"):
+        with get_run(tmp_path) as run:
+            raise Exception("failed")
+    assert run.source.closed
+    assert not os.path.exists(tmp_path / "schema.json")
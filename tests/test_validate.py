@@ -0,0 +1,66 @@
+import pytest
+from run_context import RunContext
+from tables import CasesTable, Mutect2Table, WGLaneLevelTable
+from validate import check_inputs, compile_schema, get_problems
+
+
+def get_schema():
+    run = RunContext({"project": "", "release": "", "cases": {}})
+    return compile_schema([CasesTable(run), Mutect2Table(run), WGLaneLevelTable(run)])
+
+
+def get_case(case, lims_prefix):
+    return {
+        "external_id": f"EXT_{case}",
+        "WG": {
+            "Normal": {f"{case}_Pa_R_WG": {f"{lims_prefix}-N": {"run": "RUN1"}}},
+            "Tumour": {f"{case}_Pa_P_WG": {f"{lims_prefix}-T": {"run": "RUN1"}}},
+        },
+        "WT": {
+            "Tumour": {f"{case}_Pa_P_WT": {f"{lims_prefix}-WT": {"run": "RUN1"}}},
+        },
+        "analysis": {
+            "calls.mutations": {"100": {"wf": "mutect2", "limkeys": [f"{lims_prefix}-T"]}},
+        },
+    }
+
+
+def get_input():
+    return {
+        "project": "PROJ",
+        "release": "R1",
+        "cases": {"PROJ_0001": get_case("PROJ_0001", "1"), "PROJ_0002": get_case("PROJ_0002", "2")},
+    }
+
+
+def test_schema_of_the_tables():
+    schema = get_schema()
+    assert schema["cases"]
+    assert ("WG", "Normal") in schema["samples"]
+    assert list(schema["steps"]) == ["calls.mutations"]
+
+
+def test_valid_input():
+    assert get_problems(get_input(), get_schema()) == []
+
+
+def test_every_problem_is_listed_at_once():
+    input_data = get_input()
+    del input_data["release"]
+    first = input_data["cases"]["PROJ_0001"]
+    del first["external_id"]
+    first["WG"]["Tumour"] = {"PROJ_0001_Zz_P_WG": {"1-T": {}}}
+    second = input_data["cases"]["PROJ_0002"]
+    second["WG"]["Normal"]["PROJ_0002_Pa_R_WG"]["1-N"] = {"run": "RUN1"}
+    second["analysis"]["calls.mutations"] = {"100": {"wf": "kallisto", "limkeys": []}}
+
+    assert get_problems(input_data, get_schema()) == [
+        "input json has no release",
+        "PROJ_0001: no external_id, read by CasesTable",
+        "PROJ_0001: sample ID PROJ_0001_Zz_P_WG has unknown tissue_origin code Zz",
+        "PROJ_0001: lims key 1-T of PROJ_0001_Zz_P_WG has no run",
+        "PROJ_0002: no mutect2_matched_by_tumor_group or mutect2 workflow run of calls.mutations, read by Mutect2Table",
+        "lims key 1-N is found in more than one sample: PROJ_0001 PROJ_0001_Pa_R_WG, PROJ_0002 PROJ_0002_Pa_R_WG",
+    ]
+    with pytest.raises(Exception, match="Found 6 problems in the input"):
+        check_inputs({"input.json": input_data}, get_schema())
@@ -0,0 +1,162 @@
+"""
+Checks of the input json, run before any database is opened.
+The tables selected for a report are compiled into a schema of what they read from the input:
+the samples of each case by library design and sample type, and the workflows of each pipeline
+step. The input is then checked against the schema in one pass, along with the keys every input
+has, the uniqueness of lims keys and the codes of the sample IDs, and every problem found is
+reported at once instead of failing on the first one while the report is being generated.
+"""
+from typing import Any, Dict, List
+from tables import CasesTable, get_sample_codes
+
+LIBRARIES = ["WG", "WT"]    # library designs of the samples of a case in the input json
+SAMPLE_ID_CODES = {         # part of a sample ID split on _ holding each code of the sample codes
+    2: "tissue_origin",
+    3: "tissue_type",
+    4: "library_design",
+}
+
+
+def compile_schema(tables: List[Any]) -> Dict[str, Any]:
+    """
+    (list[Table]) -> dict
+
+    Returns what the tables read from the input json: the tables reading the samples of each
+    (library design, sample type), the workflows of each pipeline step read by each table,
+    and whether the external IDs and sample codes of the Cases table are needed
+
+    Parameters
+    -----------
+    - tables (list[Table]): the tables selected for the report
+
+    """
+    schema = {"samples": {}, "steps": {}, "cases": False}
+    for table in tables:
+        name = type(table).__name__
+        for sample in table.samples:
+            schema["samples"].setdefault(sample, []).append(name)
+        if table.reads_analysis:
+            schema["steps"].setdefault(table.pipeline_step, []).append((name, table.process))
+        if isinstance(table, CasesTable):
+            schema["cases"] = True
+    return schema
+
+
+def get_case_problems(case: str, case_input: Any, schema: Dict[str, Any], lims_keys: Dict[str, List[str]]) -> List[str]:
+    """
+    (str, dict, dict, dict) -> list[str]
+
+    Returns the problems of the input of one case. The lims keys of its samples are added
+    to lims_keys, to check they are unique over the input
+
+    Parameters
+    -----------
+    - case (str): the case
+    - case_input (dict): the input of the case in the input json
+    - schema (dict): what the tables of the report read, from compile_schema
+    - lims_keys (dict): maps each lims key to the samples it was found in
+
+    """
+    if not isinstance(case_input, dict):
+        return [f"{case}: input of the case is not an object"]
+    problems = []
+    if schema["cases"] and "external_id" not in case_input:
+        problems.append(f"{case}: no external_id, read by CasesTable")
+
+    libraries = {
+        library: case_input[library] for library in LIBRARIES if isinstance(case_input.get(library), dict)
+    }
+    for (library, stype), names in schema["samples"].items():
+        if not isinstance(libraries.get(library, {}).get(stype), dict):
+            problems.append(f"{case}: no {library} {stype} samples, read by {', '.join(names)}")
+
+    codes = get_sample_codes() if schema["cases"] else None
+    for library, library_input in libraries.items():
+        for stype, samples in library_input.items():
+            for sample_id, lanes in (samples if isinstance(samples, dict) else {}).items():
+                if codes:
+                    parts = sample_id.split("_")
+                    if len(parts) < 5:
+                        problems.append(f"{case}: sample ID {sample_id} has less than 5 parts separated by _")
+                    else:
+                        for index, column in SAMPLE_ID_CODES.items():
+                            if parts[index] not in codes[column]:
+                                problems.append(f"{case}: sample ID {sample_id} has unknown {column} code {parts[index]}")
+                if not isinstance(lanes, dict) or not lanes:
+                    problems.append(f"{case}: {library} {stype} sample {sample_id} has no lims keys")
+                    continue
+                for lims, lane in lanes.items():
+                    if not isinstance(lane, dict) or "run" not in lane:
+                        problems.append(f"{case}: lims key {lims} of {sample_id} has no run")
+                    lims_keys.setdefault(lims, []).append(f"{case} {sample_id}")
+
+    analysis = case_input.get("analysis")
+    if not isinstance(analysis, dict):
+        if schema["steps"]:
+            problems.append(f"{case}: no analysis")
+        return problems
+    for step, runs in analysis.items():
+        for wfr, run_info in (runs if isinstance(runs, dict) else {}).items():
+            for key in ["wf", "limkeys"]:
+                if not isinstance(run_info, dict) or key not in run_info:
+                    problems.append(f"{case}: workflow run {wfr} of {step} has no {key}")
+    for step, tables in schema["steps"].items():
+        runs = analysis.get(step)
+        if not isinstance(runs, dict) or not runs:
+            problems.append(f"{case}: no workflow run of {step}, read by {', '.join(name for name, _ in tables)}")
+            continue
+        workflows = set(run_info.get("wf") for run_info in runs.values() if isinstance(run_info, dict))
+        for name, process in tables:
+            if not workflows.intersection(process):
+                problems.append(f"{case}: no {' or '.join(process)} workflow run of {step}, read by {name}")
+    return problems
+
+
+def get_problems(input_data: Any, schema: Dict[str, Any]) -> List[str]:
+    """
+    (dict, dict) -> list[str]
+
+    Returns every problem of the input json found for the tables of schema. An empty list
+    if the input is valid
+
+    Parameters
+    -----------
+    - input_data (dict): the input json
+    - schema (dict): what the tables of the report read, from compile_schema
+
+    """
+    if not isinstance(input_data, dict):
+        return ["input json is not an object"]
+    problems = [f"input json has no {key}" for key in ["project", "release"] if key not in input_data]
+    cases = input_data.get("cases")
+    if not isinstance(cases, dict):
+        return problems + ["input json has no cases"]
+
+    lims_keys = {}  # Dict[lims key, samples the lims key is found in]
+    for case in sorted(cases):
+        problems.extend(get_case_problems(case, cases[case], schema, lims_keys))
+    for lims, samples in lims_keys.items():
+        if len(samples) > 1:
+            problems.append(f"lims key {lims} is found in more than one sample: {', '.join(samples)}")
+    return problems
+
+
+def check_inputs(inputs: Dict[str, Any], schema: Dict[str, Any]) -> None:
+    """
+    (dict[str, dict], dict) -> None
+
+    Raises an exception listing the problems of every input json if any has problems
+
+    Parameters
+    -----------
+    - inputs (dict): maps the name of each input file to its input json
+    - schema (dict): what the tables of the report read, from compile_schema
+
+    """
+    problems = [
+        f"{name}: {problem}"
+        for name, input_data in inputs.items()
+        for problem in get_problems(input_data, schema)
+    ]
+    if problems:
+        raise Exception(f"Found {len(problems)} problems in the input:\n" + "\n".join(problems))